@@ -1,21 +1,56 @@
-import cv2
-import imutils
 from imutils.video import VideoStream
-import requests
 import time
-import json
 from mDev import mDEV 
+from urllib.parse import urlparse
+from remote_inference import RemoteClassifier
+from stream_client import StreamClassifier
+from pipeline import SignPipeline
+from sonar import SonarReader
+from sensor_service import SensorService
+from telemetry import TELEMETRY_PATH, TelemetryRecorder
+from control_scheduler import CONTROL_RATE_HZ, ControlScheduler, Manoeuvre, ManoeuvreRunner, Step
+
+PHOTO_TIMEOUT = 5.0  # Seconds the obstacle sequence waits for the photo to be classified
 
 class CameraClient:
-    def __init__(self, server_url, mdev_instance):
+    def __init__(self, server_url, mdev_instance, local_model_path=None, stream_port=None, telemetry_path=TELEMETRY_PATH):
         """
         Initializes the camera client.
         :param server_url: URL of the server to send photos to.
+        :param local_model_path: TFLite model to run on the car itself. The server is then only
+                                 used as a fallback when local inference fails.
+        :param stream_port: Streaming port of the server. Frames are then pushed over a persistent
+                            TCP connection instead of HTTP uploads.
+        :param telemetry_path: File where each control loop iteration is recorded (read it with
+                               telemetry_reader.py). None keeps the records in memory only.
         """
         self.server_url = server_url
+        if stream_port:
+            # Raw frames cropped and downscaled like the uploads when the server describes its model,
+            # otherwise JPEG full frames cropped by the server
+            negotiation = RemoteClassifier(server_url)
+            config = negotiation.fetch_config()
+            negotiation.close()
+            if config is not None:
+                self.remote = StreamClassifier(urlparse(server_url).hostname, stream_port,
+                                               raw_size=tuple(config["input_size"]), roi=tuple(config["roi"]))
+            else:
+                self.remote = StreamClassifier(urlparse(server_url).hostname, stream_port)
+        else:
+            self.remote = RemoteClassifier(server_url)
+        self.local = None
+        if local_model_path:
+            try:
+                from local_inference import LocalClassifier
+                self.local = LocalClassifier(local_model_path, confidence_threshold=0.6)  # Same default as the server
+                print(f"Local inference enabled with {local_model_path}")
+            except Exception as e:
+                print(f"Local inference unavailable, using the server: {e}")
         self.vs = VideoStream(src=0).start()  # Start the video stream
         time.sleep(2.0)  # Warm-up the camera
         self.mdev = mdev_instance
+        self.sensors = SensorService(SonarReader(mdev_instance)).start()  # Polls the ultrasonic sensor
+        self.telemetry = TelemetryRecorder(telemetry_path)
 
     def move(self, dir_left, dir_right, speed=500):
         """
@@ -27,103 +62,78 @@ class CameraClient:
         """
         print(f"Moving: Left DIR={dir_left}, Right DIR={dir_right}, Speed={speed}")
 
-        # Set motor directions
-        self.mdev.writeReg(self.mdev.CMD_DIR1, dir_left)
-        self.mdev.writeReg(self.mdev.CMD_DIR2, dir_right)
+        # Set motor directions and speeds in one batch, unchanged registers are not rewritten
+        self.mdev.writeRegs(((self.mdev.CMD_DIR1, dir_left), (self.mdev.CMD_DIR2, dir_right),
+                             (self.mdev.CMD_PWM1, speed), (self.mdev.CMD_PWM2, speed)))
 
-        # Set motor speeds
-        self.mdev.writeReg(self.mdev.CMD_PWM1, speed)
-        self.mdev.writeReg(self.mdev.CMD_PWM2, speed)
-
-    def get_distance(self):
+    def get_latest_distance(self):
         """
-        Measures distance using the ultrasonic sensor.
-        :return: Distance in centimeters
+        Latest distance of the sensor service without waiting, for loops paced by a ControlScheduler.
+        :return: Distance in centimeters, or None if there is no valid recent reading.
         """
-        try:
-            distance = self.mdev.getSonic()
-            return distance
-        except Exception as e:
-            print(f"Error reading ultrasonic sensor: {e}")
-            return float('inf')  # Return infinity if there's an error
+        return self.sensors.distance()
         
         
     def take_photo(self):
         """
-        Captures a photo from the video stream and sends it to the server.
+        Captures a photo from the video stream and classifies it, on the car when a local
+        model is loaded, otherwise (or if it fails) on the server.
         """
         print("Taking a photo...")
         frame = self.vs.read()  # Capture a frame from the camera
-        frame = imutils.resize(frame, width=500)  # Resize for consistent dimensions
+        return self.classify_frame(frame)
 
-        # Encode the frame as JPEG
-        _, encoded_image = cv2.imencode(".jpg", frame)
-        if encoded_image is None:
-            print("Error encoding the image.")
-            return None
-
-        # Generate a filename for the image
-        filename = "photo.jpg"  # You can make this dynamic if needed
-
-        # Send the photo to the server
-        try:
-            print("Sending photo to server...")
-            response = requests.post(
-                f"{self.server_url}/upload",
-                files={"file": (filename, encoded_image.tobytes(), 'image/jpeg')}  # Specify the filename and MIME type
-            )
-
-            if response.status_code == 200:
-                try:
-                    # Attempt to parse JSON response
-                    response_data = response.json()
-                    print(f"Parsed JSON response: {response_data}")
-                    return (f"{response_data}")  # Extract 'direction' key
-                except ValueError:
-                    # If response is not JSON, treat it as plain text
-                    print("Response is not JSON, treating as plain text.")
-                    return response.text.strip()  # Assume plain text and strip whitespace
-            else:
-                print(f"Error: Server returned status code {response.status_code}")
-                return None
-        except Exception as e:
-            print(f"Error sending photo: {e}")
-            return None
+    def classify_frame(self, frame):
+        """
+        Classifies a frame, on the car when a local model is loaded, otherwise (or if it fails)
+        on the server.
+        :return: Command ("stop", "left", "right", "unknown", ...) or None on error.
+        """
+        start = time.perf_counter()
+        command = self._classify(frame)
+        self.telemetry.note_inference(command, (time.perf_counter() - start) * 1000.0)
+        return command
 
+    def _classify(self, frame):
+        if self.local is not None:
+            try:
+                return self.local.classify(frame)
+            except Exception as e:
+                print(f"Local inference failed, sending photo to server: {e}")
+        return self.remote.classify(frame)
 
 
-    def go_left(self, speed=400):
-        print("Turning LEFT...")
-        time.sleep(0.5)
-        self.mdev.setServo("3",130)
-        time.sleep(0.5)
-        self.move(dir_left=0, dir_right=0, speed=490)  # Turn left
-        time.sleep(1.3) #time for rotation
-    
-    def go_right(self, speed=400):
-        print("Turning RIGHT...")
-        time.sleep(0.5)
-        self.mdev.setServo("3",50)
-        time.sleep(0.5)
-        self.move(dir_left=1, dir_right=1, speed=490)  # Turn right
-        time.sleep(1.3) #time for rotation
 
     def go_forward(self, speed=400):
         # Move forward if no obstacle or distance reading is invalid
         self.move(dir_left=0, dir_right=1, speed=speed)
 
-    def go_backward(self, speed=400):
-        self.move(dir_left=1, dir_right=0, speed=500) 
-        time.sleep(0.3) # 0.6
-        self.stop_wheels() 
-        
-        
-        
+    def turn_steps(self, direction, speed=490, rotation_time=1.3, settle=0.5):
+        """
+        Turn left or right as Manoeuvre steps: wait settle seconds, steer, wait settle seconds
+        again, then rotate. The rotation watches for obstacles.
+        :param direction: "left" or "right"
+        """
+        angle, wheels = (130, 0) if direction == "left" else (50, 1)
+        return [
+            Step("settle", settle),
+            Step("steer", settle, lambda: self.mdev.setServo("3",angle)),
+            Step("rotate", rotation_time, lambda: self.move(dir_left=wheels, dir_right=wheels, speed=speed), watch=True),
+        ]
+
+    def back_up_steps(self):
+        """
+        Short reverse then stop, as Manoeuvre steps.
+        """
+        return [
+            Step("reverse", 0.3, lambda: self.move(dir_left=1, dir_right=0, speed=500)),
+            Step("stop", 0.0, self.stop_wheels),
+        ]
+
     def stop_wheels(self):
         """Stops both motors."""
         print("Stopping motors...")
-        self.mdev.writeReg(self.mdev.CMD_PWM1, 0)
-        self.mdev.writeReg(self.mdev.CMD_PWM2, 0)
+        self.mdev.writeRegs(((self.mdev.CMD_PWM1, 0), (self.mdev.CMD_PWM2, 0)))
 
     def stop(self):
         """
@@ -131,70 +141,200 @@ class CameraClient:
         """
         print("Stopping the video stream...")
         self.vs.stop()
+        self.sensors.stop()
+        self.remote.close()
+        self.telemetry.close()
         
         
-    def boocleForCar(self, speed=400, obstacle_distance=20):
-
+    def boocleForCar(self, speed=400, obstacle_distance=20, rate_hz=CONTROL_RATE_HZ):
+        """
+        Drives forward and, at each obstacle, backs up, shoots a photo with the camera servo and
+        turns as the sign says.
+        The loop runs at rate_hz and the waits and turns are timed steps instead of sleeps, so an
+        obstacle closer than half obstacle_distance during a turn restarts the obstacle sequence.
+        """
         print("Starting route navigation...")
-        
-        try:
-            while True:
-                distance = self.get_distance()
-                print(f"Distance: {distance:.2f} cm")
-                mdev_instance.setServo("2",10) #move servo (ultrasonic sensor placement)
-
-                if distance > obstacle_distance or distance == 0:
-                    mdev_instance.setLed(0,0,1);
-                    # Move forward if no obstacle
+        if isinstance(self.remote, RemoteClassifier):
+            self.remote.smoothing_max_age = 0.0  # One photo per obstacle, judged on its own by the server
+        scheduler = ControlScheduler(rate_hz)
+        runner = ManoeuvreRunner()
+        driving = False
+
+        def after_photo(results):
+            turn_direction = results["photo"]
+            print("response:", turn_direction)
+            if turn_direction in ("left", "right"):
+                return Manoeuvre(f"turn {turn_direction}", [
+                    Step("sensor", 0.5, lambda: (self.mdev.setLed(0,1,0),
+                                                 self.mdev.setServo("2",10))),  #move servo (ultrasonic sensor placement)
+                    *self.turn_steps(turn_direction),
+                    Step("recheck", 1.0, watch=True),
+                ])
+            if turn_direction == "stop":
+                print("stoping program")
+                return Manoeuvre("stop sign", [Step("wait", 3.0), Step("recheck", 1.0)])
+            return Manoeuvre("no sign", [Step("recheck", 1.0)])
+
+        def obstacle_sequence():
+            return Manoeuvre("obstacle", [
+                Step("brake", 1.0, lambda: (self.mdev.setLed(1,0,0), self.stop_wheels())),
+                *self.back_up_steps(),
+                Step("camera", 0.5, lambda: self.mdev.setServo("2",90)),  #turn servo (camera placement)
+                Step("photo", PHOTO_TIMEOUT, self.take_photo, background=True),
+            ], then=after_photo)
+
+        def step(now):
+            nonlocal driving
+            distance = self.get_latest_distance()
+            self.telemetry.record(distance, now)
+            if runner.active:
+                if runner.watching and distance is not None and distance <= obstacle_distance / 2:
+                    print(f"Obstacle at {distance:.2f} cm during the manoeuvre")
+                    runner.start(obstacle_sequence(), now)
+                else:
+                    runner.update(now)
+                return True
+
+            if distance is None:
+                if driving:
+                    self.stop_wheels()  # No valid reading, never drive blind
+                    driving = False
+            elif distance > obstacle_distance:
+                if not driving:
+                    # Sent once when starting to drive, not on every iteration
+                    self.mdev.setServo("2",10) #move servo (ultrasonic sensor placement)
+                    self.mdev.setLed(0,0,1)
                     self.mdev.setServo("3",90)
-                    self.go_forward()
+                    self.go_forward(speed)
                     print("Moving forward...")
+                    driving = True
+            else:
+                print(f"Obstacle at {distance:.2f} cm")
+                driving = False
+                runner.start(obstacle_sequence(), now)
+            return True
+
+        try:
+            scheduler.run(step)
+        except KeyboardInterrupt:
+            print("Navigation stopped by user.")
+            scheduler.print_stats()
+            self.stop_wheels()
+            self.stop()
+
+    def run_pipelined(self, speed=400, obstacle_distance=20, sign_timeout=1.0, rate_hz=CONTROL_RATE_HZ):
+        """
+        Drives while frames are captured and classified continuously on background threads.
+        When an obstacle is seen, the smoothed prediction of the last frames is used at once
+        instead of stopping to shoot a new photo.
+        The sensor head stays in the ultrasonic position (servo 2 at 10), the camera must see
+        the road ahead in that position.
+        The loop runs at rate_hz like boocleForCar, turns are interrupted by close obstacles.
+        :param sign_timeout: Seconds to wait for a prediction when none is recent enough.
+        """
+        print("Starting pipelined navigation...")
+        # Smoothed once: by the vote for local predictions, by the server for remote ones
+        pipeline = SignPipeline(self.vs, self.classify_frame, window=5 if self.local is not None else 1)
+        pipeline.start()
+        scheduler = ControlScheduler(rate_hz)
+        runner = ManoeuvreRunner()
+        decision_latencies = []
+        driving = False
+        detected_at = None  # perf_counter() of the obstacle while waiting for a sign
+        sign_deadline = 0.0
+
+        def record_latency(obstacle_at):
+            latency_ms = (time.perf_counter() - obstacle_at) * 1000.0
+            decision_latencies.append(latency_ms)
+            print(f"Decision latency (obstacle -> steering): {latency_ms:.1f} ms")
+
+        def decision(turn_direction, obstacle_at):
+            print("response:", turn_direction)
+            if turn_direction in ("left", "right"):
+                return Manoeuvre(f"turn {turn_direction}", [
+                    Step("led", 0.0, lambda: self.mdev.setLed(0,1,0)),
+                    *self.back_up_steps(),
+                    Step("decided", 0.0, lambda: record_latency(obstacle_at)),
+                    *self.turn_steps(turn_direction, settle=0.0),
+                ])
+            if turn_direction == "stop":
+                print("stoping program")
+                return Manoeuvre("stop sign", [Step("wait", 3.0)])
+            return Manoeuvre("back up", self.back_up_steps())  # "unknown" or no prediction: look again
+
+        def obstacle(now):
+            nonlocal driving, detected_at, sign_deadline
+            # Decide from the predictions already made on the last frames
+            detected_at = time.perf_counter()
+            sign_deadline = now + sign_timeout
+            driving = False
+            runner.abort()
+            self.mdev.setLed(1,0,0)
+            self.stop_wheels()
+
+        def step(now):
+            nonlocal driving, detected_at
+            distance = self.get_latest_distance()
+            self.telemetry.record(distance, now)
+            if runner.active:
+                if runner.watching and distance is not None and distance <= obstacle_distance / 2:
+                    print(f"Obstacle at {distance:.2f} cm during the manoeuvre")
+                    obstacle(now)
                 else:
-                    # Stop when obstacle is detected
-                    mdev_instance.setLed(1,0,0);
-                    self.stop_wheels()
-                    time.sleep(1)
-                    self.go_backward()
-                    mdev_instance.setServo("2",90) #turn servo (camera placement)
-                    time.sleep(0.5)
-                    turn_direction = self.take_photo()
-                    print("response:", turn_direction)
-                    time.sleep(1)
-                    
-                    if turn_direction == "left":
-                        mdev_instance.setLed(0,1,0);
-                        mdev_instance.setServo("2",10) #move servo (ultrasonic sensor placement)
-                        print("Turning LEFT...")
-                        time.sleep(0.5)
-                        self.go_left()
-                        
-                    elif turn_direction == "right":
-                        mdev_instance.setLed(0,1,0);
-                        mdev_instance.setServo("2",10) #move servo (ultrasonic sensor placement)
-                        print("Turning RIGHT...")
-                        time.sleep(0.5)
-                        self.go_right()
-                    elif turn_direction == "stop":
-                        print("stoping program")
-                        time.sleep(3)
-                        #return
-
-                    #self.stop_wheels()
-                    print("Turn completed. Rechecking distance...")
-                    time.sleep(1) 
+                    runner.update(now)
+                return True
+
+            if detected_at is not None:
+                turn_direction = pipeline.latest_sign()
+                if turn_direction is None and now < sign_deadline:
+                    return True  # No recent sign prediction, waiting for the next frame
+                runner.start(decision(turn_direction, detected_at), now)
+                detected_at = None
+                return True
+
+            if distance is None:
+                if driving:
+                    self.stop_wheels()  # No valid reading, never drive blind
+                    driving = False
+            elif distance > obstacle_distance:
+                if not driving:
+                    self.mdev.setLed(0,0,1)
+                    self.mdev.setServo("3",90)
+                    self.go_forward(speed)
+                    driving = True
+            else:
+                obstacle(now)
+            return True
 
+        try:
+            scheduler.run(step)
         except KeyboardInterrupt:
             print("Navigation stopped by user.")
+            scheduler.print_stats()
+            if decision_latencies:
+                print(f"Decision latency over {len(decision_latencies)} obstacles: "
+                      f"mean {sum(decision_latencies) / len(decision_latencies):.1f} ms, "
+                      f"max {max(decision_latencies):.1f} ms")
+            pipeline.stop()
             self.stop_wheels()
             self.stop()
 
 if __name__ == "__main__":
     SERVER_URL = "http://192.168.1.100:9090"  # Replace <SERVER_IP> with the actual server address
+    LOCAL_MODEL_PATH = "traffic_sign_model_int8.tflite"  # Set to None to always use the server
+    STREAM_PORT = None  # Set to the server STREAM_PORT (9091) to stream frames instead of HTTP uploads
+    # Classify frames continuously instead of stopping to shoot a photo at each obstacle. Only for
+    # cars whose camera sees the road ahead with the sensor head in the ultrasonic position
+    # (servo 2 at 10): on the stock head the camera only faces forward at 90.
+    PIPELINED = False
     mdev_instance = mDEV()  # Create an instance of the mDEV class
-    motor_test = CameraClient(SERVER_URL,mdev_instance)    
+    motor_test = CameraClient(SERVER_URL,mdev_instance,LOCAL_MODEL_PATH,STREAM_PORT)    
     mdev_instance.setServo("3",90) # trun servo (forward wheel position)
     mdev_instance.setServo("2",10) # trun servo (ultrasonic sensor poisition)
-    motor_test.boocleForCar()
+    if PIPELINED:
+        motor_test.run_pipelined()
+    else:
+        motor_test.boocleForCar()
     
 
     client = CameraClient(SERVER_URL)
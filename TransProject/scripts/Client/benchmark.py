@@ -0,0 +1,294 @@
+"""
+Benchmarks for the Raspberry Pi client.
+Usage: python benchmark.py <benchmark> [options]  (python benchmark.py -h for the list)
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import os
+import time
+
+import cv2
+import numpy as np
+
+
+def load_frame(image_path=None):
+    """
+    Frame used by the benchmarks: an image file, or a frame from the camera when None.
+    """
+    if image_path:
+        frame = cv2.imread(image_path)
+        if frame is None:
+            raise ValueError(f"Unable to read {image_path}")
+        return frame
+    from imutils.video import VideoStream
+    vs = VideoStream(src=0).start()
+    time.sleep(2.0)  # Warm-up the camera
+    frame = vs.read()
+    vs.stop()
+    return frame
+
+
+def measure(function, runs):
+    """
+    Call function() runs times after one warm-up call.
+    :return: Latencies in seconds.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):  # The classifiers print on every call
+        function()
+        latencies = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            function()
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def print_latency(label, latencies):
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000.0
+    print(f"{label:<24} p50={p50:8.2f} ms  p99={p99:8.2f} ms  mean={np.mean(latencies) * 1000.0:8.2f} ms")
+
+
+def bench_inference(args):
+    """
+    End-to-end decision latency (frame -> command) on the car against the server.
+    """
+    from local_inference import LocalClassifier
+    from remote_inference import RemoteClassifier
+
+    frame = load_frame(args.image)
+    if args.model:
+        local = LocalClassifier(args.model, args.threads)
+        print_latency("local (TFLite)", measure(lambda: local.classify(frame), args.runs))
+    if args.server:
+        remote = RemoteClassifier(args.server)
+        print_latency("remote (HTTP)", measure(lambda: remote.classify(frame), args.runs))
+
+
+def load_labelled_frames(dataset_dir, limit):
+    """
+    Frames of a dataset folder organised in class_<index> subfolders, like dataset/train.
+    :return: List of (frame, class index).
+    """
+    frames = []
+    for label in sorted(os.listdir(dataset_dir)):
+        folder = os.path.join(dataset_dir, label)
+        if not os.path.isdir(folder) or not label.startswith("class_"):
+            continue
+        for img_file in sorted(os.listdir(folder))[:limit]:
+            frame = cv2.imread(os.path.join(folder, img_file))
+            if frame is not None:
+                frames.append((frame, int(label.split("_")[1])))
+    return frames
+
+
+def bench_preprocess(args):
+    """
+    Bytes per frame, encode time and accuracy of the full-frame upload against the
+    negotiated crop + downscale. Accuracy is measured by classifying the decoded uploads
+    with the same resize as the server.
+    """
+    from local_inference import LocalClassifier
+    from remote_inference import RemoteClassifier, crop_roi, encode_for_model, encode_full_frame
+
+    classifier = LocalClassifier(args.model)
+    if args.server:
+        config = RemoteClassifier(args.server).fetch_config()
+        input_size, roi = config["input_size"], config["roi"]
+    else:
+        input_size, roi = classifier.input_size, (0.0, 0.0, 1.0, 1.0)
+
+    frames = load_labelled_frames(args.dataset, args.limit)
+    print(f"{len(frames)} frames, model input {input_size[0]}x{input_size[1]}, ROI {tuple(roi)}")
+    paths = (
+        ("full frame (width 500)", encode_full_frame),
+        (f"negotiated (x{args.scale}, q{args.quality})",
+         lambda frame: encode_for_model(frame, input_size, roi, args.scale, args.quality)),
+    )
+    for label, encode in paths:
+        sizes, times, correct = [], [], 0
+        for frame, expected in frames:
+            start = time.perf_counter()
+            encoded_image = encode(frame)
+            times.append(time.perf_counter() - start)
+            sizes.append(encoded_image.size)
+            decoded = cv2.imdecode(encoded_image, cv2.IMREAD_COLOR)
+            if encode is encode_full_frame:
+                decoded = crop_roi(decoded, roi)  # Done by the server for full frames
+            correct += int(np.argmax(classifier.predict(decoded)) == expected)
+        print(f"{label:<28} {np.mean(sizes):9.0f} bytes/frame  encode={np.mean(times) * 1000.0:6.2f} ms"
+              f"  accuracy={correct / max(1, len(frames)) * 100.0:6.2f}%")
+
+
+def bench_actuation(args):
+    """
+    Latency and bus transactions per actuation command against a mock SMBus, for the original
+    write path (one triple write per register) and the cached, batched write layer of mDEV.
+    """
+    from mDev import mDEV
+    from mock_bus import MockSMBus
+
+    commands = (
+        ("move (4 registers)", lambda i: ((mDEV.CMD_DIR1, 0), (mDEV.CMD_DIR2, 1),
+                                          (mDEV.CMD_PWM1, 400 + i % 2), (mDEV.CMD_PWM2, 400 + i % 2))),
+        ("setLed (3 registers)", lambda i: ((mDEV.CMD_IO1, i % 2), (mDEV.CMD_IO2, 1), (mDEV.CMD_IO3, 1 - i % 2))),
+        ("setServo (1 register)", lambda i: ((mDEV.CMD_SERVO3, 1500 + i % 2),)),
+    )
+    print(f"Mock bus: {args.transaction_us:.0f} us per transaction, new policy: {args.repeats} write(s) per register")
+    for label, registers in commands:
+        for changing in (False, True):
+            # A control loop mostly re-sends the same command, the changing case alternates two values
+            values = [registers(i if changing else 0) for i in range(args.runs)]
+            original = mDEV(bus=MockSMBus(args.transaction_us / 1e6), cache_writes=False)
+            batched = mDEV(bus=MockSMBus(args.transaction_us / 1e6), write_repeats=args.repeats)
+            paths = (
+                ("original", lambda regs: [original.writeReg(cmd, value) for cmd, value in regs], original),
+                ("batched", batched.writeRegs, batched),
+            )
+            for name, send, device in paths:
+                device.bus.reset_counters()
+                index = itertools.count()
+                latencies = measure(lambda: send(values[next(index) % len(values)]), args.runs)
+                transactions = device.bus.transactions / (args.runs + 1)
+                print_latency(f"{label} {'changing' if changing else 'repeated'} {name}", latencies)
+                print(f"{'':<24} {transactions:.1f} transactions/command")
+
+
+def bench_sonar(args):
+    """
+    Latency, failure rate and error of ultrasonic reads for each flaky firmware pattern of the
+    mock bus, original mDEV.readReg against SonarReader. The pass/fail checks are in
+    tests/test_sonar.py.
+    """
+    from mDev import mDEV
+    from mock_bus import FLAKY_PATTERNS, MockSMBus
+    from sonar import SonarReader, echo_to_distance
+
+    echo = int(args.distance * 1000.0 / 17.0)
+    for pattern, faults in FLAKY_PATTERNS.items():
+        for name in ("original", "reader"):
+            bus = MockSMBus(args.transaction_us / 1e6, seed=args.seed, **faults)
+            bus.sonic_echo = echo
+            mdev = mDEV(bus=bus)
+            reader = SonarReader(mdev, budget=args.budget_ms / 1000.0)
+            def read_original():
+                try:
+                    return echo_to_distance(mdev.readReg(mdev.CMD_SONIC)) or None  # 0 means failure
+                except OSError:
+                    return None
+            read = read_original if name == "original" else reader.read
+            distances, latencies = [], []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                distances.append(read())
+                latencies.append(time.perf_counter() - start)
+            failures = sum(distance is None for distance in distances)
+            wrong = sum(distance is not None and abs(distance - args.distance) > args.tolerance for distance in distances)
+            print_latency(f"{pattern:<8} {name}", latencies)
+            print(f"{'':<24} failures={failures / args.runs * 100.0:5.1f}%  wrong={wrong / args.runs * 100.0:5.1f}%"
+                  f"  {bus.transactions / args.runs:.1f} transactions/read")
+
+
+def bench_telemetry(args):
+    """
+    CPU cost of a telemetry record against a print per loop iteration, and the share of one core
+    used by recording at --rate-hz. With --check, exits with status 1 if recording uses more than
+    1% of a core or if the records read back (after the ring buffer wrapped) differ.
+    """
+    import math
+    import sys
+    import tempfile
+    from telemetry import RECORD, TelemetryRecorder, read_records
+
+    capacity = args.records // 2  # The buffer wraps during the benchmark
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "telemetry.bin")
+        recorder = TelemetryRecorder(path, capacity)
+        commands = ("stop", "left", None, "right", "unknown")
+        start_cpu = time.process_time()
+        start = time.perf_counter()
+        for i in range(args.records):
+            if i % 7 == 0:
+                recorder.note_inference(commands[i % len(commands)], 40.0 + i % 13)
+            recorder.record(None if i % 11 == 0 else 20.0 + i % 50, i * 0.01)
+        record_us = (time.perf_counter() - start) / args.records * 1e6
+        record_cpu_us = (time.process_time() - start_cpu) / args.records * 1e6
+        recorder.close()
+        _, records = read_records(path)
+
+    with open(os.devnull, "w") as devnull:
+        start = time.perf_counter()
+        for i in range(args.records):
+            print(f"Distance: {20.0 + i % 50:.2f} cm, command: {commands[i % len(commands)]}", file=devnull)
+        print_us = (time.perf_counter() - start) / args.records * 1e6
+
+    load = record_cpu_us * args.rate_hz / 1e6
+    print(f"{'telemetry record':<24} {record_us:6.2f} us ({record_cpu_us:.2f} us CPU), {RECORD.size} bytes")
+    print(f"{'print to /dev/null':<24} {print_us:6.2f} us")
+    print(f"At {args.rate_hz:.0f} Hz: {load * 100.0:.3f}% of a core, "
+          f"{RECORD.size * args.rate_hz * 3600 / 1e6:.1f} MB/hour")
+
+    problems = []
+    if load > 0.01:
+        problems.append(f"recording uses {load * 100.0:.2f}% of a core at {args.rate_hz:.0f} Hz")
+    first = args.records - capacity
+    if len(records) != capacity or records[0][0] != first * 0.01 or records[-1][0] != (args.records - 1) * 0.01:
+        problems.append(f"read {len(records)} records, expected the last {capacity}")
+    elif not all(math.isnan(r[1]) == ((first + i) % 11 == 0) for i, r in enumerate(records)):
+        problems.append("missing distances do not match")
+    if args.check:
+        for problem in problems:
+            print(f"FAILED {problem}")
+        print("Telemetry check passed." if not problems else "Telemetry check failed.")
+        sys.exit(1 if problems else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    inference = subparsers.add_parser("inference", help="decision latency of local and remote inference")
+    inference.add_argument("--image", help="Image to classify (a camera frame by default)")
+    inference.add_argument("--model", help="TFLite model for local inference")
+    inference.add_argument("--server", help="Server URL for remote inference, e.g. http://192.168.1.100:9090")
+    inference.add_argument("--threads", type=int, default=4, help="TFLite interpreter threads")
+    inference.add_argument("--runs", type=int, default=100)
+    inference.set_defaults(func=bench_inference)
+
+    preprocess = subparsers.add_parser("preprocess", help="bytes, encode time and accuracy of negotiated downscaling")
+    preprocess.add_argument("--dataset", default="../../dataset/train", help="Folder with class_<index> subfolders")
+    preprocess.add_argument("--model", required=True, help="TFLite model used to measure accuracy")
+    preprocess.add_argument("--server", help="Server URL to read the input size and ROI from (model size, full frame otherwise)")
+    preprocess.add_argument("--scale", type=int, default=2)
+    preprocess.add_argument("--quality", type=int, default=90)
+    preprocess.add_argument("--limit", type=int, default=200, help="Maximum frames per class")
+    preprocess.set_defaults(func=bench_preprocess)
+
+    actuation = subparsers.add_parser("actuation", help="latency and I2C transactions per motor/servo/LED command (mock bus)")
+    actuation.add_argument("--transaction-us", type=float, default=200.0, help="Simulated time of one bus transaction")
+    actuation.add_argument("--repeats", type=int, default=3, help="Writes per register of the batched layer")
+    actuation.add_argument("--runs", type=int, default=200)
+    actuation.set_defaults(func=bench_actuation)
+
+    sonar = subparsers.add_parser("sonar", help="ultrasonic read latency and failures on flaky firmware patterns (mock bus)")
+    sonar.add_argument("--distance", type=float, default=50.0, help="True distance in cm answered by the mock")
+    sonar.add_argument("--tolerance", type=float, default=2.0, help="Error in cm above which a distance is wrong")
+    sonar.add_argument("--budget-ms", type=float, default=20.0)
+    sonar.add_argument("--transaction-us", type=float, default=200.0, help="Simulated time of one bus transaction")
+    sonar.add_argument("--runs", type=int, default=200)
+    sonar.add_argument("--seed", type=int, default=0)
+    sonar.set_defaults(func=bench_sonar)
+
+    telemetry = subparsers.add_parser("telemetry", help="CPU cost of the telemetry recorder against print()")
+    telemetry.add_argument("--records", type=int, default=100000)
+    telemetry.add_argument("--rate-hz", type=float, default=100.0, help="Control loop rate used for the CPU share")
+    telemetry.add_argument("--check", action="store_true", help="Exit with status 1 when recording is too costly")
+    telemetry.set_defaults(func=bench_telemetry)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import Future
+
+CONTROL_RATE_HZ = 50  # Control loop iterations per second
+
+# One step of a manoeuvre: action() is called once when the step starts, the next step starts
+# duration seconds later. While a step with watch=True runs, the loop checks for obstacles.
+# A step with background=True runs its action on a thread and ends as soon as the action returns,
+# duration being its timeout, so slow actions (e.g. a photo sent to the server) never block the loop.
+Step = namedtuple("Step", "name duration action watch background", defaults=(None, False, False))
+
+
+def run_in_background(action):
+    """
+    Call action() on a daemon thread.
+    :return: Future of its return value.
+    """
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(action())
+        except BaseException as e:
+            future.set_exception(e)
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+class ControlScheduler:
+    """
+    Runs a control loop at a fixed rate and records how late each iteration starts (jitter)
+    and how many iterations took longer than the period (overruns).
+    """
+    def __init__(self, rate_hz=CONTROL_RATE_HZ, history=1000):
+        """
+        :param rate_hz: Loop iterations per second.
+        :param history: Number of recent iterations kept for the statistics.
+        """
+        self.period = 1.0 / rate_hz
+        self.ticks = 0
+        self.overruns = 0
+        self.jitters = deque(maxlen=history)  # Seconds between the planned and actual start
+        self.durations = deque(maxlen=history)  # Seconds spent in the loop body
+
+    def run(self, step):
+        """
+        Call step(now) once per period until it returns False. Missed periods are skipped, not
+        caught up. KeyboardInterrupt is left to the caller.
+        :param step: Function of the monotonic time of the iteration.
+        """
+        next_tick = time.monotonic()
+        while True:
+            now = time.monotonic()
+            self.jitters.append(now - next_tick)
+            keep_running = step(now)
+            self.durations.append(time.monotonic() - now)
+            self.ticks += 1
+            if keep_running is False:
+                return
+
+            next_tick += self.period
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                self.overruns += 1
+                next_tick = time.monotonic()
+            else:
+                time.sleep(delay)
+
+    def stats(self):
+        """
+        :return: Dict with the iterations, overrun rate, p50/p99/max jitter and p99 loop body
+                 time in milliseconds.
+        """
+        def percentile(values, q):
+            values = sorted(values)
+            return values[min(len(values) - 1, int(q * len(values)))] * 1000.0 if values else 0.0
+        return {
+            "ticks": self.ticks,
+            "overrun_rate": self.overruns / self.ticks if self.ticks else 0.0,
+            "jitter_p50_ms": percentile(self.jitters, 0.5),
+            "jitter_p99_ms": percentile(self.jitters, 0.99),
+            "jitter_max_ms": max(self.jitters, default=0.0) * 1000.0,
+            "body_p99_ms": percentile(self.durations, 0.99),
+        }
+
+    def print_stats(self):
+        stats = self.stats()
+        print(f"Control loop at {1.0 / self.period:.0f} Hz: {stats['ticks']} iterations, "
+              f"{stats['overrun_rate'] * 100.0:.1f}% overruns, jitter p50 {stats['jitter_p50_ms']:.2f} ms "
+              f"p99 {stats['jitter_p99_ms']:.2f} ms max {stats['jitter_max_ms']:.2f} ms, "
+              f"body p99 {stats['body_p99_ms']:.2f} ms")
+
+
+class Manoeuvre:
+    """
+    Timed sequence of steps advanced by the control loop instead of time.sleep, so the loop
+    keeps reading the sensors during the manoeuvre.
+    """
+    def __init__(self, name, steps, then=None):
+        """
+        :param name: Name used in the logs.
+        :param steps: List of Step.
+        :param then: Optional function results -> next Manoeuvre (or None), called when the last
+                     step is over. results maps each step name to the return value of its action.
+        """
+        self.name = name
+        self.steps = steps
+        self.then = then
+        self.index = -1
+        self.step_end = 0.0
+        self.pending = None  # Future of the running background step
+        self.results = {}
+
+    def start(self, now):
+        self.index = -1
+        self.results = {}
+        self._next_step(now)
+        return self
+
+    def _next_step(self, now):
+        self.index += 1
+        self.pending = None
+        if self.index < len(self.steps):
+            step = self.steps[self.index]
+            self.step_end = now + step.duration
+            if step.action is None:
+                return
+            if step.background:
+                self.pending = run_in_background(step.action)
+            else:
+                self.results[step.name] = step.action()
+
+    def _step_over(self, now):
+        """
+        :return: True when the current step is over: its duration elapsed, or for a background
+                 step its action returned (result None if it failed or timed out).
+        """
+        if self.pending is None:
+            return now >= self.step_end
+        step = self.steps[self.index]
+        if self.pending.done():
+            try:
+                self.results[step.name] = self.pending.result()
+            except Exception as e:
+                print(f"Step {step.name} of {self.name} failed: {e}")
+                self.results[step.name] = None
+            return True
+        if now >= self.step_end:
+            print(f"Step {step.name} of {self.name} timed out")
+            self.results[step.name] = None
+            return True
+        return False
+
+    @property
+    def done(self):
+        return self.index >= len(self.steps)
+
+    @property
+    def watching(self):
+        return not self.done and self.steps[self.index].watch
+
+    def update(self, now):
+        """
+        Start the steps whose time has come.
+        :return: True while the manoeuvre is running.
+        """
+        while not self.done and self._step_over(now):
+            self._next_step(time.monotonic())
+        return not self.done
+
+
+class ManoeuvreRunner:
+    """
+    Runs one manoeuvre at a time, chaining to the manoeuvre returned by its then function.
+    """
+    def __init__(self):
+        self.current = None
+
+    def start(self, manoeuvre, now):
+        print(f"Manoeuvre: {manoeuvre.name}")
+        self.current = manoeuvre.start(now)
+
+    def abort(self):
+        self.current = None
+
+    @property
+    def active(self):
+        return self.current is not None
+
+    @property
+    def watching(self):
+        return self.current is not None and self.current.watching
+
+    def update(self, now):
+        """
+        :return: True while a manoeuvre is running.
+        """
+        while self.current is not None and not self.current.update(now):
+            following = self.current.then(self.current.results) if self.current.then else None
+            self.current = None
+            if following is not None:
+                self.start(following, now)
+        return self.current is not None
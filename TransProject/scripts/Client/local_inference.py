@@ -0,0 +1,90 @@
+import cv2
+import numpy as np
+
+# Same mapping as car_control.py
+COMMANDS = {0: "stop", 1: "right", 2: "left"}
+UNKNOWN = "unknown"  # Command when the prediction is not confident enough, like smoothing.py
+
+
+def load_interpreter_class():
+    """
+    Imported on first use so that importing this module stays cheap on the Pi.
+    :return: TFLite Interpreter class from tflite_runtime (preferred) or tensorflow.
+    """
+    try:
+        from tflite_runtime.interpreter import Interpreter  # Lightweight runtime for the Raspberry Pi
+    except ImportError:
+        try:
+            import tensorflow as tf
+        except ImportError:
+            raise ImportError("Local inference needs tflite_runtime (pip install tflite-runtime) or tensorflow")
+        Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+class LocalClassifier:
+    """
+    Runs a TFLite copy of the traffic sign model directly on the Raspberry Pi.
+    Accepts the float, float16 and int8 models written by export_model.py.
+    The Client folder is deployed alone on the car, so the preprocessing of car_control.py
+    is repeated here and must stay identical to it.
+    """
+    def __init__(self, model_path, num_threads=4, confidence_threshold=0.0):
+        """
+        :param model_path: Path of the .tflite model.
+        :param num_threads: Number of CPU threads used by the interpreter.
+        :param confidence_threshold: Probability below which classify() answers UNKNOWN.
+        """
+        self.confidence_threshold = confidence_threshold
+        Interpreter = load_interpreter_class()
+        self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.input_size = (int(self.input["shape"][2]), int(self.input["shape"][1]))  # (width, height)
+
+    def preprocess(self, frame):
+        """
+        Same preprocessing as preprocess_image() in car_control.py.
+        :param frame: BGR frame from the camera.
+        :return: Preprocessed image with a batch dimension.
+        """
+        img = cv2.resize(frame, self.input_size)  # Resize image to the model input size
+        img = img.astype("float32") / 255.0  # Normalize pixel values to [0, 1]
+        return np.expand_dims(img, axis=0)  # Add batch dimension
+
+    def predict(self, frame):
+        """
+        :param frame: BGR frame from the camera.
+        :return: Class probabilities (numpy array).
+        """
+        image = self.preprocess(frame)
+        if self.input["dtype"] != np.float32:
+            scale, zero_point = self.input["quantization"]
+            limits = np.iinfo(self.input["dtype"])
+            image = np.clip(np.round(image / scale + zero_point), limits.min, limits.max).astype(self.input["dtype"])
+
+        self.interpreter.set_tensor(self.input["index"], image)
+        self.interpreter.invoke()
+        probabilities = self.interpreter.get_tensor(self.output["index"])[0]
+
+        if self.output["dtype"] != np.float32:
+            scale, zero_point = self.output["quantization"]
+            probabilities = (probabilities.astype(np.float32) - zero_point) * scale
+        return np.array(probabilities)
+
+    def classify(self, frame):
+        """
+        :param frame: BGR frame from the camera.
+        :return: Command ("stop", "left", "right") or "ff" for an unmapped class, like the server,
+                 UNKNOWN below the confidence threshold.
+        """
+        probabilities = self.predict(frame)
+        predicted_class = int(np.argmax(probabilities))
+        confidence = float(probabilities[predicted_class])
+        if confidence < self.confidence_threshold:
+            command = UNKNOWN
+        else:
+            command = COMMANDS.get(predicted_class, "ff")
+        print(f"Predicted class: {predicted_class} ({confidence:.2f}), Command: {command}")
+        return command
@@ -5,7 +5,10 @@
 # auther      : www.freenove.com
 # modification: 2020/03/26
 ########################################################################
-import smbus
+try:
+    import smbus
+except ImportError:  # Not a Raspberry Pi, pass a bus (e.g. mock_bus.MockSMBus) to mDEV
+    smbus = None
 import time
 import threading
 from threading import Lock
@@ -35,11 +38,35 @@ class mDEV:
     Is_IO3_State_True = False
     Is_Buzzer_State_True = False
     handle = True
-    mutex = Lock()
-    def __init__(self,addr=0x18):
+    mutex = Lock()  # Serialises all bus transactions, the shield does not support interleaving
+    # Write policy. The triple write works around shields whose firmware drops writes on newer
+    # SMBus versions, WRITE_REPEATS = 1 is enough with an updated firmware.
+    WRITE_REPEATS = 3       # Times each register of a batch is written
+    WRITE_DELAY = 0.001     # Seconds between two rounds of a batch
+    WRITE_RETRIES = 1       # Extra attempts after an I2C error (or a read-back mismatch)
+    VERIFY_WRITES = False   # Read registers back after writing them (needs firmware support)
+    def __init__(self,addr=0x18,bus=None,cache_writes=True,write_repeats=None,write_delay=None,
+                 write_retries=None,verify_writes=None):
+        """
+        :param addr: I2C address of the shield.
+        :param bus: SMBus-like object, the Raspberry Pi bus 1 when None.
+        :param cache_writes: Skip writes of a register that already holds the value.
+        :param write_repeats, write_delay, write_retries, verify_writes: Write policy, the class
+                                                                          defaults when None.
+        """
         self.address = addr #default address of mDEV
-        self.bus=smbus.SMBus(1)
-        self.bus.open(1)
+        if bus is None:
+            if smbus is None:
+                raise ImportError("mDEV needs smbus on the Raspberry Pi (or a bus argument)")
+            bus=smbus.SMBus(1)
+            bus.open(1)
+        self.bus=bus
+        self.cache_writes = cache_writes
+        self.write_repeats = self.WRITE_REPEATS if write_repeats is None else write_repeats
+        self.write_delay = self.WRITE_DELAY if write_delay is None else write_delay
+        self.write_retries = self.WRITE_RETRIES if write_retries is None else write_retries
+        self.verify_writes = self.VERIFY_WRITES if verify_writes is None else verify_writes
+        self.registers = {}  # Last value successfully written to each register
     def i2cRead(self,reg):
         self.bus.read_byte_data(self.address,reg)
         
@@ -50,19 +77,70 @@ class mDEV:
         self.bus.write_byte(self.address,value)
     
     def writeReg(self,cmd,value):
-        try:
+        self.writeRegs(((cmd,value),))
+
+    def writeRegs(self,values,force=False):
+        """
+        Write several registers as one batch, see _writeRegs. Holds the bus mutex, so writes
+        never interleave with a read of another thread (e.g. sensor_service.SensorService).
+        """
+        with self.mutex:
+            return self._writeRegs(values,force)
+
+    def _writeRegs(self,values,force=False):
+        """
+        Write several registers as one batch. Registers already holding their value are skipped,
+        the others are written write_repeats times, in rounds separated by a single write_delay,
+        and the batch is retried on I2C errors.
+        :param values: Iterable of (register, value).
+        :param force: Also write the registers whose cached value is unchanged.
+        :return: Number of registers written.
+        """
+        pending = {}
+        for cmd,value in values:
             value = int(value)
-            #print(value,type(value))
-            self.bus.write_i2c_block_data(self.address,cmd,[value>>8,value&0xff])
-            time.sleep(0.001)
-            self.bus.write_i2c_block_data(self.address,cmd,[value>>8,value&0xff])
-            time.sleep(0.001)
-            self.bus.write_i2c_block_data(self.address,cmd,[value>>8,value&0xff])
-            time.sleep(0.001)
-        except Exception as e:
-            print(Exception,"I2C Error :",e)
+            if force or not self.cache_writes or self.registers.get(cmd) != value:
+                pending[cmd] = value
+        if not pending:
+            return 0
+        count = len(pending)
+        for attempt in range(self.write_retries+1):
+            try:
+                for repeat in range(self.write_repeats):
+                    if repeat:
+                        time.sleep(self.write_delay)
+                    for cmd,value in pending.items():
+                        self.bus.write_i2c_block_data(self.address,cmd,[(value>>8)&0xff,value&0xff])
+                if self.verify_writes:
+                    for cmd in [cmd for cmd,value in pending.items() if self.readBack(cmd) == value]:
+                        self.registers[cmd] = pending.pop(cmd)
+                    if pending:
+                        raise IOError("read-back mismatch on registers %s"%sorted(pending))
+                else:
+                    self.registers.update(pending)
+                    pending = {}
+                return count
+            except Exception as e:
+                print(Exception,"I2C Error :",e)
+        for cmd in pending:
+            self.registers.pop(cmd,None)  # Unknown state, written again next time
+        return count-len(pending)
+
+    def readBack(self,cmd):
+        data = self.bus.read_i2c_block_data(self.address,cmd,2)
+        return data[0]<<8 | data[1]
+
+    def invalidateCache(self):
+        """
+        Forget the cached register values, e.g. after the shield was reset.
+        """
+        self.registers.clear()
         
-    def readReg(self,cmd):      
+    def readReg(self,cmd):
+        with self.mutex:
+            return self._readReg(cmd)
+
+    def _readReg(self,cmd):      
         ##################################################################################################
         #Due to the update of SMBus, the communication between Pi and the shield board is not normal. 
         #through the following code to improve the success rate of communication.
@@ -106,61 +184,41 @@ class mDEV:
         #################################################################################################
     def move(self,left_pwm,right_pwm,steering_angle=90):
         self.setServo('1',steering_angle)
-        if left_pwm>0:
-            mdev.writeReg(mdev.CMD_DIR2,1)
-            mdev.writeReg(mdev.CMD_PWM2,left_pwm)
-        else:
-            mdev.writeReg(mdev.CMD_DIR2,0)
-            mdev.writeReg(mdev.CMD_PWM2,abs(left_pwm))
-        if right_pwm>0:
-            mdev.writeReg(mdev.CMD_DIR1,1)
-            mdev.writeReg(mdev.CMD_PWM1,right_pwm)
-        else:
-            mdev.writeReg(mdev.CMD_DIR1,0)
-            mdev.writeReg(mdev.CMD_PWM1,abs(right_pwm))
+        self.writeRegs(((self.CMD_DIR2,1 if left_pwm>0 else 0),(self.CMD_PWM2,abs(left_pwm)),
+                        (self.CMD_DIR1,1 if right_pwm>0 else 0),(self.CMD_PWM1,abs(right_pwm))))
         
     def setServo(self,index,angle):
         angle=numMap(angle,0,180,500,2500)
         if index=="1":
-            self.writeReg(mdev.CMD_SERVO1,angle)
+            self.writeReg(self.CMD_SERVO1,angle)
         elif index=="2":
-            self.writeReg(mdev.CMD_SERVO2,angle)
+            self.writeReg(self.CMD_SERVO2,angle)
         elif index=="3":
-            self.writeReg(mdev.CMD_SERVO3,angle)
+            self.writeReg(self.CMD_SERVO3,angle)
         elif index=="4":
-            self.writeReg(mdev.CMD_SERVO4,angle)
+            self.writeReg(self.CMD_SERVO4,angle)
             
     def setLed(self,R,G,B):
-        if R==1:
-            mdev.writeReg(mdev.CMD_IO1,0)
-        else:
-            mdev.writeReg(mdev.CMD_IO1,1)
-        if G==1:
-            mdev.writeReg(mdev.CMD_IO2,0)
-        else:
-            mdev.writeReg(mdev.CMD_IO2,1)
-        if B==1:
-            mdev.writeReg(mdev.CMD_IO3,0)
-        else:
-            mdev.writeReg(mdev.CMD_IO3,1)
+        # The LEDs are active low
+        self.writeRegs(((self.CMD_IO1,0 if R==1 else 1),(self.CMD_IO2,0 if G==1 else 1),
+                        (self.CMD_IO3,0 if B==1 else 1)))
     def setBuzzer(self,PWM):
-        mdev.writeReg(mdev.CMD_BUZZER,PWM)
-    def getSonicEchoTime():
-        SonicEchoTime = mdev.readReg(mdev.CMD_SONIC)
+        self.writeReg(self.CMD_BUZZER,PWM)
+    def getSonicEchoTime(self):
+        SonicEchoTime = self.readReg(self.CMD_SONIC)
         return SonicEchoTime
         
     def getSonic(self):
-        SonicEchoTime = mdev.readReg(mdev.CMD_SONIC)
+        SonicEchoTime = self.readReg(self.CMD_SONIC)
         distance = SonicEchoTime * 17.0 / 1000.0
         return distance
     def setShieldI2cAddress(self,addr): #addr: 7bit I2C Device Address 
         if (addr<0x03) or (addr > 0x77) :
             return 
         else :
-            mdev.writeReg(0xaa,(0xbb<<8)|(addr<<1))
+            self.writeReg(0xaa,(0xbb<<8)|(addr<<1))
             
-mdev = mDEV()   
-def loop(): 
+def loop(mdev): 
     mdev.readReg(mdev.CMD_SONIC)
     while True:
         SonicEchoTime = mdev.readReg(mdev.CMD_SONIC)
@@ -171,6 +229,7 @@ def loop():
 if __name__ == '__main__':
     import sys
     print("mDev.py is starting ... ")
+    mdev = mDEV()
     #setup()
     try:
         if len(sys.argv)<2:
@@ -0,0 +1,101 @@
+"""
+In-memory stand-in for smbus.SMBus, to run mDEV and its benchmarks without the car:
+    mdev = mDEV(bus=MockSMBus())
+"""
+import random
+import time
+
+SONIC_REGISTER = 12  # mDEV.CMD_SONIC, the echo time is read from this register and the next one
+SONIC_MAX_HIGH_BYTE = 50  # mDEV.SONIC_MAX_HIGH_BYTE, higher bytes are garbage
+
+# Ultrasonic firmware behaviours seen on the shield, as MockSMBus arguments
+FLAKY_PATTERNS = {
+    "healthy": {},
+    "garbage": {"sonic_glitch_rate": 0.3},  # Reads answer random bytes (SMBus update issue)
+    "spikes": {"sonic_spike_rate": 0.2},  # Valid-looking but wrong echo times
+    "nack": {"error_rate": 0.2},  # Transactions fail with an I/O error
+    "mixed": {"sonic_glitch_rate": 0.2, "sonic_spike_rate": 0.1, "error_rate": 0.05},
+    "dead": {"sonic_glitch_rate": 1.0},  # Never a valid answer
+}
+
+
+class MockSMBus:
+    """
+    Keeps the last value written to each register and counts the bus transactions.
+    Each transaction takes transaction_time seconds and fails with probability error_rate.
+    Reads of the ultrasonic registers answer sonic_echo, with optional firmware faults.
+    """
+    def __init__(self, transaction_time=0.0002, error_rate=0.0, sonic_glitch_rate=0.0,
+                 sonic_spike_rate=0.0, seed=0):
+        """
+        :param transaction_time: Seconds per transaction (about 0.2 ms for a short write at 100 kHz).
+        :param error_rate: Probability that a transaction raises OSError, like a NACK on the real bus.
+        :param sonic_glitch_rate: Probability that an ultrasonic read answers random bytes.
+        :param sonic_spike_rate: Probability that an ultrasonic read answers a wrong but valid echo.
+        """
+        self.transaction_time = transaction_time
+        self.error_rate = error_rate
+        self.sonic_glitch_rate = sonic_glitch_rate
+        self.sonic_spike_rate = sonic_spike_rate
+        self.random = random.Random(seed)
+        self.registers = {}  # register -> list of bytes last written
+        self.sonic_echo = 0  # Echo time answered by the ultrasonic registers
+        self.transactions = 0
+        self.writes = 0
+        self.errors = 0
+
+    def open(self, bus):
+        pass
+
+    def close(self):
+        pass
+
+    def reset_counters(self):
+        self.transactions = self.writes = self.errors = 0
+
+    def _transaction(self):
+        self.transactions += 1
+        if self.transaction_time:
+            time.sleep(self.transaction_time)
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.errors += 1
+            raise OSError(121, "Remote I/O error")
+
+    def _sonic_bytes(self, register, length):
+        echo = self.sonic_echo
+        if self.sonic_spike_rate and self.random.random() < self.sonic_spike_rate:
+            echo = self.random.randint(100, (SONIC_MAX_HIGH_BYTE << 8) - 1)
+        data = [(echo >> 8) & 0xff, echo & 0xff, 0][register - SONIC_REGISTER:][:length]
+        if self.sonic_glitch_rate and self.random.random() < self.sonic_glitch_rate:
+            data = [self.random.randint(SONIC_MAX_HIGH_BYTE, 0xff) for _ in data]
+        return data
+
+    def _read(self, register):
+        if register in (SONIC_REGISTER, SONIC_REGISTER + 1):
+            return self._sonic_bytes(register, 1)[0]
+        return self.registers.get(register, [0])[0]
+
+    def write_byte(self, address, value):
+        self._transaction()
+
+    def write_byte_data(self, address, register, value):
+        self._transaction()
+        self.writes += 1
+        self.registers[register] = [value]
+
+    def write_i2c_block_data(self, address, register, data):
+        self._transaction()
+        if register not in (SONIC_REGISTER, SONIC_REGISTER + 1):  # Read-only, written to select them
+            self.writes += 1
+            self.registers[register] = list(data)
+
+    def read_byte_data(self, address, register):
+        self._transaction()
+        return self._read(register)
+
+    def read_i2c_block_data(self, address, register, length):
+        self._transaction()
+        if register in (SONIC_REGISTER, SONIC_REGISTER + 1):
+            return self._sonic_bytes(register, length)
+        data = self.registers.get(register, [])
+        return (list(data) + [0] * length)[:length]
@@ -0,0 +1,111 @@
+import threading
+import time
+from collections import Counter, deque
+
+
+class LatestValue:
+    """
+    Single-slot queue: a new value replaces the previous one, so a slow reader always gets the
+    most recent value and never a backlog.
+    """
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._value = None
+        self._version = 0
+
+    def put(self, value):
+        with self._condition:
+            self._value = value
+            self._version += 1
+            self._condition.notify_all()
+
+    def get(self):
+        """
+        :return: Tuple (value, version) without waiting. The version is 0 before the first put.
+        """
+        with self._condition:
+            return self._value, self._version
+
+    def wait_newer(self, version, timeout=None):
+        """
+        Wait for a value more recent than version.
+        :return: Tuple (value, version), or (None, version) if the timeout expired.
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._version > version, timeout):
+                return None, version
+            return self._value, self._version
+
+
+class SignPipeline:
+    """
+    Captures frames and classifies them continuously on two background threads, so a recent
+    sign prediction is already available when the control loop needs it.
+    Predictions are smoothed by a majority vote over the last frames, unless window is 1 for a
+    classifier that already smooths them (the server).
+    """
+    def __init__(self, video_stream, classify, window=5, max_age=1.0, capture_fps=15):
+        """
+        :param video_stream: Started imutils VideoStream.
+        :param classify: Function frame -> command (None on error).
+        :param window: Number of recent predictions in the vote, 1 uses each prediction as is.
+        :param max_age: Seconds after which a prediction is too old to be used.
+        :param capture_fps: Maximum capture rate.
+        """
+        self.video_stream = video_stream
+        self.classify = classify
+        self.max_age = max_age
+        self.capture_period = 1.0 / capture_fps
+        self.frames = LatestValue()  # (timestamp, frame)
+        self.signs = LatestValue()  # (timestamp, smoothed command)
+        self.history = deque(maxlen=window)  # (timestamp, command), used by the inference thread only
+        self.running = threading.Event()
+        self.threads = []
+
+    def start(self):
+        self.running.set()
+        self.threads = [
+            threading.Thread(target=self._capture_loop, name="capture", daemon=True),
+            threading.Thread(target=self._inference_loop, name="inference", daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.running.clear()
+        for thread in self.threads:
+            thread.join(timeout=2.0)
+
+    def _capture_loop(self):
+        while self.running.is_set():
+            start = time.monotonic()
+            frame = self.video_stream.read()
+            if frame is not None:
+                self.frames.put((start, frame))
+            time.sleep(max(0.0, self.capture_period - (time.monotonic() - start)))
+
+    def _inference_loop(self):
+        version = 0
+        while self.running.is_set():
+            item, version = self.frames.wait_newer(version, timeout=0.5)
+            if item is None:
+                continue
+            captured_at, frame = item
+            command = self.classify(frame)
+            if command is None:
+                continue
+            self.history.append((captured_at, command))
+            self.signs.put((captured_at, self._vote(captured_at)))
+
+    def _vote(self, now):
+        recent = [command for timestamp, command in self.history if now - timestamp <= self.max_age]
+        return Counter(recent).most_common(1)[0][0]
+
+    def latest_sign(self):
+        """
+        :return: Smoothed command of the recent frames, or None if there is no recent prediction.
+        """
+        item, _ = self.signs.get()
+        if item is None or time.monotonic() - item[0] > self.max_age:
+            return None
+        return item[1]
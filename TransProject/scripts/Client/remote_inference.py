@@ -0,0 +1,252 @@
+import time
+import uuid
+import cv2
+import imutils
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool
+from urllib3.util.retry import Retry
+
+CONNECT_TIMEOUT = 1.0  # Seconds to open the TCP connection to the server
+READ_TIMEOUT = 3.0  # Seconds to wait for the server answer
+MAX_RETRIES = 2  # Retries on connection errors and 502/503/504 answers
+RETRY_BACKOFF = 0.1  # Seconds, doubled after each retry
+NEGOTIATED_SCALE = 2  # Frames are sent at this multiple of the model input size
+JPEG_QUALITY = 90  # Quality of the downscaled frames
+CONFIG_RETRY_INTERVAL = 5.0  # Seconds before asking /config again after a failure (e.g. 503 while the server loads)
+
+
+def crop_roi(frame, roi):
+    """
+    Same crop as crop_roi() in car_control.py.
+    :param frame: BGR frame from the camera.
+    :param roi: (x, y, width, height) as fractions of the frame size.
+    """
+    h, w = frame.shape[:2]
+    x0, y0 = int(roi[0] * w), int(roi[1] * h)
+    x1, y1 = int((roi[0] + roi[2]) * w), int((roi[1] + roi[3]) * h)
+    return frame[y0:max(y1, y0 + 1), x0:max(x1, x0 + 1)]
+
+
+def encode_full_frame(frame):
+    """
+    Original upload format: frame resized to a width of 500 and JPEG-encoded at default quality.
+    :return: Encoded JPEG (numpy array) or None.
+    """
+    frame = imutils.resize(frame, width=500)  # Resize for consistent dimensions
+    _, encoded_image = cv2.imencode(".jpg", frame)
+    return encoded_image
+
+
+def encode_for_model(frame, input_size, roi, scale=NEGOTIATED_SCALE, quality=JPEG_QUALITY):
+    """
+    Crop the region of interest and resize it to a small multiple of the model input size
+    before encoding, so the server receives only the pixels the model will use.
+    :param input_size: (width, height) of the model input.
+    :return: Encoded JPEG (numpy array) or None.
+    """
+    size = (input_size[0] * scale, input_size[1] * scale)
+    frame = cv2.resize(crop_roi(frame, roi), size, interpolation=cv2.INTER_AREA)
+    _, encoded_image = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return encoded_image
+
+
+def parse_server_timing(header):
+    """
+    :param header: Server-Timing header of a server answer (e.g. "decode;dur=1.20, total;dur=9.80").
+    :return: Dict stage -> milliseconds, empty if the server did not send the header.
+    """
+    stages = {}
+    for entry in (header or "").split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur":
+                try:
+                    stages[name] = float(value)
+                except ValueError:
+                    pass
+    return stages
+
+
+class TimedHTTPConnection(HTTPConnection):
+    """
+    HTTP connection recording how long its TCP connection took to open. The time is kept on the
+    connection, used by one request at a time, until that request takes it.
+    """
+    setup_seconds = None  # Setup time of the last connect() not taken yet
+
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        self.setup_seconds = time.perf_counter() - start
+
+    def take_setup_seconds(self):
+        """
+        :return: Setup time of the TCP connection if it was opened for the current request, else None.
+        """
+        seconds, self.setup_seconds = self.setup_seconds, None
+        return seconds
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """
+    Keep-alive connection pool whose HTTP connections record their setup time.
+    """
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = dict(self.poolmanager.pool_classes_by_scheme,
+                                                       http=TimedHTTPConnectionPool)
+
+
+class RemoteClassifier:
+    """
+    Sends frames to the vision server (car_control.py) and returns the command it answers.
+    The connection is kept alive between calls.
+    Frames are posted to /predict with a session id, so the server smooths the predictions of
+    this car over its last frames and answers "unknown" when it is not confident enough.
+    Set smoothing_max_age to 0 to have each frame judged on its own.
+    """
+    def __init__(self, server_url, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 max_retries=MAX_RETRIES, negotiate=True):
+        """
+        :param server_url: URL of the server to send photos to.
+        :param negotiate: Ask the server for the model input size and ROI and send frames cropped
+                          and downscaled to it. Full frames are sent if the server does not answer.
+        :param connect_timeout: Seconds to open the connection.
+        :param read_timeout: Seconds to wait for the answer.
+        :param max_retries: Retries on connection errors and 502/503/504 answers.
+        """
+        self.server_url = server_url
+        self.timeout = (connect_timeout, read_timeout)
+        retry = Retry(total=max_retries, connect=max_retries, read=max_retries, status=max_retries,
+                      backoff_factor=RETRY_BACKOFF, status_forcelist=(502, 503, 504),
+                      allowed_methods=frozenset({"GET", "POST"}),  # Classifying a frame is safe to repeat
+                      raise_on_status=False)
+        adapter = TimedHTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.negotiate = negotiate
+        self.model_config = None  # {"input_size": [w, h], "roi": [x, y, w, h]} once negotiated
+        self.config_retry_at = 0.0  # Monotonic time of the next /config request after a failure
+        self.session_id = uuid.uuid4().hex  # Identifies this car for the smoothing on the server
+        self.endpoint = "/predict"  # Switched to /upload for servers without /predict
+        self.last_prediction = None  # Last /predict answer (command, class_id, confidence, probabilities)
+        self.last_timing = {}  # Server-Timing stages of the last answer in ms, plus "network"
+        self.smoothing_max_age = None  # Frame gap restarting the server smoothing, server default when None
+
+    def fetch_config(self):
+        """
+        Asks the server for the model input size and region of interest. Negotiation is only
+        given up when the server has no /config endpoint (404); other failures (server still
+        loading, network error) are retried after CONFIG_RETRY_INTERVAL.
+        :return: The configuration, or None if it is not available (yet).
+        """
+        try:
+            response = self.session.get(f"{self.server_url}/config", timeout=self.timeout)
+            if response.status_code == 200:
+                self.model_config = response.json()
+                print(f"Negotiated preprocessing: {self.model_config}")
+            elif response.status_code == 404:
+                print("Server has no /config endpoint, sending full frames.")
+                self.negotiate = False
+            else:
+                print(f"Server config unavailable (status {response.status_code}), sending full frames for now.")
+        except Exception as e:
+            print(f"Error fetching server config, sending full frames for now: {e}")
+        if self.model_config is None and self.negotiate:
+            self.config_retry_at = time.monotonic() + CONFIG_RETRY_INTERVAL
+        return self.model_config
+
+    def close(self):
+        """
+        Closes the pooled connections.
+        """
+        self.session.close()
+
+    def post(self, files, headers):
+        """
+        Post a frame to the current endpoint.
+        :return: Tuple (response with its body read, setup time in seconds of the connection if it
+                 was opened for this request, else None).
+        """
+        response = self.session.post(f"{self.server_url}{self.endpoint}", files=files, headers=headers,
+                                     timeout=self.timeout, stream=True)  # Connection held until the body is read
+        connection = response.raw.connection
+        setup_seconds = connection.take_setup_seconds() if isinstance(connection, TimedHTTPConnection) else None
+        response.content  # Reads the body, the connection goes back to the pool
+        return response, setup_seconds
+
+    def classify(self, frame):
+        """
+        Encodes a frame as JPEG and posts it to the server.
+        :param frame: BGR frame from the camera.
+        :return: Command returned by the server ("stop", "left", "right", "unknown", ...) or None on error.
+        """
+        if self.negotiate and self.model_config is None and time.monotonic() >= self.config_retry_at:
+            self.fetch_config()  # Full frames until the server answers, or for good on a 404
+
+        # Encode the frame as JPEG
+        headers = {"X-Session-Id": self.session_id}
+        if self.smoothing_max_age is not None:
+            headers["X-Smoothing-Max-Age"] = str(self.smoothing_max_age)
+        if self.model_config is not None:
+            encoded_image = encode_for_model(frame, self.model_config["input_size"], self.model_config["roi"])
+            headers["X-ROI-Applied"] = "1"
+        else:
+            encoded_image = encode_full_frame(frame)
+        if encoded_image is None:
+            print("Error encoding the image.")
+            return None
+
+        # Generate a filename for the image
+        filename = "photo.jpg"  # You can make this dynamic if needed
+
+        # Send the photo to the server
+        try:
+            print(f"Sending photo to server ({encoded_image.size} bytes)...")
+            start = time.perf_counter()
+            files = {"file": (filename, encoded_image.tobytes(), 'image/jpeg')}  # Specify the filename and MIME type
+            response, setup_seconds = self.post(files, headers)
+            if response.status_code == 404 and self.endpoint == "/predict":
+                print("Server has no /predict endpoint, using /upload without smoothing.")
+                self.endpoint = "/upload"
+                response, setup_seconds = self.post(files, headers)
+            latency_ms = (time.perf_counter() - start) * 1000.0
+            self.last_timing = parse_server_timing(response.headers.get("Server-Timing"))
+            if "total" in self.last_timing:  # Time outside the server handler: network and queueing
+                self.last_timing["network"] = max(0.0, latency_ms - self.last_timing["total"])
+                split = f", server {self.last_timing['total']:.1f} ms, network {self.last_timing['network']:.1f} ms"
+            else:
+                split = ""
+            if setup_seconds is not None:
+                print(f"Request took {latency_ms:.1f} ms (new connection: {setup_seconds * 1000.0:.1f} ms{split})")
+            else:
+                print(f"Request took {latency_ms:.1f} ms (reused connection{split})")
+
+            if response.status_code == 200:
+                try:
+                    # Attempt to parse JSON response
+                    response_data = response.json()
+                    if isinstance(response_data, dict):  # /predict answer
+                        self.last_prediction = response_data
+                        print(f"Command: {response_data['command']} (confidence {response_data['confidence']:.2f})")
+                        return response_data["command"]
+                    print(f"Parsed JSON response: {response_data}")
+                    return (f"{response_data}")  # Extract 'direction' key
+                except ValueError:
+                    # If response is not JSON, treat it as plain text
+                    print("Response is not JSON, treating as plain text.")
+                    return response.text.strip()  # Assume plain text and strip whitespace
+            else:
+                print(f"Error: Server returned status code {response.status_code}")
+                return None
+        except Exception as e:
+            print(f"Error sending photo: {e}")
+            return None
@@ -0,0 +1,87 @@
+import threading
+import time
+
+POLL_RATE_HZ = 20  # Ultrasonic reads per second
+MAX_AGE = 0.25  # Seconds after which a distance is too old to drive on
+
+
+class SensorService:
+    """
+    Polls the ultrasonic sensor at a fixed rate on its own thread, so the control loop reads
+    the latest distance instead of waiting for the I2C bus.
+    The bus itself is shared with the motor writes through mDEV.mutex.
+    """
+    def __init__(self, sonar, rate_hz=POLL_RATE_HZ, max_age=MAX_AGE):
+        """
+        :param sonar: SonarReader of the car.
+        :param rate_hz: Polling rate.
+        :param max_age: Seconds after which distance() considers the last reading stale.
+        """
+        self.sonar = sonar
+        self.period = 1.0 / rate_hz
+        self.max_age = max_age
+        self._latest = (None, 0.0)  # (distance, monotonic timestamp), replaced as a whole
+        self._updated = threading.Condition()  # Only for wait_distance()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.polls = 0
+        self.overruns = 0  # Polls that took longer than the period
+
+    def start(self):
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._run, name="sensor-service", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+
+    def _run(self):
+        next_poll = time.monotonic()
+        while not self.stopped.is_set():
+            distance = self.sonar.read()
+            self._latest = (distance, time.monotonic())  # A single assignment, readers never see half of it
+            self.polls += 1
+            with self._updated:
+                self._updated.notify_all()
+
+            next_poll += self.period
+            delay = next_poll - time.monotonic()
+            if delay < 0:
+                self.overruns += 1
+                next_poll = time.monotonic()  # Skip the missed polls instead of bursting
+            self.stopped.wait(max(0.0, delay))
+
+    def latest(self):
+        """
+        :return: Tuple (distance or None if the read failed, timestamp of the read), without waiting.
+                 The timestamp is 0 before the first read.
+        """
+        return self._latest
+
+    def distance(self):
+        """
+        :return: Latest distance in centimeters, or None if the read failed or is older than max_age.
+        """
+        distance, timestamp = self._latest
+        if time.monotonic() - timestamp > self.max_age:
+            return None
+        return distance
+
+    def wait_distance(self, timeout=None):
+        """
+        Wait for the next reading, to run a loop at the polling rate.
+        :param timeout: Seconds to wait, two periods when None.
+        :return: Same as distance().
+        """
+        with self._updated:
+            self._updated.wait(2 * self.period if timeout is None else timeout)
+        return self.distance()
+
+    def stats(self):
+        """
+        :return: Dict with the polls, overruns and the statistics of the sonar reader.
+        """
+        return dict(self.sonar.stats(), polls=self.polls, overruns=self.overruns)
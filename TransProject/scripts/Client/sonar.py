@@ -0,0 +1,146 @@
+import statistics
+import time
+from collections import deque
+
+READ_BUDGET = 0.02  # Seconds a distance read may take before giving up
+SAMPLES = 2  # Valid echoes that must agree before a distance is returned
+MAX_DEVIATION_CM = 3.0  # Samples closer than this agree, the others are outliers
+FAST_PATH_FAILURES = 5  # Invalid fast reads in a row before using only the checked read
+FAST_PATH_PROBE = 50  # Checked samples after which the fast path is tried again
+
+
+def echo_to_distance(echo_time):
+    """
+    Same conversion as mDEV.getSonic(): echo time in microseconds to centimeters.
+    """
+    return echo_time * 17.0 / 1000.0
+
+
+class SonarReader:
+    """
+    Ultrasonic distance with a bounded cost, replacing mDEV.readReg(CMD_SONIC) (up to 10 attempts
+    of 8 transactions, then 0).
+    Each sample is first read with one 2-byte block read. When the firmware answers invalid bytes,
+    the cross-checked read of mDEV.readReg is used for one attempt instead. Samples are taken until
+    SAMPLES of them agree or the time budget is spent, and the median of the agreeing ones is
+    returned, so a wrong but valid-looking echo is never used alone.
+    """
+    def __init__(self, mdev, budget=READ_BUDGET, samples=SAMPLES, max_deviation_cm=MAX_DEVIATION_CM,
+                 fast_path=True, history=1000):
+        """
+        :param mdev: mDEV instance owning the bus.
+        :param budget: Seconds a read may take.
+        :param samples: Number of agreeing samples needed per read.
+        :param max_deviation_cm: Maximum difference between two agreeing samples.
+        :param fast_path: Try a single block read before the cross-checked read.
+        :param history: Number of recent reads kept for the latency statistics.
+        """
+        self.mdev = mdev
+        self.budget = budget
+        self.samples = samples
+        self.max_deviation_cm = max_deviation_cm
+        self.fast_path = fast_path
+        self.fast_failures = 0
+        self.reads = 0
+        self.failures = 0
+        self.fast_reads = 0
+        self.checked_reads = 0
+        self.latencies = deque(maxlen=history)
+
+    def _valid(self, high, low):
+        echo = high << 8 | low
+        return 0 < echo and high < self.mdev.SONIC_MAX_HIGH_BYTE
+
+    def read_fast(self):
+        """
+        One block read of the two echo bytes.
+        :return: Echo time or None if the bytes are invalid.
+        """
+        high, low = self.mdev.bus.read_i2c_block_data(self.mdev.address, self.mdev.CMD_SONIC, 2)
+        return high << 8 | low if self._valid(high, low) else None
+
+    def read_checked(self):
+        """
+        One attempt of the cross-checked read of mDEV.readReg.
+        :return: Echo time or None if the two reads of the high byte disagree.
+        """
+        bus, address, cmd = self.mdev.bus, self.mdev.address, self.mdev.CMD_SONIC
+        bus.write_i2c_block_data(address, cmd, [0])
+        a = bus.read_i2c_block_data(address, cmd, 1)
+        bus.write_byte(address, cmd+1)
+        bus.read_i2c_block_data(address, cmd+1, 1)
+        bus.write_byte(address, cmd)
+        c = bus.read_byte_data(address, cmd)
+        bus.write_byte(address, cmd+1)
+        d = bus.read_byte_data(address, cmd+1)
+        return c << 8 | d if a[0] == c and self._valid(c, d) else None
+
+    def read_sample(self):
+        """
+        Holds the bus mutex of mDEV for the sample only, so writes can go between two samples.
+        :return: Echo time of one sample or None.
+        """
+        with self.mdev.mutex:
+            return self._read_sample()
+
+    def _read_sample(self):
+        try:
+            if self.fast_failures >= FAST_PATH_FAILURES + FAST_PATH_PROBE:
+                self.fast_failures = FAST_PATH_FAILURES - 1  # Firmware may behave again, one more try
+            if self.fast_path and self.fast_failures < FAST_PATH_FAILURES:
+                self.fast_reads += 1
+                echo = self.read_fast()
+                if echo is not None:
+                    self.fast_failures = 0
+                    return echo
+            self.fast_failures += 1
+            self.checked_reads += 1
+            return self.read_checked()
+        except OSError:
+            return None
+
+    def read(self):
+        """
+        :return: Distance in centimeters, or None if no valid sample was read within the budget.
+        """
+        start = time.monotonic()
+        deadline = start + self.budget
+        distances = []
+        agreeing = []
+        while len(agreeing) < self.samples and time.monotonic() < deadline:
+            echo = self.read_sample()
+            if echo is not None:
+                distances.append(echo_to_distance(echo))
+                agreeing = self._largest_agreeing(distances)
+
+        self.reads += 1
+        self.latencies.append(time.monotonic() - start)
+        if len(agreeing) < self.samples:
+            self.failures += 1
+            return None
+        return statistics.median(agreeing)
+
+    def _largest_agreeing(self, distances):
+        """
+        :return: Largest group of distances within max_deviation_cm of one of them.
+        """
+        groups = ([other for other in distances if abs(other - distance) <= self.max_deviation_cm]
+                  for distance in distances)
+        return max(groups, key=len)
+
+    def stats(self):
+        """
+        :return: Dict with the number of reads, failure rate, share of fast reads and p50/p99
+                 latency of the recent reads in milliseconds.
+        """
+        latencies = sorted(self.latencies)
+        def percentile(q):
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000.0 if latencies else 0.0
+        samples = self.fast_reads + self.checked_reads
+        return {
+            "reads": self.reads,
+            "failure_rate": self.failures / self.reads if self.reads else 0.0,
+            "fast_share": self.fast_reads / samples if samples else 0.0,
+            "p50_ms": percentile(0.5),
+            "p99_ms": percentile(0.99),
+        }
@@ -0,0 +1,119 @@
+import socket
+import struct
+import time
+import cv2
+import numpy as np
+from local_inference import COMMANDS, UNKNOWN
+from remote_inference import crop_roi, encode_full_frame
+
+# Must match stream_server.py on the vision server
+FRAME_HEADER = struct.Struct("!IBHHI")
+RESULT = struct.Struct("!IBf")
+FORMAT_JPEG = 0
+FORMAT_RAW = 1
+UNKNOWN_CLASS = 255
+
+CONNECT_TIMEOUT = 1.0  # Seconds to open the connection
+READ_TIMEOUT = 3.0  # Seconds to wait for a result
+
+
+def recv_exact(sock, size):
+    """
+    Read exactly size bytes from a socket.
+    :return: The bytes read, or None if the server closed the connection.
+    """
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:], size - received)
+        if count == 0:
+            return None
+        received += count
+    return buffer
+
+
+class StreamClassifier:
+    """
+    Pushes frames to the server over one persistent TCP connection (see stream_server.py)
+    instead of one multipart HTTP upload per frame.
+    """
+    def __init__(self, host, port, raw_size=None, roi=(0.0, 0.0, 1.0, 1.0)):
+        """
+        :param host: Address of the vision server.
+        :param port: Streaming port of the server (STREAM_PORT in car_control.py).
+        :param raw_size: (width, height) to send raw downscaled BGR pixels, None to send JPEG.
+        :param roi: Region of interest cropped before downscaling raw frames (ROI of the server).
+        """
+        self.address = (host, port)
+        self.raw_size = raw_size
+        self.roi = roi
+        self.sock = None
+        self.seq = 0
+
+    def connect(self):
+        self.close()
+        self.sock = socket.create_connection(self.address, timeout=CONNECT_TIMEOUT)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.settimeout(READ_TIMEOUT)
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def encode(self, frame):
+        """
+        :param frame: BGR frame from the camera.
+        :return: Tuple (format, height, width, payload bytes).
+        """
+        if self.raw_size is not None:
+            small = np.ascontiguousarray(cv2.resize(crop_roi(frame, self.roi), self.raw_size))
+            return FORMAT_RAW, small.shape[0], small.shape[1], small.tobytes()
+        encoded_image = encode_full_frame(frame)  # Same frames as the HTTP path
+        return FORMAT_JPEG, 0, 0, encoded_image.tobytes()
+
+    def send_frame(self, frame):
+        """
+        Push a frame without waiting for its result.
+        :return: Sequence number of the frame.
+        """
+        if self.sock is None:
+            self.connect()
+        frame_format, height, width, payload = self.encode(frame)
+        self.seq = (self.seq + 1) & 0xFFFFFFFF
+        self.sock.sendall(FRAME_HEADER.pack(self.seq, frame_format, height, width, len(payload)) + payload)
+        return self.seq
+
+    def receive_result(self):
+        """
+        Wait for the next result sent by the server.
+        :return: Tuple (sequence number, class id, confidence).
+        """
+        data = recv_exact(self.sock, RESULT.size)
+        if data is None:
+            raise ConnectionError("Stream server closed the connection")
+        return RESULT.unpack(data)
+
+    def classify(self, frame):
+        """
+        Same interface as RemoteClassifier.classify.
+        :param frame: BGR frame from the camera.
+        :return: Command ("stop", "left", "right", "ff"), "unknown" when the server is not
+                 confident enough, or None on error.
+        """
+        try:
+            start = time.perf_counter()
+            seq = self.send_frame(frame)
+            result_seq, class_id, confidence = self.receive_result()
+            while result_seq != seq:  # Skip results of frames pushed earlier
+                result_seq, class_id, confidence = self.receive_result()
+        except (OSError, ConnectionError) as e:
+            print(f"Error streaming frame: {e}")
+            self.close()  # Reconnect on the next frame
+            return None
+
+        command = UNKNOWN if class_id == UNKNOWN_CLASS else COMMANDS.get(class_id, "ff")
+        print(f"Frame {seq}: class {class_id} ({confidence:.2f}), Command: {command}, "
+              f"{(time.perf_counter() - start) * 1000.0:.1f} ms")
+        return command
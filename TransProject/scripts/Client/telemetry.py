@@ -0,0 +1,164 @@
+import math
+import mmap
+import os
+import struct
+import time
+
+TELEMETRY_PATH = "telemetry.bin"  # Ring buffer file, read with python telemetry_reader.py
+CAPACITY = 360000  # Records kept, one hour at 100 Hz (8.6 MB)
+
+# File header: magic, format version, record size, capacity, records written so far (the write
+# position is written % capacity), wall-clock time of the first record's monotonic clock
+HEADER = struct.Struct("<4sHHIQd4x")
+MAGIC = b"CTEL"
+FORMAT_VERSION = 1
+COUNT = struct.Struct("<Q")
+COUNT_OFFSET = 12  # Offset of the record count in the header
+# Record: monotonic timestamp (s), distance (cm), inference round trip (ms), loop period (ms),
+# command code. Missing values are NaN.
+RECORD = struct.Struct("<dfffB3x")
+CLOCK_TOLERANCE = 1.0  # Seconds the wall-clock offset may differ for a file to be continued (same boot)
+COMMANDS = (None, "stop", "left", "right", "unknown")  # Command codes are the indexes
+COMMAND_CODES = {command: code for code, command in enumerate(COMMANDS)}
+OTHER_COMMAND = 255  # Command not listed in COMMANDS
+
+
+class TelemetryRecorder:
+    """
+    Records one fixed-size binary record per control loop iteration into a preallocated ring
+    buffer, memory-mapped on a file so the records survive a crash of the client. A restarted
+    client appends to the records of the previous run, so the ones leading to a crash are kept.
+    Recording packs 24 bytes in place: no allocation, no system call, no print.
+    Only the control loop writes records. Other threads (e.g. inference) publish their latest
+    values with note_inference(), picked up by the next record.
+    """
+    def __init__(self, path=TELEMETRY_PATH, capacity=CAPACITY):
+        """
+        :param path: File of the ring buffer, continued if it was written with the same format,
+                     capacity and monotonic clock, else renamed (see rotate) and created again.
+                     None keeps the records in memory only.
+        :param capacity: Number of records kept, older ones are overwritten.
+        """
+        self.path = path
+        self.capacity = capacity
+        size = HEADER.size + capacity * RECORD.size
+        # Wall-clock time of monotonic() == 0, so the reader can print absolute times
+        clock_offset = time.time() - time.monotonic()
+        self.count = 0
+        if path is None:
+            self.file = None
+            self.buffer = bytearray(size)
+        else:
+            self.count = resumable_count(path, capacity, clock_offset)
+            if self.count is None:
+                if os.path.exists(path):
+                    rotate(path)
+                self.count = 0
+            self.file = open(path, "r+b" if self.count else "w+b")
+            self.file.truncate(size)  # Sparse file, pages are allocated as records are written
+            self.buffer = mmap.mmap(self.file.fileno(), size)
+        if self.count:
+            print(f"Appending to the {min(self.count, capacity)} telemetry records of {path}")
+        else:
+            HEADER.pack_into(self.buffer, 0, MAGIC, FORMAT_VERSION, RECORD.size, capacity, 0, clock_offset)
+        self.command = None  # Latest command of the inference, kept until the next one
+        self.inference_ms = math.nan  # Round trip of an inference finished since the last record
+        self.previous = None  # Monotonic time of the previous record
+
+    def note_inference(self, command, round_trip_ms):
+        """
+        Publish the result of an inference for the next record (any thread).
+        :param command: Command answered ("stop", "left", ...), None on error.
+        :param round_trip_ms: Time from the frame to the answer in milliseconds.
+        """
+        self.command = command
+        self.inference_ms = round_trip_ms
+
+    def record(self, distance, now=None):
+        """
+        Append a record (control loop only).
+        :param distance: Distance in centimeters, None without a valid reading.
+        :param now: Monotonic time of the loop iteration, time.monotonic() when None.
+        """
+        if now is None:
+            now = time.monotonic()
+        period_ms = (now - self.previous) * 1000.0 if self.previous is not None else math.nan
+        self.previous = now
+        inference_ms, self.inference_ms = self.inference_ms, math.nan
+        RECORD.pack_into(self.buffer, HEADER.size + (self.count % self.capacity) * RECORD.size,
+                         now, math.nan if distance is None else distance, inference_ms, period_ms,
+                         COMMAND_CODES.get(self.command, OTHER_COMMAND))
+        self.count += 1
+        COUNT.pack_into(self.buffer, COUNT_OFFSET, self.count)  # Published after the record
+
+    def close(self):
+        if self.file is not None:
+            self.buffer.flush()
+            self.buffer.close()
+            self.file.close()
+            self.file = None
+            print(f"{min(self.count, self.capacity)} telemetry records in {self.path}")
+
+
+def resumable_count(path, capacity, clock_offset):
+    """
+    :return: Records written so far in the telemetry file, or None if the file does not exist or
+             cannot be continued: other format or capacity, or timestamps of another boot whose
+             wall-clock offset differs from clock_offset.
+    """
+    try:
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+    except FileNotFoundError:
+        return None
+    if len(header) < HEADER.size:
+        return None
+    magic, version, record_size, file_capacity, count, file_offset = HEADER.unpack(header)
+    if (magic, version, record_size, file_capacity) != (MAGIC, FORMAT_VERSION, RECORD.size, capacity):
+        return None
+    if abs(file_offset - clock_offset) > CLOCK_TOLERANCE:
+        return None
+    return count
+
+
+def rotate(path):
+    """
+    Rename a telemetry file to path-<time of its last write>, with a -2, -3... suffix when that
+    name is taken, so that its records are kept. An existing file is never replaced.
+    :return: New name of the file.
+    """
+    root, ext = os.path.splitext(path)
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(os.path.getmtime(path)))
+    suffix = 1
+    while True:
+        rotated = f"{root}-{stamp}{ext}" if suffix == 1 else f"{root}-{stamp}-{suffix}{ext}"
+        try:
+            os.link(path, rotated)  # Fails if the name exists, unlike os.replace
+            break
+        except FileExistsError:
+            suffix += 1
+    os.remove(path)
+    print(f"Previous telemetry kept in {rotated}")
+    return rotated
+
+
+def read_records(path):
+    """
+    Read the records of a telemetry file, oldest first.
+    :return: Tuple (wall-clock offset of the monotonic timestamps, list of (timestamp, distance,
+             inference_ms, period_ms, command)).
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, record_size, capacity, count, clock_offset = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != FORMAT_VERSION or record_size != RECORD.size:
+        raise ValueError(f"{path} is not a telemetry file of format {FORMAT_VERSION}")
+    first = max(0, count - capacity)
+    records = []
+    for index in range(first, count):
+        timestamp, distance, inference_ms, period_ms, code = RECORD.unpack_from(
+            data, HEADER.size + (index % capacity) * RECORD.size)
+        command = COMMANDS[code] if code < len(COMMANDS) else "other"
+        records.append((timestamp, distance, inference_ms, period_ms, command))
+    return clock_offset, records
+
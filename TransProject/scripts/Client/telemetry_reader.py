@@ -0,0 +1,82 @@
+"""
+Reads a telemetry file written by the client (telemetry.py).
+Usage:
+    python telemetry_reader.py telemetry.bin              # summary
+    python telemetry_reader.py telemetry.bin --csv out.csv
+"""
+import argparse
+import csv
+import math
+import time
+from collections import Counter
+
+from telemetry import read_records
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else math.nan
+
+
+def export_csv(records, clock_offset, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["time", "elapsed_s", "distance_cm", "inference_ms", "loop_period_ms", "command"])
+        start = records[0][0] if records else 0.0
+        for timestamp, distance, inference_ms, period_ms, command in records:
+            writer.writerow([
+                time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(clock_offset + timestamp))
+                + f".{int((clock_offset + timestamp) % 1 * 1000):03d}",
+                f"{timestamp - start:.4f}",
+                "" if math.isnan(distance) else f"{distance:.2f}",
+                "" if math.isnan(inference_ms) else f"{inference_ms:.2f}",
+                "" if math.isnan(period_ms) else f"{period_ms:.3f}",
+                command or "",
+            ])
+    print(f"{len(records)} records written to {path}")
+
+
+def print_summary(records, clock_offset):
+    if not records:
+        print("No records.")
+        return
+    duration = records[-1][0] - records[0][0]
+    distances = [r[1] for r in records if not math.isnan(r[1])]
+    inferences = [r[2] for r in records if not math.isnan(r[2])]
+    periods = [r[3] for r in records if not math.isnan(r[3])]
+    start = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(clock_offset + records[0][0]))
+    print(f"{len(records)} records from {start} over {duration:.1f} s")
+    if periods:
+        print(f"Loop:      {1000.0 / (sum(periods) / len(periods)):.1f} Hz, period p50 {percentile(periods, 0.5):.2f} ms "
+              f"p99 {percentile(periods, 0.99):.2f} ms max {max(periods):.2f} ms")
+    if inferences:
+        fps = len(inferences) / duration if duration > 0 else math.nan
+        print(f"Inference: {fps:.1f} FPS, round trip p50 {percentile(inferences, 0.5):.1f} ms "
+              f"p99 {percentile(inferences, 0.99):.1f} ms max {max(inferences):.1f} ms")
+    print(f"Distance:  {len(distances) / len(records) * 100.0:.1f}% valid", end="")
+    if distances:
+        print(f", min {min(distances):.1f} cm, p50 {percentile(distances, 0.5):.1f} cm", end="")
+    print()
+    commands = Counter(r[4] for r in records)
+    print("Commands:  " + ", ".join(f"{command or 'none'} {count / len(records) * 100.0:.1f}%"
+                                    for command, count in commands.most_common()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", nargs="?", default="telemetry.bin")
+    parser.add_argument("--csv", help="Export the records to this CSV file instead of printing a summary")
+    parser.add_argument("--last", type=float, help="Only the last N seconds")
+    args = parser.parse_args()
+
+    clock_offset, records = read_records(args.path)
+    if args.last and records:
+        records = [r for r in records if r[0] >= records[-1][0] - args.last]
+    if args.csv:
+        export_csv(records, clock_offset, args.csv)
+    else:
+        print_summary(records, clock_offset)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,13 @@
 import time
 from mDev import mDEV  # Import the mDEV class from mDev.py
+from sonar import SonarReader
+from sensor_service import SensorService
+from control_scheduler import CONTROL_RATE_HZ, ControlScheduler, Manoeuvre, ManoeuvreRunner, Step
 
 class MotorTest:
     def __init__(self, mdev_instance):
         self.mdev = mdev_instance
+        self.sensors = SensorService(SonarReader(mdev_instance)).start()  # Polls the ultrasonic sensor
 
     def move(self, dir_left, dir_right, speed=1000):
         """
@@ -15,32 +19,26 @@ class MotorTest:
         """
         print(f"Moving: Left DIR={dir_left}, Right DIR={dir_right}, Speed={speed}")
 
-        # Set motor directions
-        self.mdev.writeReg(self.mdev.CMD_DIR1, dir_left)
-        self.mdev.writeReg(self.mdev.CMD_DIR2, dir_right)
-
-        # Set motor speeds
-        self.mdev.writeReg(self.mdev.CMD_PWM1, speed)
-        self.mdev.writeReg(self.mdev.CMD_PWM2, speed)
+        # Set motor directions and speeds in one batch, unchanged registers are not rewritten
+        self.mdev.writeRegs(((self.mdev.CMD_DIR1, dir_left), (self.mdev.CMD_DIR2, dir_right),
+                             (self.mdev.CMD_PWM1, speed), (self.mdev.CMD_PWM2, speed)))
 
 
     def stop(self):
         """Stops both motors."""
         print("Stopping motors...")
-        self.mdev.writeReg(self.mdev.CMD_PWM1, 0)
-        self.mdev.writeReg(self.mdev.CMD_PWM2, 0)
+        self.mdev.writeRegs(((self.mdev.CMD_PWM1, 0), (self.mdev.CMD_PWM2, 0)))
         
     def get_distance(self):
         """
-        Measures distance using the ultrasonic sensor.
-        :return: Distance in centimeters
+        Latest distance of the sensor service. Waits for the next poll, so the control loop runs
+        at the polling rate whatever the bus latency.
+        :return: Distance in centimeters, or None if there is no valid recent reading.
         """
-        try:
-            distance = self.mdev.getSonic()
-            return distance
-        except Exception as e:
-            print(f"Error reading ultrasonic sensor: {e}")
-            return float('inf')  # Return infinity if there's an error
+        distance = self.sensors.wait_distance()
+        if distance is None:
+            print(f"No valid ultrasonic reading ({self.sensors.stats()['failure_rate'] * 100.0:.1f}% failed reads)")
+        return distance
             
     def navigate_until_clear(self, speed=450, obstacle_distance=22):
         """
@@ -54,9 +52,12 @@ class MotorTest:
         try:
             while True:
                 distance = self.get_distance()
+                if distance is None:
+                    self.stop()  # No valid reading, never drive blind
+                    continue
                 print(f"Distance: {distance:.2f} cm")
 
-                if distance > obstacle_distance or distance == 0:
+                if distance > obstacle_distance:
                     # Move forward if no obstacle or distance reading is invalid
                     self.move(dir_left=0, dir_right=1, speed=speed)
                     print("Moving forward...")
@@ -67,7 +68,7 @@ class MotorTest:
                     time.sleep(1)  # Small pause before turning
                     
                     # Turn right until path is clear
-                    while distance <= obstacle_distance:
+                    while distance is None or distance <= obstacle_distance:
                         # test left
                         #self.move(dir_left=0, dir_right=0, speed=600)
                         # test right
@@ -75,6 +76,9 @@ class MotorTest:
                         print("Turning right...")
                         time.sleep(0.1)  # Short delay for sensor checking
                         distance = self.get_distance()
+                        if distance is None:
+                            self.stop()  # No valid reading, do not keep turning blind
+                            continue
                         print(f"Current Distance: {distance:.2f} cm")
                     
                     print("Path cleared! Moving forward...")
@@ -86,72 +90,79 @@ class MotorTest:
             self.stop()
 
 
-    def navigate_route(self, speed=400, obstacle_distance=20):
+    def navigate_route(self, speed=400, obstacle_distance=20, rate_hz=CONTROL_RATE_HZ):
         """
         Moves the robot forward and follows a predefined route of left and right turns.
         The sequence of turns is based on the number of obstacles encountered.
+        The loop runs at rate_hz and the turns are timed steps, so an obstacle closer than half
+        obstacle_distance during a turn stops it and the same turn starts over.
         :param speed: Motor speed (0 - 1000)
         :param obstacle_distance: Distance threshold in cm to detect an obstacle
         """
         turns = ["left", "right", "right", "left", "left", "right", "right", "left", "left", "right", "right"]
         obstacle_count = 0  # Counter for encountered obstacles
-
-        print("Starting predefined route navigation...")
-        
-        try:
-            while obstacle_count < len(turns):
-                distance = self.get_distance()
-                print(f"Distance: {distance:.2f} cm")
-
-                if distance > obstacle_distance or distance == 0:
-                    # Move forward if no obstacle
+        scheduler = ControlScheduler(rate_hz)
+        runner = ManoeuvreRunner()
+        driving = False
+
+        def turn_completed():
+            nonlocal obstacle_count
+            print("Turn completed. Rechecking distance...")
+            obstacle_count += 1  # Increment the obstacle counter
+
+        def route_turn():
+            # Determine the turn direction based on the route
+            turn_direction = turns[obstacle_count]
+            angle, wheels = (130, 0) if turn_direction == "left" else (50, 1)
+            return Manoeuvre(f"turn {turn_direction}", [
+                Step("brake", 1.0, self.stop),
+                Step("reverse", 0.6, lambda: self.move(dir_left=1, dir_right=0, speed=speed)),
+                Step("stop", 0.5, self.stop),
+                Step("steer", 0.5, lambda: self.mdev.setServo("3",angle)),
+                Step("rotate", 2.1, lambda: self.move(dir_left=wheels, dir_right=wheels, speed=600), watch=True),
+                Step("recheck", 1.0, self.stop),
+                Step("done", 0.0, turn_completed),
+            ])
+
+        def step(now):
+            nonlocal driving
+            distance = self.sensors.distance()
+            if runner.active:
+                if runner.watching and distance is not None and distance <= obstacle_distance / 2:
+                    print(f"Obstacle at {distance:.2f} cm during the turn, starting it over")
+                    runner.start(route_turn(), now)
+                else:
+                    runner.update(now)
+                return True
+            if obstacle_count >= len(turns):
+                return False
+
+            if distance is None:
+                if driving:
+                    self.stop()  # No valid reading, never drive blind
+                    driving = False
+            elif distance > obstacle_distance:
+                if not driving:
+                    # Move forward if no obstacle, sent once instead of on every iteration
                     self.mdev.setServo("3",90)
                     self.move(dir_left=0, dir_right=1, speed=speed)
                     print("Moving forward...")
-                else:
-                    # Stop when obstacle is detected
-                    print(f"Obstacle {obstacle_count + 1} detected! Stopping...")
-                    self.stop()
-                    time.sleep(1)
-
-                    # Determine the turn direction based on the route
-                    turn_direction = turns[obstacle_count]
-                    if turn_direction == "left":
-                        print("Turning LEFT...")
-                        self.move(dir_left=1, dir_right=0, speed=speed) 
-                        time.sleep(0.6)
-                        self.stop()
-                        time.sleep(0.5)
-                        self.mdev.setServo("3",130)
-                        time.sleep(0.5)
-                        self.move(dir_left=0, dir_right=0, speed=600)  # Turn left
-                        time.sleep(2.1) 
-                        
-                    elif turn_direction == "right":
-                        print("Turning RIGHT...")
-                        self.move(dir_left=1, dir_right=0, speed=speed) 
-                        time.sleep(0.6)
-                        self.stop()
-                        time.sleep(0.5)
-                        self.mdev.setServo("3",50)
-                        time.sleep(0.5)
-                        self.move(dir_left=1, dir_right=1, speed=600)  # Turn right
-                        time.sleep(2.1) 
-
-                    
-                    #time.sleep(2.45)  
-                    
-                   
-                    self.stop()
-                    print("Turn completed. Rechecking distance...")
-                    time.sleep(1) 
-
-                    # Increment the obstacle counter
-                    obstacle_count += 1
+                    driving = True
+            else:
+                # Stop when obstacle is detected
+                print(f"Obstacle {obstacle_count + 1} detected at {distance:.2f} cm! Stopping...")
+                driving = False
+                runner.start(route_turn(), now)
+            return True
 
+        print("Starting predefined route navigation...")
+        
+        try:
+            scheduler.run(step)
         except KeyboardInterrupt:
             print("Navigation stopped by user.")
             self.stop()
+        scheduler.print_stats()
 
 
 
@@ -0,0 +1,163 @@
+"""
+Asyncio (ASGI) variant of the /upload API of car_control.py.
+Request bodies are received on the event loop, so a slow upload over Wi-Fi holds no thread.
+Decoding and inference run on a bounded thread pool. Requests in progress (body being received,
+decoded or classified) are limited to MAX_PENDING, the next ones are answered 503 with Retry-After
+before their body is read, so slow clients cannot make the server buffer bodies without limit.
+Needs starlette, python-multipart and uvicorn (pip install starlette python-multipart uvicorn).
+Usage: python async_server.py [--port 9090]
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+try:
+    import uvicorn
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse, PlainTextResponse
+    from starlette.routing import Route
+except ImportError:
+    sys.exit("async_server.py needs starlette, python-multipart and uvicorn: "
+             "pip install starlette python-multipart uvicorn")
+
+import car_control
+from car_control import classify_image, crop_roi, decode_image, model
+from metrics import StageTimer, metrics
+
+EXECUTOR_THREADS = int(os.environ.get("EXECUTOR_THREADS", "8"))  # Threads decoding and waiting for the model
+MAX_PENDING = int(os.environ.get("MAX_PENDING", "64"))  # Requests received or classified at once before answering 503
+RETRY_AFTER = "1"  # Seconds the client should wait after a 503
+
+executor = ThreadPoolExecutor(EXECUTOR_THREADS, thread_name_prefix="inference")
+pending = 0  # Requests from the start of the body to the answer, only changed on the event loop thread
+metrics.gauge("pending_requests", lambda: pending)
+
+
+def classify(data, roi_applied, loaded, timer):
+    """
+    Decode, preprocess and classify an uploaded image (runs on the executor).
+    :param loaded: LoadedModel held with model.use() by the request.
+    :param timer: StageTimer of the request.
+    :return: Predicted class index, or None if the data is not a valid image.
+    """
+    with timer.stage("decode"):
+        image = decode_image(data)
+        if image is not None and not roi_applied:
+            image = crop_roi(image)  # Full camera frame, the client did not crop it
+    if image is None:
+        return None
+    return int(np.argmax(classify_image(image, loaded, timer)))
+
+
+def answer(content, status_code, start, timer=None, headers=None):
+    """
+    Count the request and answer it, with a Server-Timing header when stages were timed.
+    """
+    metrics.inc("requests_total", endpoint="upload", status=status_code)
+    total = time.perf_counter() - start
+    metrics.observe("request_seconds", total, endpoint="upload")
+    headers = dict(headers or {})
+    if timer is not None and timer.stages:
+        headers["Server-Timing"] = f"{timer.server_timing()}, total;dur={total * 1000.0:.2f}"
+    return JSONResponse(content, status_code=status_code, headers=headers)
+
+
+async def upload(request):
+    """
+    Same request and answer as /upload in car_control.py.
+    """
+    global pending
+    start = time.perf_counter()
+    if not model.ready.is_set():
+        return answer({"error": "Model is loading"}, 503, start, headers={"Retry-After": RETRY_AFTER})
+    if pending >= MAX_PENDING:  # Rejected before the body is received
+        metrics.inc("errors_total", endpoint="upload", reason="overloaded")
+        return answer({"error": "Server overloaded"}, 503, start, headers={"Retry-After": RETRY_AFTER})
+
+    pending += 1
+    try:
+        timer = StageTimer(metrics)
+        with timer.stage("receive"):  # Includes the time the client takes to send the body
+            form = await request.form()  # The body is received without blocking a thread
+            file = form.get("file")
+            if file is None or isinstance(file, str) or file.filename == '':
+                metrics.inc("errors_total", endpoint="upload", reason="no_file")
+                return answer({"error": "No file part" if file is None else "No selected file"}, 400, start, timer)
+            data = await file.read()
+
+        if car_control.archiver is not None:
+            with timer.stage("save"):
+                car_control.archiver.submit(data)  # Saved in the background, never blocks the response
+
+        roi_applied = request.headers.get("X-ROI-Applied") == "1"
+        with model.use() as loaded:  # Same model for the whole request, even if another one is activated
+            predicted_class = await asyncio.get_running_loop().run_in_executor(executor, classify, data,
+                                                                               roi_applied, loaded, timer)
+    finally:
+        pending -= 1
+    if predicted_class is None:
+        metrics.inc("errors_total", endpoint="upload", reason="invalid_image")
+        return answer({"error": "Invalid image"}, 400, start, timer)
+
+    response = loaded.commands.get(predicted_class, "ff")
+    car_control.logger.debug("Predicted class: %d, Command: %s", predicted_class, response)
+    return answer(response, 200, start, timer)
+
+
+async def config(request):
+    if not model.ready.is_set():
+        return JSONResponse({"error": "Model is loading"}, status_code=503, headers={"Retry-After": RETRY_AFTER})
+    return JSONResponse({"input_size": list(model.current.input_size), "roi": list(car_control.ROI)})
+
+
+async def get_metrics(request):
+    return PlainTextResponse(metrics.export(), media_type="text/plain; version=0.0.4")
+
+
+async def healthz(request):
+    return JSONResponse({"status": "ok"})
+
+
+async def readyz(request):
+    if not model.ready.is_set():
+        return JSONResponse({"status": "loading"}, status_code=503)
+    loaded = model.current
+    return JSONResponse({"status": "ready", "version": loaded.version, "backend": loaded.backend.name,
+                         "pid": os.getpid(), "pending": pending})
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    car_control.create_app(background=True)  # /readyz answers 503 until the model is warmed up
+    yield
+    executor.shutdown(wait=False)
+
+
+app = Starlette(
+    routes=[
+        Route("/upload", upload, methods=["POST"]),
+        Route("/config", config, methods=["GET"]),
+        Route("/metrics", get_metrics, methods=["GET"]),
+        Route("/healthz", healthz, methods=["GET"]),
+        Route("/readyz", readyz, methods=["GET"]),
+    ],
+    lifespan=lifespan,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=9090)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
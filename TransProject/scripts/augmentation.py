@@ -0,0 +1,78 @@
+import math
+import time
+
+import tensorflow as tf
+
+# Mêmes plages que l'ancien ImageDataGenerator
+ROTATION_RANGE = 10  # Rotation aléatoire de -10° à 10°
+WIDTH_SHIFT_RANGE = 0.1  # Décalage horizontal (fraction de la largeur)
+HEIGHT_SHIFT_RANGE = 0.1  # Décalage vertical (fraction de la hauteur)
+ZOOM_RANGE = 0.1  # Zoom aléatoire entre 0.9 et 1.1
+SHEAR_RANGE = 0.2  # Cisaillement aléatoire (degrés, comme ImageDataGenerator)
+
+
+def _matrices(*rows):
+    # Construire un lot de matrices 3x3 à partir de 9 tenseurs (N,)
+    return tf.reshape(tf.stack(rows, axis=1), [-1, 3, 3])
+
+
+def augment_batch(images, labels, horizontal_flip=False, no_flip_classes=()):
+    """
+    Appliquer rotation, décalage, zoom, cisaillement (et flip horizontal éventuel) sur un lot
+    entier en une seule transformation projective. Une nouvelle transformation est tirée pour
+    chaque image à chaque appel, donc à chaque époque.
+    Le flip horizontal n'est jamais appliqué aux classes de no_flip_classes (gauche/droite).
+    """
+    shape = tf.shape(images)
+    n = shape[0]
+    height = tf.cast(shape[1], tf.float32)
+    width = tf.cast(shape[2], tf.float32)
+    ones = tf.ones([n])
+    zeros = tf.zeros([n])
+
+    theta = tf.random.uniform([n], -ROTATION_RANGE, ROTATION_RANGE) * math.pi / 180.0
+    shear = tf.random.uniform([n], -SHEAR_RANGE, SHEAR_RANGE) * math.pi / 180.0
+    zoom_x = tf.random.uniform([n], 1.0 - ZOOM_RANGE, 1.0 + ZOOM_RANGE)
+    zoom_y = tf.random.uniform([n], 1.0 - ZOOM_RANGE, 1.0 + ZOOM_RANGE)
+    shift_x = tf.random.uniform([n], -WIDTH_SHIFT_RANGE, WIDTH_SHIFT_RANGE) * width
+    shift_y = tf.random.uniform([n], -HEIGHT_SHIFT_RANGE, HEIGHT_SHIFT_RANGE) * height
+
+    flip = ones
+    if horizontal_flip:
+        classes = tf.argmax(labels, axis=1, output_type=tf.int32)
+        allowed = tf.reduce_all(tf.not_equal(classes[:, None], tf.constant(list(no_flip_classes) or [-1])), axis=1)
+        flipped = tf.logical_and(allowed, tf.random.uniform([n]) < 0.5)
+        flip = tf.where(flipped, -ones, ones)
+
+    # Matrices sortie -> entrée, centrées sur le milieu de l'image
+    cx, cy = (width - 1.0) / 2.0, (height - 1.0) / 2.0
+    center = _matrices(ones, zeros, cx * ones, zeros, ones, cy * ones, zeros, zeros, ones)
+    uncenter = _matrices(ones, zeros, -cx * ones, zeros, ones, -cy * ones, zeros, zeros, ones)
+    rotation = _matrices(tf.cos(theta), -tf.sin(theta), zeros, tf.sin(theta), tf.cos(theta), zeros, zeros, zeros, ones)
+    shearing = _matrices(ones, -tf.sin(shear), zeros, zeros, tf.cos(shear), zeros, zeros, zeros, ones)
+    scaling = _matrices(zoom_x * flip, zeros, zeros, zeros, zoom_y, zeros, zeros, zeros, ones)
+    shift = _matrices(ones, zeros, shift_x, zeros, ones, shift_y, zeros, zeros, ones)
+    transform = center @ rotation @ shearing @ scaling @ uncenter @ shift
+
+    transforms = tf.reshape(transform, [-1, 9])[:, :8]
+    augmented = tf.raw_ops.ImageProjectiveTransformV3(
+        images=images,
+        transforms=transforms,
+        output_shape=shape[1:3],
+        fill_value=0.0,
+        interpolation='BILINEAR',
+        fill_mode='NEAREST',  # Comme ImageDataGenerator
+    )
+    return augmented, labels
+
+
+def measure_throughput(ds, batches=50):
+    """
+    Mesurer le débit d'un pipeline tf.data en images/s (sans le modèle).
+    """
+    count = 0
+    start = time.perf_counter()
+    for x, _ in ds.take(batches):
+        count += int(x.shape[0])
+    elapsed = time.perf_counter() - start
+    return count / elapsed if elapsed > 0 else float('inf')
@@ -0,0 +1,107 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class BatchScheduler:
+    """
+    Groups concurrent inference requests into a single forward pass of the model.
+    A request that finds no other one queued is run at once, so a single client never waits.
+    Otherwise the batch is flushed as soon as it reaches max_batch_size or when the oldest
+    request has waited max_wait_ms, whichever comes first; requests arriving during a forward
+    pass queue up and form the next batch.
+    """
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=5.0):
+        """
+        :param predict_fn: Function taking a batch (N, H, W, C) and returning N prediction vectors.
+        :param max_batch_size: Maximum number of images per forward pass (1 disables batching).
+        :param max_wait_ms: Maximum time the first request of a batch waits for others.
+        """
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max_wait_ms / 1000.0
+        self.requests = queue.Queue()
+        self.lock = threading.Lock()  # Orders submit() and stop(): nothing is queued after the stop
+        self.stopped = False
+        self.worker = threading.Thread(target=self._run, name="batch-scheduler", daemon=True)
+        self.worker.start()
+
+    def submit(self, image):
+        """
+        Queue a preprocessed image for inference.
+        :param image: Preprocessed image with a batch dimension of 1 (as returned by preprocess_image).
+        :return: Future resolved with the prediction vector of this image.
+        :raises RuntimeError: If the scheduler is stopped.
+        """
+        future = Future()
+        with self.lock:
+            if self.stopped:
+                raise RuntimeError("Batch scheduler stopped")
+            self.requests.put((image, future))
+        return future
+
+    def predict(self, image, timeout=None):
+        """
+        Run inference on one image and wait for its result.
+        :param image: Preprocessed image with a batch dimension of 1.
+        :param timeout: Maximum time to wait in seconds (None waits forever).
+        :return: Prediction vector of the image.
+        """
+        return self.submit(image).result(timeout)
+
+    def stop(self):
+        """
+        Stop the scheduler once the requests already queued have been served. Later submissions
+        raise RuntimeError instead of waiting forever behind the stop.
+        """
+        with self.lock:
+            if self.stopped:
+                return
+            self.stopped = True
+            self.requests.put(None)
+        self.worker.join()
+
+    def _collect(self):
+        first = self.requests.get()
+        if first is None:
+            return None
+        batch = [first]
+        if self.requests.empty():
+            return batch  # Alone: no reason to wait for requests that may never come
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self.requests.put(None)  # Stop after serving the current batch
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            futures = [future for _, future in batch]
+            try:
+                images = np.concatenate([image for image, _ in batch], axis=0)
+                outputs = np.asarray(self.predict_fn(images))
+                if outputs.ndim == 0 or len(outputs) != len(futures):
+                    raise ValueError(f"Model returned {outputs.shape[0] if outputs.ndim else 'no'} rows "
+                                     f"for a batch of {len(futures)}")
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            # Route each row of the batch back to the request waiting for it
+            for future, output in zip(futures, outputs):
+                future.set_result(output)
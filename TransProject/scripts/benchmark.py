@@ -0,0 +1,374 @@
+"""
+Benchmarks for the vision server.
+Usage: python benchmark.py <benchmark> [options]  (python benchmark.py -h for the list)
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+CONCURRENCY_LEVELS = (1, 4, 16)
+
+
+def load_payload(image_path=None):
+    """
+    Load the JPEG bytes sent by the simulated clients.
+    :param image_path: Image to send, a random camera-sized frame is used when None.
+    :return: Encoded JPEG bytes.
+    """
+    if image_path:
+        with open(image_path, "rb") as f:
+            return f.read()
+    frame = np.random.randint(0, 256, (375, 500, 3), dtype=np.uint8)  # Same size as Clinet.py frames
+    _, encoded_image = cv2.imencode(".jpg", frame)
+    return encoded_image.tobytes()
+
+
+def run_clients(send, clients, requests_per_client):
+    """
+    Call send() from several threads at once and measure each call.
+    :param send: Function performing one request.
+    :param clients: Number of concurrent clients.
+    :param requests_per_client: Number of requests sent by each client.
+    :return: Tuple (requests per second, list of latencies in seconds).
+    """
+    latencies = []
+    lock = threading.Lock()
+
+    def client():
+        local = []
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            send()
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, latencies
+
+
+def print_result(label, clients, throughput, latencies):
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000.0
+    print(f"{label:<28} clients={clients:<3} {throughput:8.1f} req/s  p50={p50:8.2f} ms  p99={p99:8.2f} ms")
+
+
+def bench_batching(args):
+    """
+    Compare /upload with and without micro-batching at several concurrency levels.
+    """
+    import car_control
+    from batching import BatchScheduler
+
+    payload = load_payload(args.image)
+    car_control.create_app()
+
+    def send():
+        response = car_control.app.test_client().post(
+            "/upload",
+            data={"file": (io.BytesIO(payload), "photo.jpg")},
+            content_type="multipart/form-data",
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"Server returned status code {response.status_code}")
+
+    configs = (("no batching", 1), (f"batching (max {args.max_batch_size})", args.max_batch_size))
+    for label, max_batch_size in configs:
+        loaded = car_control.model.current
+        loaded.scheduler.stop()
+        loaded.scheduler = BatchScheduler(loaded.run_model, max_batch_size, args.max_wait_ms)
+        with contextlib.redirect_stdout(io.StringIO()):  # Silence the per-request server prints
+            send()  # Warm-up
+        for clients in CONCURRENCY_LEVELS:
+            with contextlib.redirect_stdout(io.StringIO()):
+                throughput, latencies = run_clients(send, clients, max(1, args.requests // clients))
+            print_result(label, clients, throughput, latencies)
+
+
+def measure_latency(predict, image, runs):
+    """
+    Time single-image inference calls.
+    :return: List of latencies in seconds.
+    """
+    predict(image)  # Warm-up
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        predict(image)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def print_latency(label, latencies):
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000.0
+    print(f"{label:<28} p50={p50:8.3f} ms  p99={p99:8.3f} ms  ({1.0 / np.mean(latencies):8.1f} frames/s)")
+
+
+def bench_backends(args):
+    """
+    Per-frame CPU latency of model.predict against each inference backend.
+    """
+    from keras.models import load_model
+    from inference_backends import BACKENDS, create_backend
+
+    model = load_model(args.model)
+    image = np.random.default_rng(42).random((1,) + tuple(model.input_shape[1:]), dtype=np.float32)
+    print_latency("keras model.predict", measure_latency(lambda x: model.predict(x, verbose=0), image, args.runs))
+    for name in BACKENDS:
+        backend = create_backend(name, args.model, num_threads=args.threads)
+        print_latency(name, measure_latency(backend.predict, image, args.runs))
+
+
+def import_client_modules():
+    """
+    Make the Raspberry Pi client modules (Client/) importable.
+    """
+    client_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Client")
+    if client_dir not in sys.path:
+        sys.path.insert(0, client_dir)
+
+
+def pipelined_throughput(classifier, frame, count, window):
+    """
+    Frames/s when the client keeps up to window frames in flight on the streaming channel.
+    """
+    sent = received = 0
+    start = time.perf_counter()
+    while received < count:
+        while sent < count and sent - received < window:
+            classifier.send_frame(frame)
+            sent += 1
+        classifier.receive_result()
+        received += 1
+    return count / (time.perf_counter() - start)
+
+
+def bench_stream(args):
+    """
+    Loopback comparison of the HTTP /upload path and the TCP streaming channel.
+    """
+    from werkzeug.serving import make_server
+    import car_control
+    from stream_server import start_stream_server
+    import_client_modules()
+    from remote_inference import RemoteClassifier
+    from stream_client import StreamClassifier
+
+    frame = cv2.imdecode(np.frombuffer(load_payload(args.image), dtype=np.uint8), cv2.IMREAD_COLOR)
+    with contextlib.redirect_stdout(io.StringIO()):
+        http_server = make_server("127.0.0.1", 0, car_control.create_app(), threaded=True)
+        threading.Thread(target=http_server.serve_forever, daemon=True).start()
+        stream_server = start_stream_server("127.0.0.1", 0, car_control.classify_stream_frame)
+        stream_port = stream_server.server_address[1]
+        classifiers = (
+            ("HTTP /upload (JPEG)", RemoteClassifier(f"http://127.0.0.1:{http_server.server_port}")),
+            ("stream (JPEG)", StreamClassifier("127.0.0.1", stream_port)),
+            ("stream (raw model size)", StreamClassifier("127.0.0.1", stream_port, raw_size=car_control.model.current.input_size)),
+        )
+
+    for label, classifier in classifiers:
+        with contextlib.redirect_stdout(io.StringIO()):  # The classifiers print on every frame
+            classifier.classify(frame)  # Warm-up and connection setup
+            throughput, latencies = run_clients(lambda: classifier.classify(frame), 1, args.frames)
+        print_result(label, 1, throughput, latencies)
+    for label, classifier in classifiers[1:]:
+        fps = pipelined_throughput(classifier, frame, args.frames, args.window)
+        print(f"{label + f' {args.window} in flight':<28} {fps:8.1f} frames/s")
+
+    http_server.shutdown()
+    stream_server.shutdown()
+
+
+def wait_ready(url, workers, timeout):
+    """
+    Poll /readyz until it succeeds on several fresh connections in a row, so that every worker
+    is likely to have finished its warm-up.
+    """
+    import requests
+
+    deadline = time.monotonic() + timeout
+    successes = 0
+    while successes < 2 * workers:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Server not ready after {timeout} s")
+        try:
+            successes = successes + 1 if requests.get(f"{url}/readyz", timeout=1.0).status_code == 200 else 0
+        except requests.ConnectionError:
+            successes = 0
+        if successes == 0:
+            time.sleep(0.5)
+
+
+@contextlib.contextmanager
+def running_server(script, options, port, workers=1, startup_timeout=120.0):
+    """
+    Run a server script of this folder in a subprocess until the block exits.
+    :param options: Extra command line arguments of the script.
+    :return: URL of the server, once /readyz succeeds.
+    """
+    import subprocess
+
+    folder = os.path.dirname(os.path.abspath(__file__))
+    url = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen([sys.executable, os.path.join(folder, script), "--host", "127.0.0.1",
+                               "--port", str(port)] + list(options),
+                              cwd=folder, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(url, workers, startup_timeout)
+        yield url
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def upload_sender(url, payload):
+    """
+    :return: Function posting payload to url/upload, with one keep-alive connection per thread.
+    """
+    import requests
+
+    sessions = threading.local()
+
+    def send():
+        if not hasattr(sessions, "session"):
+            sessions.session = requests.Session()
+        response = sessions.session.post(f"{url}/upload", files={"file": ("photo.jpg", payload, "image/jpeg")})
+        if response.status_code != 200:
+            raise RuntimeError(f"Server returned status code {response.status_code}")
+    return send
+
+
+def bench_serving(args):
+    """
+    /upload throughput of serve.py (gunicorn pre-forked workers) for several worker counts.
+    """
+    payload = load_payload(args.image)
+    baseline = None
+    for workers in args.workers:
+        with running_server("serve.py", ["--workers", str(workers)], args.port, workers, args.startup_timeout) as url:
+            send = upload_sender(url, payload)
+            run_clients(send, args.clients, 2)  # Warm-up the connections
+            throughput, latencies = run_clients(send, args.clients, max(1, args.requests // args.clients))
+        baseline = baseline or throughput
+        print_result(f"{workers} worker(s) x{throughput / baseline:.2f}", args.clients, throughput, latencies)
+
+
+def slow_upload(port, payload, seconds, chunks=20):
+    """
+    Post payload to /upload over a raw socket, spreading the body over seconds like a car on
+    a weak Wi-Fi link.
+    :return: HTTP status code of the answer, or None if the connection failed.
+    """
+    import socket
+
+    boundary = "benchmarkboundary"
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"photo.jpg\"\r\n"
+            f"Content-Type: image/jpeg\r\n\r\n").encode() + payload + f"\r\n--{boundary}--\r\n".encode()
+    head = (f"POST /upload HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n"
+            f"Content-Type: multipart/form-data; boundary={boundary}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n").encode()
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=seconds + 30.0) as sock:
+            sock.sendall(head)
+            size = -(-len(body) // chunks)
+            for offset in range(0, len(body), size):
+                sock.sendall(body[offset:offset + size])
+                time.sleep(seconds / chunks)
+            status_line = sock.makefile("rb").readline().split()
+            return int(status_line[1]) if len(status_line) > 1 else None
+    except OSError:
+        return None
+
+
+def bench_slow_clients(args):
+    """
+    Latency of fast clients while many slow clients trickle their uploads, for the gunicorn
+    server (serve.py, threads held during uploads) and the asyncio server (async_server.py).
+    """
+    from collections import Counter
+
+    payload = load_payload(args.image)
+    servers = (
+        (f"serve.py 1 worker x {args.threads} threads", "serve.py", ["--workers", "1", "--threads", str(args.threads)]),
+        ("async_server.py", "async_server.py", []),
+    )
+    for label, script, options in servers:
+        with running_server(script, options, args.port, 1, args.startup_timeout) as url:
+            send = upload_sender(url, payload)
+            send()  # Warm-up
+            results = []  # list.append is thread-safe
+            slow = [threading.Thread(target=lambda: results.append(slow_upload(args.port, payload, args.upload_seconds)))
+                    for _ in range(args.slow_clients)]
+            for thread in slow:
+                thread.start()
+            time.sleep(0.5)  # Let the slow uploads start
+            throughput, latencies = run_clients(send, args.clients, args.requests // args.clients)
+            for thread in slow:
+                thread.join()
+        statuses = Counter(results)
+        print_result(label, args.clients, throughput, latencies)
+        print(f"{'':<28} slow clients ({args.slow_clients}, {args.upload_seconds} s uploads): "
+              + ", ".join(f"{status}: {count}" for status, count in sorted(statuses.items(), key=str)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    batching = subparsers.add_parser("batching", help="/upload throughput and latency with and without micro-batching")
+    batching.add_argument("--image", help="JPEG image to send (random frame by default)")
+    batching.add_argument("--requests", type=int, default=320, help="Total requests per concurrency level")
+    batching.add_argument("--max-batch-size", type=int, default=16)
+    batching.add_argument("--max-wait-ms", type=float, default=5.0)
+    batching.set_defaults(func=bench_batching)
+
+    backends = subparsers.add_parser("backends", help="per-frame latency of each inference backend")
+    backends.add_argument("--model", default="../models/traffic_sign_model.h5")
+    backends.add_argument("--runs", type=int, default=500)
+    backends.add_argument("--threads", type=int, help="TFLite interpreter threads")
+    backends.set_defaults(func=bench_backends)
+
+    stream = subparsers.add_parser("stream", help="loopback frames/s and round-trip latency, HTTP against TCP streaming")
+    stream.add_argument("--image", help="JPEG image to send (random frame by default)")
+    stream.add_argument("--frames", type=int, default=300)
+    stream.add_argument("--window", type=int, default=4, help="Frames in flight for the pipelined run")
+    stream.set_defaults(func=bench_stream)
+
+    serving = subparsers.add_parser("serving", help="/upload throughput of serve.py for several worker counts")
+    serving.add_argument("--image", help="JPEG image to send (random frame by default)")
+    serving.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    serving.add_argument("--clients", type=int, default=16)
+    serving.add_argument("--requests", type=int, default=640, help="Total requests per worker count")
+    serving.add_argument("--port", type=int, default=9190)
+    serving.add_argument("--startup-timeout", type=float, default=120.0)
+    serving.set_defaults(func=bench_serving)
+
+    slow_clients = subparsers.add_parser("slow_clients", help="fast client latency during slow uploads, gunicorn against asyncio")
+    slow_clients.add_argument("--image", help="JPEG image to send (random frame by default)")
+    slow_clients.add_argument("--slow-clients", type=int, default=32)
+    slow_clients.add_argument("--upload-seconds", type=float, default=5.0, help="Duration of each slow upload")
+    slow_clients.add_argument("--clients", type=int, default=4, help="Concurrent fast clients")
+    slow_clients.add_argument("--requests", type=int, default=40, help="Total fast requests")
+    slow_clients.add_argument("--threads", type=int, default=8, help="Request threads of the gunicorn worker")
+    slow_clients.add_argument("--port", type=int, default=9190)
+    slow_clients.add_argument("--startup-timeout", type=float, default=120.0)
+    slow_clients.set_defaults(func=bench_slow_clients)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Mesurer le débit d'entraînement (images/s) de create_model() pour plusieurs réglages
+d'exécution: threads TensorFlow, compilation XLA et précision mixte bfloat16.
+Chaque réglage est lancé dans un processus séparé car les threads ne peuvent être
+configurés qu'avant l'initialisation de TensorFlow.
+Usage: python benchmark_training.py [--threads 0 4 8] [--steps 50]
+"""
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+# Mesure dans le processus enfant, réglages lus dans les variables d'environnement
+def run_worker(steps, warmup_steps):
+    import numpy as np
+    from train_model import BATCH_SIZE, IMG_HEIGHT, IMG_WIDTH, label_names, configure_runtime, create_model
+
+    configure_runtime()
+    model = create_model()
+    rng = np.random.default_rng(42)
+    x = rng.random((BATCH_SIZE, IMG_HEIGHT, IMG_WIDTH, 3), dtype=np.float32)
+    y = np.eye(len(label_names), dtype=np.float32)[rng.integers(0, len(label_names), BATCH_SIZE)]
+
+    for _ in range(warmup_steps):  # Traçage et compilation XLA hors mesure
+        model.train_on_batch(x, y)
+    start = time.perf_counter()
+    for _ in range(steps):
+        model.train_on_batch(x, y)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({'images_per_s': steps * BATCH_SIZE / elapsed}))
+
+
+def run_config(threads, inter_op_threads, jit_compile, mixed_precision, steps, warmup_steps):
+    env = dict(os.environ,
+               INTRA_OP_THREADS=str(threads),
+               INTER_OP_THREADS=str(inter_op_threads),
+               JIT_COMPILE='1' if jit_compile else '0',
+               MIXED_PRECISION='1' if mixed_precision else '0',
+               TF_CPP_MIN_LOG_LEVEL='2')
+    result = subprocess.run([sys.executable, __file__, '--worker', '--steps', str(steps), '--warmup', str(warmup_steps)],
+                            env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        return None, result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'erreur inconnue'
+    return json.loads(result.stdout.strip().splitlines()[-1])['images_per_s'], None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, nargs='+', default=[0, os.cpu_count() or 1],
+                        help="Threads intra-op à tester (0 = choix de TensorFlow)")
+    parser.add_argument('--inter-op', type=int, default=0, help="Threads inter-op (0 = choix de TensorFlow)")
+    parser.add_argument('--steps', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.steps, args.warmup)
+        sys.exit(0)
+
+    print(f"{'Threads':>8} {'XLA':>5} {'bf16':>5} {'images/s':>10}")
+    results = []
+    for threads, jit_compile, mixed_precision in itertools.product(args.threads, (False, True), (False, True)):
+        images_per_s, error = run_config(threads, args.inter_op, jit_compile, mixed_precision, args.steps, args.warmup)
+        label = f"{threads or 'auto':>8} {'oui' if jit_compile else 'non':>5} {'oui' if mixed_precision else 'non':>5}"
+        if images_per_s is None:
+            print(f"{label} {'échec':>10}  ({error})")
+            continue
+        print(f"{label} {images_per_s:>10.1f}")
+        results.append((images_per_s, threads, jit_compile, mixed_precision))
+
+    if results:
+        images_per_s, threads, jit_compile, mixed_precision = max(results)
+        print(f"\nRéglage le plus rapide: INTRA_OP_THREADS={threads} INTER_OP_THREADS={args.inter_op} JIT_COMPILE={int(jit_compile)} "
+              f"MIXED_PRECISION={int(mixed_precision)} ({images_per_s:.1f} images/s)")
@@ -1,20 +1,432 @@
+import contextlib
+import hmac
+import logging
 import os
+import queue
+import random
+import threading
+import uuid
 import cv2
 import numpy as np
-from keras.models import load_model
-from flask import Flask, request, jsonify
+import tensorflow as tf
+from flask import Flask, Response, g, request, jsonify
 import time
+from collections import deque
+import model_registry
+from batching import BatchScheduler
+from inference_backends import create_backend
+from metrics import BATCH_SIZE_BUCKETS, StageTimer, metrics
+from smoothing import UNKNOWN, create_smoothers
+from stream_server import FORMAT_JPEG, FORMAT_RAW, UNKNOWN_CLASS, start_stream_server
 
 # Flask app
 app = Flask(__name__)
+# Server messages go through logging; per-frame predictions only at debug level (LOG_LEVEL=DEBUG)
+logger = logging.getLogger("car_control")
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"))
 UPLOAD_FOLDER = './uploads'  # Relative path for uploads folder
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)  # Create upload folder if it doesn't exist
+ARCHIVE_UPLOADS = os.environ.get("ARCHIVE_UPLOADS", "0") == "1"  # Keep a copy of every frame on disk
+ARCHIVE_QUEUE_SIZE = 64  # Frames waiting to be written before new ones are dropped
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "16"))  # Images per forward pass (1 disables batching)
+MAX_BATCH_WAIT_MS = float(os.environ.get("MAX_BATCH_WAIT_MS", "5"))  # Time a request waits for others
+STREAM_PORT = int(os.environ.get("STREAM_PORT", "9091"))  # TCP frame streaming port (0 disables it)
+# Region of the camera frame containing the signs: x, y, width, height as fractions of the frame
+ROI = tuple(float(v) for v in os.environ.get("ROI", "0,0,1,1").split(","))
+SMOOTHING = os.environ.get("SMOOTHING", "ema")  # Per-session smoothing of /predict and stream results: ema, vote or none
+CONFIDENCE_THRESHOLD = float(os.environ.get("CONFIDENCE_THRESHOLD", "0.6"))  # Below it the answer is "unknown"
+EMA_ALPHA = float(os.environ.get("EMA_ALPHA", "0.5"))  # Weight of the newest frame in the moving average
+VOTE_K, VOTE_N = (int(v) for v in os.environ.get("VOTE", "3,5").split(","))  # k-of-n vote window
+SMOOTHING_MAX_AGE = float(os.environ.get("SMOOTHING_MAX_AGE", "1.0"))  # Gap in seconds that restarts the smoothing
+COMMANDS = {0: "stop", 1: "right", 2: "left"}  # Example mapping, adjust as needed
 
-# Load the pre-trained H5 model once during server startup
+# Model served at start-up: the version activated in the registry (active.json, see
+# model_registry.py), else MODEL_VERSION, else the latest registered version, or the H5 model of
+# train_model.py when the registry is empty.
+# Loaded by create_app() (after the fork in each serve.py worker)
+MODEL_VERSION = os.environ.get("MODEL_VERSION")
 MODEL_PATH = "../models/traffic_sign_model.h5"
-print("Loading the model...")
-model = load_model(MODEL_PATH)
-print("Model loaded successfully.")
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "tf_function")  # keras, tf_function or tflite
+TFLITE_PATH = os.environ.get("TFLITE_PATH")  # Converted from MODEL_PATH when not set
+TFLITE_THREADS = int(os.environ["TFLITE_THREADS"]) if "TFLITE_THREADS" in os.environ else None
+TF_THREADS = int(os.environ["TF_THREADS"]) if "TF_THREADS" in os.environ else None  # TF intra-op threads of this process
+WARMUP_RUNS = int(os.environ.get("WARMUP_RUNS", "3"))  # Inferences per batch size before reporting ready
+ACTIVE_POLL_SECONDS = float(os.environ.get("ACTIVE_POLL_SECONDS", "2"))  # Period of the active.json checks of the registry
+SHADOW_SAMPLE_RATE = float(os.environ.get("SHADOW_SAMPLE_RATE", "0.1"))  # Fraction of frames sent to the shadow model
+SHADOW_QUEUE_SIZE = 32  # Sampled frames waiting for the shadow model before new ones are dropped
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")  # Required in X-Admin-Token by the /admin endpoints when set
+
+class LoadedModel:
+    """
+    One loaded version of the model: inference backend, batch scheduler and metadata.
+    Request handlers hold the active LoadedModel with model.use() until they answer, so a swap
+    never changes the model in the middle of a request; a replaced model is closed when the last
+    request holding it is done.
+    """
+    def __init__(self, model_path, metadata=None, tflite_path=None, num_threads=None):
+        """
+        :param model_path: Keras .h5 model.
+        :param metadata: Registry metadata (see model_registry.py), None for an unregistered model.
+        :param tflite_path: TFLite model of the tflite backend, converted next to model_path when None.
+        :param num_threads: Threads of the TFLite interpreter.
+        """
+        self.metadata = metadata or {}
+        self.version = self.metadata.get("version", os.path.basename(model_path))
+        self.backend = create_backend(INFERENCE_BACKEND, model_path, tflite_path, num_threads, MAX_BATCH_SIZE)
+        self.input_size = (self.backend.input_shape[1], self.backend.input_shape[0])  # (width, height)
+        commands = self.metadata.get("commands")  # JSON keys are strings
+        self.commands = {int(k): v for k, v in commands.items()} if commands else COMMANDS
+        self.scheduler = None  # Concurrent requests share forward passes through the scheduler
+        self.lock = threading.Lock()
+        self.in_flight = 0  # Requests holding this model
+        self.retired = False  # Replaced by another version, closed once in_flight drops to 0
+
+    def warm_up(self, runs):
+        """
+        Trace the graph and fill the allocator caches before the first real request.
+        """
+        start = time.perf_counter()
+        for batch_size in sorted({1, MAX_BATCH_SIZE}):
+            batch = np.zeros((batch_size,) + tuple(self.backend.input_shape), dtype=np.float32)
+            for _ in range(runs):
+                self.backend.predict(batch)
+        logger.info("Model %s warmed up in %.2f s.", self.version, time.perf_counter() - start)
+
+    def run_model(self, batch):
+        """
+        Run a single forward pass of the model on a batch of preprocessed images.
+        :param batch: Preprocessed images (N, H, W, C).
+        :return: Prediction vectors (N, num_classes).
+        """
+        metrics.observe("batch_size", len(batch), BATCH_SIZE_BUCKETS)
+        return self.backend.predict(batch)
+
+    def start(self):
+        self.scheduler = BatchScheduler(self.run_model, MAX_BATCH_SIZE, MAX_BATCH_WAIT_MS)
+        return self
+
+    def acquire(self):
+        """
+        :return: False if the model was replaced, True if the caller now holds it and must release() it.
+        """
+        with self.lock:
+            if self.retired:
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+            drained = self.retired and self.in_flight == 0
+        if drained:
+            self.close()
+
+    def retire(self):
+        """
+        Close the model once the requests holding it are done (at once if there are none).
+        """
+        with self.lock:
+            self.retired = True
+            drained = self.in_flight == 0
+        if drained:
+            self.close()
+
+    def close(self):
+        """
+        Stop the scheduler once the requests already queued have been served.
+        """
+        self.scheduler.stop()
+        logger.info("Model %s released.", self.version)
+
+    def describe(self):
+        return dict(self.metadata, version=self.version, backend=self.backend.name,
+                    input_size=list(self.input_size))
+
+class ShadowModel:
+    """
+    Candidate model run on a sample of the live traffic. Sampled frames are classified by a
+    background thread, off the request path, and its answers and latency are compared with
+    those of the active model. The candidate shares the CPU with the active model, so keep the
+    sample rate low on small machines.
+    """
+    def __init__(self, loaded, sample_rate=SHADOW_SAMPLE_RATE, max_pending=SHADOW_QUEUE_SIZE, history=1000):
+        """
+        :param loaded: Warmed up LoadedModel of the candidate.
+        :param sample_rate: Fraction of the frames classified by the candidate.
+        :param max_pending: Maximum number of sampled frames waiting for the candidate.
+        :param history: Number of recent latencies kept for the statistics.
+        """
+        self.model = loaded
+        self.sample_rate = sample_rate
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.lock = threading.Lock()
+        self.samples = 0
+        self.agreements = 0
+        self.dropped = 0
+        self.active_latencies = deque(maxlen=history)  # Seconds, preprocessing and inference
+        self.shadow_latencies = deque(maxlen=history)
+        self.worker = threading.Thread(target=self._run, name="shadow-model", daemon=True)
+        self.worker.start()
+
+    def offer(self, image, active_class, active_latency):
+        """
+        Queue a frame for the candidate if it is sampled. Never blocks the request.
+        :param image: Frame cropped to the ROI, not preprocessed (the candidate may expect another size).
+        :param active_class: Class predicted by the active model.
+        :param active_latency: Seconds the active model took to preprocess and classify the frame.
+        """
+        if random.random() >= self.sample_rate:
+            return
+        try:
+            self.pending.put_nowait((image, active_class, active_latency))
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+
+    def _run(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                return
+            image, active_class, active_latency = item
+            start = time.perf_counter()
+            shadow_class = predict_class(preprocess_image(image, self.model.input_size), self.model.scheduler)
+            shadow_latency = time.perf_counter() - start
+            with self.lock:
+                self.samples += 1
+                self.agreements += shadow_class == active_class
+                self.active_latencies.append(active_latency)
+                self.shadow_latencies.append(shadow_latency)
+
+    def stop(self):
+        """
+        Stop the worker after the queued frames, then release the candidate.
+        """
+        self.pending.put(None)
+        self.worker.join()
+        self.model.close()
+
+    def stats(self):
+        """
+        :return: Dict with the version, compared samples, agreement rate, dropped frames and the
+                 p50/p99 latency of both models in milliseconds.
+        """
+        def percentile(values, q):
+            values = sorted(values)
+            return values[min(len(values) - 1, int(q * len(values)))] * 1000.0 if values else 0.0
+        with self.lock:
+            active, shadow = list(self.active_latencies), list(self.shadow_latencies)
+            return {
+                "version": self.model.version,
+                "sample_rate": self.sample_rate,
+                "samples": self.samples,
+                "agreement": self.agreements / self.samples if self.samples else None,
+                "dropped": self.dropped,
+                "active_p50_ms": percentile(active, 0.5),
+                "active_p99_ms": percentile(active, 0.99),
+                "shadow_p50_ms": percentile(shadow, 0.5),
+                "shadow_p99_ms": percentile(shadow, 0.99),
+            }
+
+class VisionModel:
+    """
+    Model slot of this process: the active LoadedModel and an optional shadow candidate.
+    Loaded explicitly by load() instead of at import time, so that each pre-forked worker loads
+    its own copy after the fork. Other versions are loaded and warmed up beside the active one,
+    then swapped in with a single assignment.
+    Every process follows active.json of the registry (see watch()), so a version activated
+    through any worker, or with python model_registry.py activate, is served by all of them.
+    """
+    def __init__(self):
+        self.current = None  # Active LoadedModel
+        self.shadow = None  # ShadowModel or None
+        self.ready = threading.Event()  # Set once the first model is loaded and warmed up
+        self.swap_lock = threading.Lock()  # One model loads at a time
+        self.tf_threads = TF_THREADS
+        self.warmup_runs = WARMUP_RUNS
+
+    def load(self, tf_threads=TF_THREADS, warmup_runs=WARMUP_RUNS, version=MODEL_VERSION):
+        """
+        Load the first model, start its batch scheduler and run warm-up inferences.
+        :param tf_threads: TensorFlow intra-op threads (and TFLite threads when TFLITE_THREADS is
+                           not set), so that several workers do not oversubscribe the cores.
+        :param warmup_runs: Inferences run at batch size 1 and MAX_BATCH_SIZE before ready is set.
+        :param version: Registry version when none is activated in active.json, the latest when None.
+        """
+        if tf_threads:
+            tf.config.threading.set_intra_op_parallelism_threads(tf_threads)
+            tf.config.threading.set_inter_op_parallelism_threads(1)
+        self.tf_threads, self.warmup_runs = tf_threads, warmup_runs
+        with self.swap_lock:
+            self.current = self._load_version(model_registry.read_active().get("version") or version)
+        self.ready.set()
+
+    def _load_version(self, version):
+        entry = model_registry.resolve(version)
+        logger.info("Loading the model %s...", version or "(latest)")
+        if entry is None:  # Empty registry: model saved by train_model.py
+            loaded = LoadedModel(MODEL_PATH, tflite_path=TFLITE_PATH, num_threads=TFLITE_THREADS or self.tf_threads)
+        else:
+            model_path, metadata = entry
+            loaded = LoadedModel(model_path, metadata, num_threads=TFLITE_THREADS or self.tf_threads)
+        logger.info("Model %s loaded successfully (%s backend).", loaded.version, loaded.backend.name)
+        loaded.warm_up(self.warmup_runs)
+        return loaded.start()
+
+    def activate(self, version):
+        """
+        Load and warm up a version, then make it the active model. Requests already holding the
+        previous model finish on it; it is stopped when the last of them is done.
+        :param version: Registry version, the latest when None.
+        """
+        with self.swap_lock:
+            loaded = self._load_version(version)
+            previous, self.current = self.current, loaded
+        logger.info("Model %s active, replacing %s.", loaded.version, previous.version)
+        previous.retire()
+
+    @contextlib.contextmanager
+    def use(self):
+        """
+        Hold the active LoadedModel for the duration of a request:
+            with model.use() as loaded:
+                ...
+        """
+        loaded = self.current
+        while not loaded.acquire():  # Replaced meanwhile, self.current is already the new one
+            loaded = self.current
+        try:
+            yield loaded
+        finally:
+            loaded.release()
+
+    def start_shadow(self, version, sample_rate=SHADOW_SAMPLE_RATE):
+        """
+        Load and warm up a version, then run it in shadow mode, replacing the previous candidate.
+        """
+        with self.swap_lock:
+            candidate = ShadowModel(self._load_version(version), sample_rate)
+            previous, self.shadow = self.shadow, candidate
+        logger.info("Model %s in shadow mode on %.0f%% of the frames.", candidate.model.version, sample_rate * 100.0)
+        if previous is not None:
+            previous.stop()
+
+    def stop_shadow(self):
+        with self.swap_lock:
+            previous, self.shadow = self.shadow, None
+        if previous is not None:
+            logger.info("Shadow model %s stopped: %s", previous.model.version, previous.stats())
+            previous.stop()
+
+    def apply(self, state):
+        """
+        Load the active version and shadow candidate of active.json that this process does not serve yet.
+        :param state: Content of active.json (see model_registry.read_active).
+        """
+        version = state.get("version")
+        if version and version != self.current.version:
+            self.activate(version)
+        wanted, shadow = state.get("shadow"), self.shadow
+        if wanted is None:
+            self.stop_shadow()
+        elif shadow is None or (shadow.model.version, shadow.sample_rate) != (wanted["version"], wanted["sample"]):
+            self.start_shadow(wanted["version"], wanted["sample"])
+
+    def watch(self, interval=ACTIVE_POLL_SECONDS):
+        """
+        Follow active.json of the registry on a background thread, checked every interval seconds
+        once the first model is ready.
+        """
+        threading.Thread(target=self._watch, args=(interval,), name="model-watcher", daemon=True).start()
+
+    def _watch(self, interval):
+        self.ready.wait()
+        seen = None
+        while True:
+            stamp = model_registry.active_stamp()
+            if stamp != seen:
+                seen = stamp
+                try:
+                    self.apply(model_registry.read_active())
+                except Exception as e:  # Keep serving the current model, retried at the next change
+                    logger.error("Cannot apply %s: %s", model_registry.ACTIVE_FILENAME, e)
+            time.sleep(interval)
+
+model = VisionModel()
+
+# Smoothed predictions of each car, keyed by the X-Session-Id header or the stream connection
+smoothers = create_smoothers(SMOOTHING, CONFIDENCE_THRESHOLD, EMA_ALPHA, VOTE_K, VOTE_N, SMOOTHING_MAX_AGE)
+
+class UploadArchiver:
+    """
+    Background sink writing received frames to disk without blocking the request thread.
+    """
+    def __init__(self, folder, max_pending=ARCHIVE_QUEUE_SIZE):
+        """
+        :param folder: Directory where the frames are written.
+        :param max_pending: Maximum number of frames waiting to be written.
+        """
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)  # Create upload folder if it doesn't exist
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.worker = threading.Thread(target=self._run, name="upload-archiver", daemon=True)
+        self.worker.start()
+
+    def submit(self, data):
+        """
+        Queue the raw bytes of a frame for archiving. Frames are dropped when the queue is full.
+        :param data: Encoded image bytes as received from the client.
+        """
+        try:
+            self.pending.put_nowait(data)
+        except queue.Full:
+            logger.warning("Archive queue full, frame not saved")
+
+    def _run(self):
+        while True:
+            data = self.pending.get()
+            # Nanosecond timestamp plus a random suffix so concurrent uploads never collide
+            filename = f"{time.time_ns()}_{uuid.uuid4().hex[:8]}.jpg"
+            filepath = os.path.join(self.folder, filename)
+            try:
+                with open(filepath, "wb") as f:
+                    f.write(data)
+            except OSError as e:
+                logger.error("Error archiving frame to %s: %s", filepath, e)
+            finally:
+                self.pending.task_done()
+
+archiver = UploadArchiver(UPLOAD_FOLDER) if ARCHIVE_UPLOADS else None
+
+# Queue depths, read when /metrics is scraped
+metrics.gauge("batch_queue_depth", lambda: model.current.scheduler.requests.qsize())
+if archiver is not None:
+    metrics.gauge("archive_queue_depth", archiver.pending.qsize)
+
+# Function to decode an uploaded image directly from memory
+def decode_image(data):
+    """
+    Decode an encoded image (JPEG, PNG, ...) from its in-memory buffer.
+    :param data: Encoded image bytes.
+    :return: Decoded BGR image (numpy array) or None if the data is not a valid image.
+    """
+    buffer = np.frombuffer(data, dtype=np.uint8)  # Zero-copy view over the request body
+    if buffer.size == 0:
+        return None
+    return cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+
+# Function to crop the region of interest of a camera frame
+def crop_roi(image, roi=ROI):
+    """
+    Crop the region of interest of a frame.
+    :param image: Input image (numpy array).
+    :param roi: (x, y, width, height) as fractions of the frame size.
+    :return: Cropped image (a view, no copy).
+    """
+    h, w = image.shape[:2]
+    x0, y0 = int(roi[0] * w), int(roi[1] * h)
+    x1, y1 = int((roi[0] + roi[2]) * w), int((roi[1] + roi[3]) * h)
+    return image[y0:max(y1, y0 + 1), x0:max(x1, x0 + 1)]
 
 # Function to preprocess an image for the model
 def preprocess_image(image, target_size=(64, 64)):
@@ -29,52 +441,309 @@ def preprocess_image(image, target_size=(64, 64)):
     return np.expand_dims(img, axis=0)  # Add batch dimension
 
 # Function to predict the class of an image
-def predict_class(image, model):
+def predict_class(image, scheduler):
     """
     Predict the class of the given image using the model.
     :param image: Preprocessed image (numpy array).
-    :param model: Loaded model for prediction.
+    :param scheduler: Batch scheduler running the model.
     :return: Predicted class index.
     """
-    predictions = model.predict(image, verbose=0)
-    return np.argmax(predictions)  # Return the class index with highest probability
+    predictions = scheduler.predict(image)
+    return int(np.argmax(predictions))  # Return the class index with highest probability
+
+# Function to predict the class probabilities of an image
+def predict_probabilities(image, scheduler):
+    """
+    :param image: Preprocessed image (numpy array).
+    :param scheduler: Batch scheduler running the model.
+    :return: Class probabilities (numpy array).
+    """
+    return np.asarray(scheduler.predict(image), dtype=np.float32)
+
+# Function to classify a cropped frame with the active model
+def classify_image(image, loaded, timer):
+    """
+    Preprocess and classify a frame, and offer it to the shadow model if one is running.
+    :param image: Frame cropped to the ROI (numpy array).
+    :param loaded: LoadedModel held with model.use() by the caller.
+    :param timer: StageTimer of the request, records the preprocess and predict stages.
+    :return: Class probabilities (numpy array).
+    """
+    start = time.perf_counter()
+    with timer.stage("preprocess"):
+        preprocessed_image = preprocess_image(image, loaded.input_size)
+    with timer.stage("predict"):  # Includes the wait for the other requests of the batch
+        probabilities = predict_probabilities(preprocessed_image, loaded.scheduler)
+    shadow = model.shadow
+    if shadow is not None:
+        shadow.offer(image, int(np.argmax(probabilities)), time.perf_counter() - start)
+    return probabilities
+
+# Function to classify a frame received on the streaming channel
+def classify_stream_frame(session_id, frame_format, height, width, payload):
+    """
+    Decode and classify one frame of the TCP streaming channel (see stream_server.py).
+    Raw frames are expected to be already cropped to the ROI by the client.
+    Results are smoothed over the frames of the connection.
+    :return: Tuple (class index, confidence), UNKNOWN_CLASS if the frame cannot be decoded or
+             the smoothed confidence is below CONFIDENCE_THRESHOLD.
+    """
+    timer = StageTimer(metrics)
+    with timer.stage("decode"):
+        if frame_format == FORMAT_RAW:
+            if len(payload) == height * width * 3:
+                image = np.frombuffer(payload, dtype=np.uint8).reshape(height, width, 3)
+            else:
+                image = None
+        elif frame_format == FORMAT_JPEG:
+            image = decode_image(payload)
+            if image is not None:
+                image = crop_roi(image)  # JPEG frames are full camera frames
+        else:
+            image = None
+    if image is None:
+        metrics.inc("errors_total", endpoint="stream", reason="invalid_frame")
+        return UNKNOWN_CLASS, 0.0
+
+    with model.use() as loaded:
+        probabilities = classify_image(image, loaded, timer)
+    metrics.inc("requests_total", endpoint="stream", status=200)
+    predicted_class, confidence = smoothers.update(session_id, probabilities)
+    if predicted_class is None:
+        return UNKNOWN_CLASS, confidence
+    return predicted_class, confidence
+
+@app.before_request
+def start_timer():
+    """
+    Start timing the stages of the request (see metrics.py).
+    """
+    g.start = time.perf_counter()
+    g.timer = StageTimer(metrics)
+
+@app.before_request
+def require_model():
+    """
+    Answer 503 (retried by the client) until the model of this process is loaded and warmed up.
+    """
+    if request.endpoint not in ("healthz", "readyz", "get_metrics") and not model.ready.is_set():
+        return jsonify({"error": "Model is loading"}), 503
+
+@app.after_request
+def record_request(response):
+    """
+    Count the request and add the Server-Timing header, so clients can split the network
+    time from the time spent in each stage on the server.
+    """
+    endpoint = request.endpoint or "unknown"
+    if endpoint != "get_metrics":
+        metrics.inc("requests_total", endpoint=endpoint, status=response.status_code)
+        total = time.perf_counter() - g.start
+        metrics.observe("request_seconds", total, endpoint=endpoint)
+        if g.timer.stages:
+            response.headers["Server-Timing"] = f"{g.timer.server_timing()}, total;dur={total * 1000.0:.2f}"
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """
+    Endpoint exposing the counters and histograms of this process in the Prometheus text format.
+    """
+    return Response(metrics.export(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """
+    Liveness: the process answers requests.
+    """
+    return jsonify({"status": "ok"})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """
+    Readiness: the model is loaded and warmed up.
+    """
+    if not model.ready.is_set():
+        return jsonify({"status": "loading"}), 503
+    loaded = model.current
+    return jsonify({"status": "ready", "version": loaded.version, "backend": loaded.backend.name, "pid": os.getpid()})
+
+@app.route('/config', methods=['GET'])
+def get_config():
+    """
+    Endpoint describing the preprocessing expected by the model, so clients can crop and
+    downscale frames before sending them.
+    """
+    return jsonify({"input_size": list(model.current.input_size), "roi": list(ROI)})
+
+# Function to read and decode the image of an upload request
+def receive_image():
+    """
+    Read the uploaded file of the current request, archive it if enabled and decode it.
+    :return: Tuple (image cropped to the ROI, None) or (None, error response).
+    """
+    with g.timer.stage("receive"):  # Parsing the multipart body reads it from the socket
+        if 'file' not in request.files:
+            metrics.inc("errors_total", endpoint=request.endpoint, reason="no_file")
+            return None, (jsonify({"error": "No file part"}), 400)
+
+        file = request.files['file']
+        if file.filename == '':
+            metrics.inc("errors_total", endpoint=request.endpoint, reason="no_file")
+            return None, (jsonify({"error": "No selected file"}), 400)
+
+        try:
+            # Read the uploaded file into memory
+            data = file.read()
+        except Exception as e:
+            metrics.inc("errors_total", endpoint=request.endpoint, reason="read_error")
+            return None, (jsonify({"error": str(e)}), 500)
+
+    if archiver is not None:
+        with g.timer.stage("save"):
+            archiver.submit(data)  # Saved in the background, never blocks the response
+
+    # Decode the image
+    with g.timer.stage("decode"):
+        image = decode_image(data)
+        if image is not None and request.headers.get("X-ROI-Applied") != "1":
+            image = crop_roi(image)  # Full camera frame, the client did not crop it
+    if image is None:
+        metrics.inc("errors_total", endpoint=request.endpoint, reason="invalid_image")
+        return None, (jsonify({"error": "Invalid image"}), 400)
+    return image, None
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
     """
     Endpoint to receive an image from the client.
+    Answers the command of this single frame, see /predict for smoothed predictions.
     """
-    if 'file' not in request.files:
-        return jsonify({"error": "No file part"}), 400
-    
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({"error": "No selected file"}), 400
-
-    # Generate a dynamic filename to prevent overwriting
-    filename = f"{int(time.time())}.jpg"  # Use timestamp to ensure unique filenames
-    filepath = os.path.join(UPLOAD_FOLDER, filename)
-
-    try:
-        # Save the file
-        file.save(filepath)
-        print(f"File received and saved at {filepath}")
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-
-    # Load and preprocess the image
-    image = cv2.imread(filepath)
-    preprocessed_image = preprocess_image(image)  # Preprocess the image
-    predicted_class = predict_class(preprocessed_image, model)  # Predict the class
+    image, error = receive_image()
+    if error is not None:
+        return error
+    with model.use() as loaded:  # Same model for the whole request, even if another one is activated
+        predicted_class = int(np.argmax(classify_image(image, loaded, g.timer)))  # Predict the class
 
     # Map the predicted class to a command
-    commands = {0: "stop", 1: "right", 2: "left"}  # Example mapping, adjust as needed
-    response = commands.get(predicted_class, "ff")  # Default to "stop" if class is not found
+    response = loaded.commands.get(predicted_class, "ff")  # "ff" if the class has no command
+
+    logger.debug("Predicted class: %d, Command: %s", predicted_class, response)
 
-    print(f"Predicted class: {predicted_class}, Command: {response}")
-    
     # Return the response as JSON
     return jsonify(response)
 
+@app.route('/predict', methods=['POST'])
+def predict():
+    """
+    Endpoint to receive an image from the client and answer its class probabilities.
+    The command is smoothed over the previous frames of the same X-Session-Id (one id per car)
+    received less than SMOOTHING_MAX_AGE seconds apart (X-Smoothing-Max-Age overrides it, 0 for
+    no smoothing), and is "unknown" when the smoothed confidence is below CONFIDENCE_THRESHOLD.
+    """
+    image, error = receive_image()
+    if error is not None:
+        return error
+    with model.use() as loaded:  # Same model for the whole request, even if another one is activated
+        probabilities = classify_image(image, loaded, g.timer)
+    session_id = request.headers.get("X-Session-Id", request.remote_addr)
+    max_age = request.headers.get("X-Smoothing-Max-Age", type=float)  # None if missing or invalid
+    smoothed_class, confidence = smoothers.update(session_id, probabilities, max_age)
+    command = UNKNOWN if smoothed_class is None else loaded.commands.get(smoothed_class, UNKNOWN)
+
+    logger.debug("Predicted class: %d, smoothed: %s (%.2f), Command: %s",
+                 int(np.argmax(probabilities)), smoothed_class, confidence, command)
+    return jsonify({
+        "command": command,
+        "class_id": smoothed_class,
+        "confidence": confidence,
+        "probabilities": probabilities.tolist(),
+    })
+
+# Function to check the token of the admin endpoints
+def admin_denied():
+    """
+    :return: Error response if ADMIN_TOKEN is set and the request does not carry it, else None.
+    """
+    if ADMIN_TOKEN and not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN):
+        return jsonify({"error": "Invalid admin token"}), 403
+    return None
+
+@app.route('/models', methods=['GET'])
+def list_models():
+    """
+    Endpoint describing the active model, the shadow candidate and the registered versions.
+    """
+    shadow = model.shadow
+    return jsonify({
+        "active": model.current.describe(),
+        "shadow": shadow.stats() if shadow is not None else None,
+        "versions": model_registry.list_versions(),
+    })
+
+@app.route('/admin/models/<version>/activate', methods=['POST'])
+def activate_model(version):
+    """
+    Endpoint activating a registered version in active.json: every server process of the
+    registry loads and warms it up in the background, then swaps it in. Answers 202 at once,
+    poll /models to see the swap.
+    """
+    denied = admin_denied()
+    if denied is not None:
+        return denied
+    if version not in model_registry.list_versions():
+        return jsonify({"error": f"Unknown model version {version}"}), 404
+    model_registry.set_active({"version": version})
+    return jsonify({"status": "loading", "version": version}), 202
+
+@app.route('/admin/models/<version>/shadow', methods=['POST'])
+def shadow_model(version):
+    """
+    Endpoint running a registered version in shadow mode on a sample of the frames
+    (?sample=0.1 by default), on every server process like activate_model. Its agreement and
+    latency are reported by /models.
+    """
+    denied = admin_denied()
+    if denied is not None:
+        return denied
+    if version not in model_registry.list_versions():
+        return jsonify({"error": f"Unknown model version {version}"}), 404
+    sample_rate = request.args.get("sample", SHADOW_SAMPLE_RATE, type=float)
+    if not 0.0 < sample_rate <= 1.0:
+        return jsonify({"error": "sample must be in ]0, 1]"}), 400
+    model_registry.set_active({"shadow": {"version": version, "sample": sample_rate}})
+    return jsonify({"status": "loading", "version": version, "sample": sample_rate}), 202
+
+@app.route('/admin/models/shadow', methods=['DELETE'])
+def stop_shadow_model():
+    """
+    Endpoint stopping the shadow model on every server process, its final statistics are logged.
+    """
+    denied = admin_denied()
+    if denied is not None:
+        return denied
+    if not model_registry.read_active().get("shadow"):  # Also when there is no registry at all
+        return jsonify({"error": "No shadow model"}), 409
+    model_registry.set_active({"shadow": None})
+    return jsonify({"status": "stopping"}), 202
+
+def create_app(tf_threads=TF_THREADS, background=False):
+    """
+    Application factory: load the model of this process, follow active.json of the registry and
+    return the Flask app. serve.py calls it in each worker after the fork.
+    :param tf_threads: TensorFlow threads of this process (see VisionModel.load).
+    :param background: Load on a background thread and answer 503 until ready, instead of
+                       blocking until the model is warmed up.
+    """
+    if background:
+        threading.Thread(target=model.load, args=(tf_threads,), name="model-loader", daemon=True).start()
+    else:
+        model.load(tf_threads)
+    model.watch()
+    return app
+
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=9090)
+    create_app()
+    if STREAM_PORT:
+        start_stream_server('0.0.0.0', STREAM_PORT, classify_stream_frame)
+    app.run(host='0.0.0.0', port=9090, threaded=True)
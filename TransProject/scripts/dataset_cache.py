@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import cv2
+import numpy as np
+import tensorflow as tf
+
+VALID_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+CACHE_DIRNAME = '.cache'  # Sous-dossier du dataset contenant les caches prétraités
+DECODE_WORKERS = None  # Nombre de processus de décodage (None = tous les coeurs, 1 = séquentiel)
+DECODE_CHUNKSIZE = 32  # Nombre d'images envoyées à un processus à la fois
+
+
+# Lister les images sources d'un sous-ensemble avec leur indice de classe (-1 pour le test)
+def list_sources(data_dir, subset, label_names=None):
+    sources = []
+    folders = [(os.path.join(data_dir, subset, label), idx) for idx, label in enumerate(label_names)] \
+        if label_names else [(os.path.join(data_dir, subset), -1)]
+
+    for folder, label_idx in folders:
+        if not os.path.exists(folder):
+            print(f"Attention: le dossier {folder} n'existe pas.")
+            continue
+
+        for img_file in sorted(os.listdir(folder)):
+            img_path = os.path.join(folder, img_file)
+            if os.path.isdir(img_path) or img_file.startswith('.'):
+                continue
+            if not img_file.lower().endswith(VALID_EXTENSIONS):
+                print(f"Fichier ignoré (extension non valide) : {img_file}")
+                continue
+            sources.append((img_path, label_idx))
+    return sources
+
+
+# Clé d'un fichier source: change dès que l'image est remplacée ou modifiée
+def file_key(path, data_dir):
+    stat = os.stat(path)
+    return f"{os.path.relpath(path, data_dir)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+# Lire et redimensionner une image (None si elle est illisible)
+def decode_image(img_path, image_size):
+    img = cv2.imread(img_path)
+    if img is None:
+        print(f"Erreur: impossible de lire l'image {img_path}. Ignorée.")
+        return None
+    try:
+        return cv2.resize(img, (image_size[1], image_size[0]))
+    except Exception as e:
+        print(f"Erreur lors du redimensionnement de l'image {img_path}: {e}")
+        return None
+
+
+# Initialisation des processus de décodage: un seul thread OpenCV par processus
+def _init_worker():
+    cv2.setNumThreads(1)
+
+
+def decode_images(paths, image_size, workers=DECODE_WORKERS, chunksize=DECODE_CHUNKSIZE):
+    """
+    Décoder et redimensionner des images sur plusieurs coeurs.
+    L'ordre du résultat est celui de paths (None pour les images illisibles), identique au
+    décodage séquentiel.
+    """
+    workers = workers or os.cpu_count() or 1
+    decode = partial(decode_image, image_size=image_size)
+    if workers == 1 or len(paths) <= chunksize:
+        return [decode(path) for path in paths]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        return list(executor.map(decode, paths, chunksize=chunksize))
+
+
+# Afficher le débit d'une étape de l'ingestion
+def report_stage(stage, count, start):
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed > 0 else float('inf')
+    print(f"  {stage:<22} {count:>7} images en {elapsed:7.2f} s ({rate:9.1f} images/s)")
+
+
+def load_cached(data_dir, subset, image_size, label_names=None, workers=DECODE_WORKERS, chunksize=DECODE_CHUNKSIZE):
+    """
+    Charger un sous-ensemble du dataset depuis son cache uint8 mappé en mémoire.
+    Le cache est identifié par un hash des fichiers sources et de la taille d'image: s'il
+    est à jour il est ouvert directement, sinon seules les images nouvelles ou modifiées
+    sont décodées et les autres sont recopiées depuis l'ancien cache.
+    Retourne (images uint8 (N, H, W, 3) en mmap, labels int64 (N,), noms des images).
+    """
+    start = time.perf_counter()
+    sources = list_sources(data_dir, subset, label_names)
+    keys = [file_key(path, data_dir) for path, _ in sources]
+    report_stage('listage des fichiers', len(sources), start)
+    sources_hash = hashlib.sha1(json.dumps([list(image_size), keys]).encode()).hexdigest()
+
+    cache_dir = os.path.join(data_dir, CACHE_DIRNAME, f"{subset}_{image_size[0]}x{image_size[1]}")
+    images_path = os.path.join(cache_dir, 'images.npy')
+    manifest_path = os.path.join(cache_dir, 'manifest.json')
+
+    manifest = None
+    if os.path.exists(manifest_path) and os.path.exists(images_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    if manifest is None or manifest['sources_hash'] != sources_hash:
+        manifest = _rebuild(sources, keys, image_size, manifest, images_path, manifest_path, sources_hash,
+                            workers, chunksize)
+    else:
+        print(f"Cache à jour: {images_path} ({len(manifest['rows'])} images)")
+
+    if len(manifest['rows']) == 0:
+        raise ValueError(f"Aucune image valide n'a été chargée dans le dossier {subset}. Vérifiez vos données.")
+
+    images = np.load(images_path, mmap_mode='r')
+    labels = np.array([sources[i][1] for i in manifest['rows']], dtype='int64')
+    names = [os.path.basename(sources[i][0]) for i in manifest['rows']]
+    return images, labels, names
+
+
+def _rebuild(sources, keys, image_size, manifest, images_path, manifest_path, sources_hash, workers, chunksize):
+    # Lignes réutilisables de l'ancien cache, et fichiers déjà connus comme illisibles
+    previous_rows = {}
+    previous_invalid = set()
+    old_images = None
+    if manifest is not None:
+        previous_rows = {key: row for row, key in enumerate(manifest['keys'])}
+        previous_invalid = set(manifest['invalid'])
+        old_images = np.load(images_path, mmap_mode='r')
+
+    to_decode = [i for i, key in enumerate(keys) if key not in previous_rows and key not in previous_invalid]
+    print(f"Mise à jour du cache: {len(to_decode)} image(s) à décoder, {len(keys) - len(to_decode)} déjà connue(s)")
+    start = time.perf_counter()
+    decoded = dict(zip(to_decode, decode_images([sources[i][0] for i in to_decode], image_size, workers, chunksize)))
+    report_stage('décodage + resize', len(to_decode), start)
+
+    rows = [i for i, key in enumerate(keys) if key in previous_rows or decoded.get(i) is not None]
+    invalid = [key for i, key in enumerate(keys) if key in previous_invalid or (i in decoded and decoded[i] is None)]
+
+    start = time.perf_counter()
+    os.makedirs(os.path.dirname(images_path), exist_ok=True)
+    tmp_path = images_path + '.tmp.npy'
+    images = np.lib.format.open_memmap(tmp_path, mode='w+', dtype='uint8',
+                                       shape=(len(rows), image_size[0], image_size[1], 3))
+    for row, i in enumerate(rows):
+        images[row] = old_images[previous_rows[keys[i]]] if keys[i] in previous_rows else decoded[i]
+    images.flush()
+    del images, old_images
+    os.replace(tmp_path, images_path)  # Remplacement atomique: un cache interrompu n'est jamais lu
+    report_stage('écriture du cache', len(rows), start)
+
+    manifest = {'sources_hash': sources_hash, 'rows': rows, 'keys': [keys[i] for i in rows], 'invalid': invalid}
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+def make_dataset(images, labels, indices, num_classes, batch_size, shuffle=False, seed=42):
+    """
+    Pipeline tf.data lisant les lots directement dans le cache mappé en mémoire et normalisant
+    à la volée: seules les images du lot courant sont chargées en mémoire.
+    """
+    height, width = images.shape[1:3]
+
+    def read_batch(batch_indices):
+        batch_indices = np.sort(batch_indices)  # Lecture séquentielle dans le fichier
+        return images[batch_indices], labels[batch_indices]
+
+    def gather(batch_indices):
+        x, y = tf.numpy_function(read_batch, [batch_indices], [tf.uint8, tf.int64])
+        x.set_shape([None, height, width, 3])
+        y.set_shape([None])
+        return x, y
+
+    def normalize(x, y):
+        return tf.cast(x, tf.float32) / 255.0, tf.one_hot(y, num_classes)
+
+    ds = tf.data.Dataset.from_tensor_slices(np.asarray(indices, dtype='int64'))
+    if shuffle:
+        ds = ds.shuffle(len(indices), seed=seed, reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size)
+    ds = ds.map(gather, num_parallel_calls=tf.data.AUTOTUNE)
+    ds = ds.map(normalize, num_parallel_calls=tf.data.AUTOTUNE)
+    return ds
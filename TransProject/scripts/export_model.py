@@ -0,0 +1,133 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+from keras.models import load_model
+from keras.src.utils import to_categorical
+from sklearn.model_selection import train_test_split
+
+from inference_backends import KerasBackend, TFLiteBackend
+from dataset_cache import load_cached
+from train_model import data_dir, model_path, label_names
+
+CALIBRATION_SAMPLES = 200  # Nombre d'images pour calibrer la quantification int8
+LATENCY_RUNS = 200  # Nombre d'inférences pour mesurer la latence
+
+
+# Générateur d'images représentatives pour la calibration int8
+def representative_dataset(images, count=CALIBRATION_SAMPLES):
+    """
+    Fournir au convertisseur un échantillon des images d'entraînement (une image par lot).
+    """
+    rng = np.random.default_rng(42)
+    indices = rng.choice(len(images), size=min(count, len(images)), replace=False)
+
+    def generator():
+        for i in indices:
+            yield [images[i:i + 1].astype('float32')]
+
+    return generator
+
+
+# Conversion TFLite float16 (poids en float16, calculs en float32)
+def export_float16(model, path):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.target_spec.supported_types = [tf.float16]
+    with open(path, 'wb') as f:
+        f.write(converter.convert())
+
+
+# Conversion TFLite entièrement entière (poids, activations, entrée et sortie en int8)
+def export_int8(model, calibration_images, path):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset(calibration_images)
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.int8
+    converter.inference_output_type = tf.int8
+    with open(path, 'wb') as f:
+        f.write(converter.convert())
+
+
+# Précision par classe d'un backend
+def per_class_accuracy(backend, X, y, batch_size=32):
+    predictions = np.concatenate([backend.predict(X[i:i + batch_size]) for i in range(0, len(X), batch_size)])
+    predicted = np.argmax(predictions, axis=1)
+    expected = np.argmax(y, axis=1)
+    accuracies = []
+    for idx in range(len(label_names)):
+        mask = expected == idx
+        accuracies.append(float(np.mean(predicted[mask] == idx)) if mask.any() else float('nan'))
+    return np.array(accuracies), float(np.mean(predicted == expected))
+
+
+# Latence CPU médiane pour une image
+def median_latency_ms(backend, image, runs=LATENCY_RUNS):
+    backend.predict(image)  # Préchauffage
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        backend.predict(image)
+        latencies.append(time.perf_counter() - start)
+    return float(np.median(latencies) * 1000.0)
+
+
+def export_tflite_variants(model, reference_path, calibration_images, X_val, y_val, max_accuracy_drop=0.01):
+    """
+    Exporter les variantes float16 et int8 du modèle (à côté de reference_path, le .h5 float32)
+    et comparer taille, précision par classe et latence CPU avec le modèle d'origine.
+    Retourne le chemin de la variante la plus rapide dont la précision ne baisse pas de plus
+    de max_accuracy_drop (le .h5 si aucune ne convient).
+    """
+    output_dir = os.path.dirname(reference_path)
+    float16_path = os.path.join(output_dir, 'traffic_sign_model_float16.tflite')
+    int8_path = os.path.join(output_dir, 'traffic_sign_model_int8.tflite')
+
+    print("\nExport TFLite float16...")
+    export_float16(model, float16_path)
+    print("Export TFLite int8 (calibration sur les images d'entraînement)...")
+    export_int8(model, calibration_images, int8_path)
+
+    variants = [
+        ('float32 (.h5)', reference_path, KerasBackend(model)),
+        ('float16', float16_path, TFLiteBackend(float16_path, max_batch_size=32)),
+        ('int8', int8_path, TFLiteBackend(int8_path, max_batch_size=32)),
+    ]
+
+    image = X_val[:1].astype('float32')
+    reference_per_class, reference_acc = per_class_accuracy(variants[0][2], X_val, y_val)
+    best_path, best_latency = reference_path, None
+
+    print(f"\n{'Variante':<15}{'Taille (Ko)':>12}{'Précision':>11}{'Latence (ms)':>14}  Delta par classe")
+    for name, path, backend in variants:
+        size_kb = os.path.getsize(path) / 1024
+        per_class, accuracy = per_class_accuracy(backend, X_val, y_val)
+        latency = median_latency_ms(backend, image)
+        deltas = ' '.join(f"{label}:{delta * 100:+.1f}%" for label, delta in zip(label_names, per_class - reference_per_class))
+        print(f"{name:<15}{size_kb:>12.1f}{accuracy * 100:>10.2f}%{latency:>14.3f}  {deltas}")
+
+        if reference_acc - accuracy <= max_accuracy_drop and (best_latency is None or latency < best_latency):
+            best_path, best_latency = path, latency
+
+    print(f"\nModèle recommandé pour la voiture: {best_path}")
+    return best_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export TFLite float16/int8 du modèle de panneaux")
+    parser.add_argument('--model', default=model_path)
+    parser.add_argument('--max-accuracy-drop', type=float, default=0.01)
+    args = parser.parse_args()
+
+    model = load_model(args.model)
+
+    # Images à la taille d'entrée du modèle (qui dépend de la variante entraînée)
+    print("\nChargement des données d'entraînement...")
+    images, labels, _ = load_cached(data_dir, 'train', tuple(model.input_shape[1:3]), label_names)
+    X = np.array(images, dtype='float32') / 255.0
+    y = to_categorical(labels, num_classes=len(label_names))
+    X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, random_state=42)  # Même découpage que train_model.py
+    export_tflite_variants(model, args.model, X_train, X_val, y_val, args.max_accuracy_drop)
@@ -0,0 +1,215 @@
+"""
+Inference backends for the traffic sign model.
+Every backend exposes predict(batch) -> probabilities and input_shape (H, W, C).
+Run this file directly to check each backend against the Keras outputs:
+    python inference_backends.py [--model ../models/traffic_sign_model.h5] [--images DIR]
+The same check runs on a tiny model in tests/test_inference_backends.py (python -m pytest tests).
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import tensorflow as tf
+from keras.models import load_model
+
+BACKENDS = ("keras", "tf_function", "tflite")
+
+
+class KerasBackend:
+    """
+    Direct eager call of the Keras model (no model.predict data adapter or callbacks).
+    """
+    name = "keras"
+
+    def __init__(self, model):
+        self.model = model
+        self.input_shape = tuple(model.input_shape[1:])
+
+    def predict(self, batch):
+        return self.model(batch, training=False).numpy()
+
+
+class TFFunctionBackend:
+    """
+    Keras model compiled into a tf.function with a fixed input signature, traced once at startup.
+    """
+    name = "tf_function"
+
+    def __init__(self, model):
+        self.model = model
+        self.input_shape = tuple(model.input_shape[1:])
+        spec = tf.TensorSpec(shape=(None,) + self.input_shape, dtype=tf.float32)
+        self._call = tf.function(lambda x: model(x, training=False), input_signature=[spec])
+        self._call.get_concrete_function()  # Trace now rather than on the first request
+
+    def predict(self, batch):
+        return self._call(tf.convert_to_tensor(batch, dtype=tf.float32)).numpy()
+
+
+class TFLiteBackend:
+    """
+    TFLite interpreter. Float, float16 and full-integer (int8) models are supported,
+    the input is quantized and the output dequantized when needed.
+    Resizing and reallocating the tensors on every batch size change is slow, so a batch is
+    padded to the next power-of-two size up to max_batch_size, each size having its own
+    interpreter, created and allocated on the first batch of that size (the warm-up runs sizes
+    1 and max_batch_size). Sizes never used cost no memory.
+    The interpreters are not thread-safe: predict() must be called from a single thread
+    (the batch scheduler does this).
+    """
+    name = "tflite"
+
+    def __init__(self, tflite_path, num_threads=None, max_batch_size=1):
+        """
+        :param tflite_path: Path of the .tflite model.
+        :param num_threads: Number of CPU threads of each interpreter.
+        :param max_batch_size: Largest batch of the scheduler, larger batches are split.
+        """
+        self.tflite_path = tflite_path
+        self.num_threads = num_threads
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.sizes = sorted({min(2 ** i, self.max_batch_size) for i in range(self.max_batch_size.bit_length() + 1)})
+        self.interpreters = {}  # Batch size -> (interpreter, input details, output details, input buffer)
+        self.input_shape = tuple(int(dim) for dim in self._interpreter(1)[1]["shape"][1:])
+
+    def _interpreter(self, size):
+        """
+        :return: Interpreter of a batch size with its details and input buffer, created on first use.
+        """
+        entry = self.interpreters.get(size)
+        if entry is None:
+            interpreter = load_interpreter(self.tflite_path, self.num_threads)
+            details = interpreter.get_input_details()[0]
+            if details["shape"][0] != size:  # The converted model has a batch size of 1
+                interpreter.resize_tensor_input(details["index"], (size,) + tuple(details["shape"][1:]))
+            interpreter.allocate_tensors()
+            input_details = interpreter.get_input_details()[0]
+            buffer = np.zeros(tuple(input_details["shape"]), dtype=input_details["dtype"])
+            entry = self.interpreters[size] = (interpreter, input_details, interpreter.get_output_details()[0], buffer)
+        return entry
+
+    def predict(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        if len(batch) > self.max_batch_size:
+            return np.concatenate([self.predict(batch[i:i + self.max_batch_size])
+                                   for i in range(0, len(batch), self.max_batch_size)])
+
+        count = len(batch)
+        size = next(size for size in self.sizes if size >= count)
+        interpreter, input_details, output_details, buffer = self._interpreter(size)
+        if input_details["dtype"] != np.float32:
+            scale, zero_point = input_details["quantization"]
+            limits = np.iinfo(input_details["dtype"])
+            batch = np.clip(np.round(batch / scale + zero_point), limits.min, limits.max)
+        buffer[:count] = batch  # Rows after count are padding, their outputs are dropped
+
+        interpreter.set_tensor(input_details["index"], buffer)
+        interpreter.invoke()
+        outputs = interpreter.get_tensor(output_details["index"])[:count]
+
+        if output_details["dtype"] != np.float32:
+            scale, zero_point = output_details["quantization"]
+            outputs = (outputs.astype(np.float32) - zero_point) * scale
+        return np.array(outputs)  # Copy, the interpreter reuses its output buffer
+
+
+def load_interpreter(tflite_path, num_threads=None):
+    """
+    Create a TFLite interpreter, using the lightweight tflite_runtime package when installed.
+    :param tflite_path: Path of the .tflite model.
+    :param num_threads: Number of CPU threads used by the interpreter (None lets TFLite decide).
+    :return: TFLite interpreter (tensors not allocated yet).
+    """
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        Interpreter = tf.lite.Interpreter
+    return Interpreter(model_path=tflite_path, num_threads=num_threads)
+
+
+def convert_to_tflite(model, tflite_path):
+    """
+    Convert a Keras model to a float32 TFLite model.
+    :param model: Loaded Keras model.
+    :param tflite_path: Destination of the .tflite file.
+    """
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    with open(tflite_path, "wb") as f:
+        f.write(converter.convert())
+    print(f"TFLite model written to {tflite_path}")
+
+
+def create_backend(name, model_path, tflite_path=None, num_threads=None, max_batch_size=1):
+    """
+    Create the inference backend selected in the server configuration.
+    :param name: One of BACKENDS.
+    :param model_path: Path of the Keras .h5 model.
+    :param tflite_path: Path of the .tflite model (next to the .h5 by default). It is converted
+                        from the .h5 model when missing or older than it.
+    :param num_threads: Number of CPU threads of the TFLite interpreter.
+    :param max_batch_size: Largest batch given to predict(), the TFLite tensors are allocated for it.
+    :return: Backend instance.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{name}', expected one of {BACKENDS}")
+
+    if name == "tflite":
+        tflite_path = tflite_path or os.path.splitext(model_path)[0] + ".tflite"
+        if not os.path.exists(tflite_path) or os.path.getmtime(tflite_path) < os.path.getmtime(model_path):
+            convert_to_tflite(load_model(model_path), tflite_path)
+        return TFLiteBackend(tflite_path, num_threads, max_batch_size)
+
+    model = load_model(model_path)
+    if name == "tf_function":
+        return TFFunctionBackend(model)
+    return KerasBackend(model)
+
+
+def check_parity(backend, model, images, atol):
+    """
+    Compare the outputs of a backend with model.predict.
+    :param backend: Backend to check.
+    :param model: Reference Keras model.
+    :param images: Preprocessed images (N, H, W, C).
+    :param atol: Maximum absolute difference allowed between probabilities.
+    :return: Tuple (passed, max absolute difference, fraction of identical predicted classes).
+    """
+    expected = model.predict(images, verbose=0)
+    outputs = np.concatenate([backend.predict(images[i:i + 1]) for i in range(len(images))])
+    max_diff = float(np.max(np.abs(outputs - expected)))
+    agreement = float(np.mean(np.argmax(outputs, axis=1) == np.argmax(expected, axis=1)))
+    return max_diff <= atol and agreement == 1.0, max_diff, agreement
+
+
+def load_images(model, images_dir, count):
+    h, w = model.input_shape[1:3]
+    if images_dir is None:
+        rng = np.random.default_rng(42)
+        return rng.random((count, h, w, 3), dtype=np.float32)
+
+    import cv2
+    images = []
+    for img_file in sorted(os.listdir(images_dir))[:count]:
+        img = cv2.imread(os.path.join(images_dir, img_file))
+        if img is not None:
+            images.append(cv2.resize(img, (w, h)))
+    return np.array(images, dtype="float32") / 255.0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="../models/traffic_sign_model.h5")
+    parser.add_argument("--images", help="Directory of images to compare on (random images by default)")
+    parser.add_argument("--count", type=int, default=32)
+    parser.add_argument("--atol", type=float, default=1e-4)
+    args = parser.parse_args()
+
+    model = load_model(args.model)
+    images = load_images(model, args.images, args.count)
+    failed = False
+    for name in BACKENDS:
+        passed, max_diff, agreement = check_parity(create_backend(name, args.model), model, images, args.atol)
+        failed = failed or not passed
+        print(f"{name:<12} {'OK' if passed else 'FAIL':<5} max diff={max_diff:.2e}  same class={agreement * 100:.1f}%")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,165 @@
+"""
+Versioned model artefacts for the inference server.
+Each version is a folder of REGISTRY_DIR (v0001, v0002, ...) holding the Keras model and
+metadata.json: version, creation time, input size, class map, accuracy and any extra fields
+(e.g. "commands", the class -> command mapping used by the server instead of its default).
+Versions are written to a temporary folder and renamed, so a reader never sees half a version.
+active.json names the version served and the shadow candidate. Every server process sharing the
+registry polls it (car_control.py), so an activation reaches all the workers.
+Usage:
+    python model_registry.py list
+    python model_registry.py register ../models/traffic_sign_model.h5 --accuracy 0.97
+    python model_registry.py activate v0002
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+REGISTRY_DIR = os.environ.get("MODEL_REGISTRY", "../models/registry")
+MODEL_FILENAME = "model.h5"
+METADATA_FILENAME = "metadata.json"
+ACTIVE_FILENAME = "active.json"
+
+
+def list_versions(registry_dir=REGISTRY_DIR):
+    """
+    :return: Names of the registered versions, oldest first.
+    """
+    if not os.path.isdir(registry_dir):
+        return []
+    return sorted(name for name in os.listdir(registry_dir)
+                  if name.startswith("v") and os.path.isfile(os.path.join(registry_dir, name, METADATA_FILENAME)))
+
+
+def load_metadata(version, registry_dir=REGISTRY_DIR):
+    with open(os.path.join(registry_dir, version, METADATA_FILENAME)) as f:
+        return json.load(f)
+
+
+def resolve(version=None, registry_dir=REGISTRY_DIR):
+    """
+    :param version: Version name, the latest when None.
+    :return: Tuple (model path, metadata), or None if the registry is empty.
+    """
+    versions = list_versions(registry_dir)
+    if version is None:
+        if not versions:
+            return None
+        version = versions[-1]
+    elif version not in versions:
+        raise ValueError(f"Unknown model version '{version}', registered: {versions}")
+    return os.path.join(registry_dir, version, MODEL_FILENAME), load_metadata(version, registry_dir)
+
+
+def read_active(registry_dir=REGISTRY_DIR):
+    """
+    :return: Dict with the active "version" and the "shadow" candidate ({"version", "sample"} or
+             None), empty when nothing was activated.
+    """
+    try:
+        with open(os.path.join(registry_dir, ACTIVE_FILENAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def active_stamp(registry_dir=REGISTRY_DIR):
+    """
+    :return: Value changing at every write of active.json, None when there is none. Cheaper to
+             poll than the file itself.
+    """
+    try:
+        stat = os.stat(os.path.join(registry_dir, ACTIVE_FILENAME))
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def set_active(changes, registry_dir=REGISTRY_DIR):
+    """
+    Update active.json, written to a temporary file and renamed like the versions.
+    :param changes: Dict of the fields to change, e.g. {"version": "v0002"} or {"shadow": None}.
+    :return: The new content.
+    """
+    state = dict(read_active(registry_dir), **changes)
+    fd, staging = tempfile.mkstemp(prefix=".active-", dir=registry_dir)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(staging, os.path.join(registry_dir, ACTIVE_FILENAME))
+    except BaseException:
+        os.remove(staging)
+        raise
+    return state
+
+
+def register_model(model_path, metadata, registry_dir=REGISTRY_DIR):
+    """
+    Copy a trained model into a new version of the registry.
+    :param model_path: Keras .h5 model.
+    :param metadata: Dict stored with the model (input_size, class_map, accuracy, ...).
+    :return: Name of the new version.
+    """
+    os.makedirs(registry_dir, exist_ok=True)
+    versions = list_versions(registry_dir)
+    number = int(versions[-1][1:]) + 1 if versions else 1
+    version = f"v{number:04d}"
+    staging = tempfile.mkdtemp(prefix=f".{version}-", dir=registry_dir)
+    try:
+        shutil.copy2(model_path, os.path.join(staging, MODEL_FILENAME))
+        metadata = dict(metadata, version=version, created=time.strftime("%Y-%m-%dT%H:%M:%S"),
+                        source=os.path.abspath(model_path))
+        with open(os.path.join(staging, METADATA_FILENAME), "w") as f:
+            json.dump(metadata, f, indent=2)
+        os.rename(staging, os.path.join(registry_dir, version))  # Fails if another writer took the name
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    print(f"Registered {model_path} as {version}")
+    return version
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--registry", default=REGISTRY_DIR)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list", help="registered versions and their metadata")
+    register = subparsers.add_parser("register", help="add a trained .h5 model as a new version")
+    register.add_argument("model")
+    register.add_argument("--accuracy", type=float, help="Validation accuracy")
+    register.add_argument("--class-map", help="Comma-separated class names, in class index order")
+    register.add_argument("--commands", help="Comma-separated commands, in class index order (e.g. stop,right,left)")
+    activate = subparsers.add_parser("activate", help="serve a version on every server process of the registry")
+    activate.add_argument("version")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        active = read_active(args.registry).get("version")
+        for version in list_versions(args.registry):
+            metadata = load_metadata(version, args.registry)
+            print(f"{version}  created {metadata.get('created')}  input {metadata.get('input_size')}  "
+                  f"accuracy {metadata.get('accuracy')}" + ("  (active)" if version == active else ""))
+        return
+    if args.command == "activate":
+        if args.version not in list_versions(args.registry):
+            sys.exit(f"Unknown model version '{args.version}'")
+        set_active({"version": args.version}, args.registry)
+        print(f"{args.version} activated, the servers swap it in within a few seconds")
+        return
+
+    from keras.models import load_model
+    model = load_model(args.model)
+    metadata = {"input_size": [model.input_shape[2], model.input_shape[1]], "accuracy": args.accuracy}
+    if args.class_map:
+        metadata["class_map"] = dict(enumerate(args.class_map.split(",")))
+    if args.commands:
+        metadata["commands"] = dict(enumerate(args.commands.split(",")))
+    register_model(args.model, metadata, args.registry)
+
+
+if __name__ == "__main__":
+    main()
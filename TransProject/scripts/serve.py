@@ -0,0 +1,69 @@
+"""
+Production server for car_control.py: gunicorn pre-forks several worker processes, each loading
+and warming up its own copy of the model after the fork (car_control.create_app).
+Needs gunicorn (pip install gunicorn).
+Usage: python serve.py [--workers N] [--threads T] [--port 9090]
+The TCP streaming channel (STREAM_PORT) is only started by python car_control.py.
+"""
+import argparse
+import os
+import sys
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    sys.exit("serve.py needs gunicorn: pip install gunicorn (or run python car_control.py)")
+
+DEFAULT_WORKERS = 2
+REQUEST_THREADS = 8  # Request threads per worker, their frames are batched together
+
+
+class VisionServer(BaseApplication):
+    """
+    Gunicorn application running car_control in pre-forked gthread workers.
+    """
+    def __init__(self, options, tf_threads):
+        """
+        :param options: Gunicorn settings (bind, workers, threads, ...).
+        :param tf_threads: TensorFlow threads of each worker.
+        """
+        self.options = options
+        self.tf_threads = tf_threads
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        # Called in each worker after the fork: TensorFlow is never initialised in the master.
+        # The model loads in the background, /readyz answers 503 until it is warmed up.
+        import car_control
+        return car_control.create_app(tf_threads=self.tf_threads, background=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WORKERS", DEFAULT_WORKERS)))
+    parser.add_argument("--threads", type=int, default=REQUEST_THREADS, help="Request threads per worker")
+    parser.add_argument("--tf-threads", type=int,
+                        help="TensorFlow threads per worker (CPU count / workers by default)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=9090)
+    args = parser.parse_args()
+
+    tf_threads = args.tf_threads or max(1, (os.cpu_count() or 1) // args.workers)
+    print(f"Starting {args.workers} workers with {tf_threads} TensorFlow threads each")
+    options = {
+        "bind": f"{args.host}:{args.port}",
+        "workers": args.workers,
+        "worker_class": "gthread",
+        "threads": args.threads,
+        "preload_app": False,  # Each worker imports TensorFlow and loads the model itself
+        "timeout": 60,
+    }
+    VisionServer(options, tf_threads).run()
+
+
+if __name__ == "__main__":
+    main()
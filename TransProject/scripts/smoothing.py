@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+UNKNOWN = "unknown"
+MAX_AGE = 1.0  # Seconds without frames after which the smoothing of a session starts over
+
+
+class EMASmoother:
+    """
+    Exponential moving average of the class probabilities of successive frames.
+    """
+    def __init__(self, alpha=0.5):
+        """
+        :param alpha: Weight of the newest frame (1 disables smoothing).
+        """
+        self.alpha = alpha
+        self.average = None
+
+    def update(self, probabilities):
+        """
+        :param probabilities: Class probabilities of the new frame.
+        :return: Tuple (class index, confidence, smoothed probabilities).
+        """
+        probabilities = np.asarray(probabilities, dtype=np.float32)
+        if self.average is None:
+            self.average = probabilities
+        else:
+            self.average = self.alpha * probabilities + (1.0 - self.alpha) * self.average
+        predicted_class = int(np.argmax(self.average))
+        return predicted_class, float(self.average[predicted_class]), self.average
+
+
+class VoteSmoother:
+    """
+    k-of-n vote: a class is reported once it wins at least k of the last n frames.
+    """
+    def __init__(self, k=3, n=5):
+        self.k = k
+        self.votes = deque(maxlen=n)
+
+    def update(self, probabilities):
+        """
+        :param probabilities: Class probabilities of the new frame.
+        :return: Tuple (class index or None without a k-vote majority, share of the votes, probabilities).
+        """
+        probabilities = np.asarray(probabilities, dtype=np.float32)
+        self.votes.append(int(np.argmax(probabilities)))
+        counts = np.bincount(np.array(self.votes), minlength=len(probabilities))
+        predicted_class = int(np.argmax(counts))
+        confidence = counts[predicted_class] / self.votes.maxlen
+        if counts[predicted_class] < self.k:
+            return None, float(confidence), probabilities
+        return predicted_class, float(confidence), probabilities
+
+
+class SessionSmoothers:
+    """
+    One smoother per client session (car), dropped after session_ttl seconds without frames.
+    Only frames of the same burst are smoothed together: a frame arriving more than max_age
+    seconds after the previous one of its session starts a new smoother, so the sign of the
+    previous obstacle (one photo per obstacle, often tens of seconds apart) never blends into
+    the next decision.
+    """
+    def __init__(self, factory, confidence_threshold=0.6, session_ttl=60.0, max_age=MAX_AGE):
+        """
+        :param factory: Function creating a new smoother (EMASmoother, VoteSmoother, ...).
+        :param confidence_threshold: Smoothed confidence below which the result is UNKNOWN.
+        :param session_ttl: Seconds of inactivity after which a session is forgotten.
+        :param max_age: Seconds between two frames after which the smoothing starts over.
+        """
+        self.factory = factory
+        self.confidence_threshold = confidence_threshold
+        self.session_ttl = session_ttl
+        self.max_age = max_age
+        self.sessions = {}  # session id -> (last update time, smoother)
+        self.lock = threading.Lock()
+
+    def update(self, session_id, probabilities, max_age=None):
+        """
+        Add the probabilities of a new frame of a session.
+        :param max_age: Gap after which the smoothing starts over for this frame, self.max_age when
+                        None. 0 judges the frame on its own (e.g. one photo per obstacle).
+        :return: Tuple (class index or None for UNKNOWN, confidence).
+        """
+        if max_age is None:
+            max_age = self.max_age
+        now = time.monotonic()
+        with self.lock:
+            last, smoother = self.sessions.get(session_id, (now, None))
+            if smoother is None:
+                self._expire(now)
+            if smoother is None or now - last > max_age:
+                smoother = self.factory()  # New session, or first frame of a new burst
+            self.sessions[session_id] = (now, smoother)
+            predicted_class, confidence, _ = smoother.update(probabilities)
+        if predicted_class is None or confidence < self.confidence_threshold:
+            return None, confidence
+        return predicted_class, confidence
+
+    def _expire(self, now):
+        expired = [sid for sid, (last, _) in self.sessions.items() if now - last > self.session_ttl]
+        for sid in expired:
+            del self.sessions[sid]
+
+
+def create_smoothers(method, confidence_threshold, ema_alpha=0.5, vote_k=3, vote_n=5, max_age=MAX_AGE):
+    """
+    :param method: "ema", "vote" or "none" (each frame on its own, only the threshold applies).
+    """
+    if method == "ema":
+        factory = lambda: EMASmoother(ema_alpha)
+    elif method == "vote":
+        factory = lambda: VoteSmoother(vote_k, vote_n)
+    elif method == "none":
+        factory = lambda: EMASmoother(1.0)
+    else:
+        raise ValueError(f"Unknown smoothing method '{method}', expected ema, vote or none")
+    return SessionSmoothers(factory, confidence_threshold, max_age=max_age)
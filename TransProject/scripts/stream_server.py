@@ -0,0 +1,97 @@
+"""
+Persistent TCP channel for a continuous camera feed, next to the HTTP /upload endpoint.
+
+Client -> server, for every frame:
+    header FRAME_HEADER (network byte order):
+        seq      uint32  frame sequence number, echoed back in the result
+        format   uint8   FORMAT_JPEG or FORMAT_RAW (BGR uint8 pixels, height x width x 3)
+        height   uint16  frame height (raw frames only, 0 for JPEG)
+        width    uint16  frame width (raw frames only, 0 for JPEG)
+        length   uint32  payload size in bytes
+    followed by the payload.
+Server -> client, for every frame: RESULT (seq uint32, class id uint8, confidence float32).
+The class id is UNKNOWN_CLASS for undecodable frames and, depending on the classify function,
+for frames whose (smoothed) confidence is too low.
+Frames are answered in the order they were received, so a client can keep several in flight.
+Client/stream_client.py implements the other end and must use the same formats.
+"""
+import socket
+import socketserver
+import struct
+import threading
+
+FRAME_HEADER = struct.Struct("!IBHHI")
+RESULT = struct.Struct("!IBf")
+FORMAT_JPEG = 0
+FORMAT_RAW = 1
+UNKNOWN_CLASS = 255  # Class id answered for frames that cannot be decoded or classified
+MAX_FRAME_BYTES = 8 * 1024 * 1024  # Larger frames close the connection
+
+
+def recv_exact(sock, size):
+    """
+    Read exactly size bytes from a socket.
+    :return: The bytes read, or None if the peer closed the connection.
+    """
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:], size - received)
+        if count == 0:
+            return None
+        received += count
+    return buffer
+
+
+class FrameStreamHandler(socketserver.BaseRequestHandler):
+    """
+    Serves one client connection until it is closed.
+    """
+    def handle(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        print(f"Stream client connected: {self.client_address}")
+        while True:
+            header = recv_exact(self.request, FRAME_HEADER.size)
+            if header is None:
+                break
+            seq, frame_format, height, width, length = FRAME_HEADER.unpack(header)
+            if length > MAX_FRAME_BYTES:
+                print(f"Frame of {length} bytes from {self.client_address} is too large, closing")
+                break
+            payload = recv_exact(self.request, length)
+            if payload is None:
+                break
+
+            try:
+                class_id, confidence = self.server.classify(self.client_address, frame_format, height, width, payload)
+            except Exception as e:
+                print(f"Error classifying stream frame {seq}: {e}")
+                class_id, confidence = UNKNOWN_CLASS, 0.0
+            self.request.sendall(RESULT.pack(seq, class_id, confidence))
+        print(f"Stream client disconnected: {self.client_address}")
+
+
+class FrameStreamServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, classify):
+        """
+        :param address: (host, port) to listen on.
+        :param classify: Function (session, format, height, width, payload) -> (class id, confidence).
+                         The session is the client address, one per connection.
+        """
+        super().__init__(address, FrameStreamHandler)
+        self.classify = classify
+
+
+def start_stream_server(host, port, classify):
+    """
+    Start the streaming server on a background thread.
+    :return: The running server (call shutdown() to stop it).
+    """
+    server = FrameStreamServer((host, port), classify)
+    threading.Thread(target=server.serve_forever, name="frame-stream-server", daemon=True).start()
+    print(f"Frame stream server listening on {host}:{server.server_address[1]}")
+    return server
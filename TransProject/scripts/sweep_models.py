@@ -0,0 +1,107 @@
+"""
+Entraîner chaque variante de MODEL_VARIANTS et comparer précision, nombre de paramètres,
+FLOPs et latence d'inférence TFLite mesurée. Le tableau est enregistré en CSV, les variantes
+du front de Pareto (précision / latence) sont marquées d'un *.
+Usage: python sweep_models.py [--variants baseline tiny] [--epochs 60] [--target-accuracy 0.95]
+"""
+import argparse
+import csv
+import os
+
+import numpy as np
+import tensorflow as tf
+from sklearn.model_selection import train_test_split
+
+from augmentation import augment_batch
+from dataset_cache import load_cached, make_dataset
+from export_model import median_latency_ms
+from inference_backends import TFLiteBackend, convert_to_tflite
+from train_model import (BATCH_SIZE, DECODE_WORKERS, HORIZONTAL_FLIP, MODEL_VARIANTS, NO_FLIP_CLASSES,
+                         configure_runtime, count_flops, create_model, data_dir, label_names)
+
+SWEEP_DIR = '../models/sweep'  # Modèles et résultats du balayage
+SWEEP_EPOCHS = 60  # Époques maximales par variante
+SWEEP_PATIENCE = 10  # Arrêt anticipé sur val_loss
+
+
+def train_variant(variant, epochs, tflite_threads):
+    input_size = MODEL_VARIANTS[variant]['input_size']
+    images, labels, _ = load_cached(data_dir, 'train', (input_size, input_size), label_names, DECODE_WORKERS)
+    train_idx, val_idx = train_test_split(np.arange(len(images)), test_size=0.2, random_state=42)
+
+    num_classes = len(label_names)
+    train_ds = make_dataset(images, labels, train_idx, num_classes, BATCH_SIZE, shuffle=True)
+    train_ds = train_ds.map(lambda x, y: augment_batch(x, y, HORIZONTAL_FLIP, NO_FLIP_CLASSES),
+                            num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+    val_ds = make_dataset(images, labels, val_idx, num_classes, BATCH_SIZE).prefetch(tf.data.AUTOTUNE)
+
+    tf.keras.utils.set_random_seed(42)
+    model = create_model(variant)
+    model.fit(train_ds, validation_data=val_ds, epochs=epochs, verbose=2, callbacks=[
+        tf.keras.callbacks.EarlyStopping(monitor='val_loss', patience=SWEEP_PATIENCE, restore_best_weights=True)])
+    _, val_acc = model.evaluate(val_ds, verbose=0)
+
+    # Latence mesurée sur le modèle TFLite, celui qui tourne sur la voiture
+    h5_path = os.path.join(SWEEP_DIR, f"{variant}.h5")
+    tflite_path = os.path.join(SWEEP_DIR, f"{variant}.tflite")
+    model.save(h5_path)
+    convert_to_tflite(model, tflite_path)
+    image = images[val_idx[:1]].astype('float32') / 255.0
+    latency = median_latency_ms(TFLiteBackend(tflite_path, tflite_threads), image)
+
+    return {
+        'variant': variant,
+        'input_size': input_size,
+        'accuracy': float(val_acc),
+        'params': model.count_params(),
+        'mflops': count_flops(model) / 1e6,
+        'latency_ms': latency,
+        'tflite_kb': os.path.getsize(tflite_path) / 1024,
+    }
+
+
+# Une variante est sur le front de Pareto si aucune autre n'est à la fois plus précise et plus rapide
+def mark_pareto(results):
+    for r in results:
+        r['pareto'] = not any(
+            o['accuracy'] >= r['accuracy'] and o['latency_ms'] <= r['latency_ms']
+            and (o['accuracy'] > r['accuracy'] or o['latency_ms'] < r['latency_ms'])
+            for o in results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--variants', nargs='+', default=list(MODEL_VARIANTS), choices=list(MODEL_VARIANTS))
+    parser.add_argument('--epochs', type=int, default=SWEEP_EPOCHS)
+    parser.add_argument('--target-accuracy', type=float, default=0.95)
+    parser.add_argument('--tflite-threads', type=int, default=1, help="Threads TFLite (1 pour simuler le Pi)")
+    args = parser.parse_args()
+
+    configure_runtime()
+    os.makedirs(SWEEP_DIR, exist_ok=True)
+    results = []
+    for variant in args.variants:
+        print(f"\n=== Variante {variant} ===")
+        results.append(train_variant(variant, args.epochs, args.tflite_threads))
+    mark_pareto(results)
+
+    results.sort(key=lambda r: r['latency_ms'])
+    print(f"\n  {'Variante':<18}{'Entrée':>7}{'Précision':>11}{'Paramètres':>12}{'MFLOPs':>9}{'Latence (ms)':>14}{'TFLite (Ko)':>13}")
+    for r in results:
+        print(f"{'*' if r['pareto'] else ' '} {r['variant']:<18}{r['input_size']:>7}{r['accuracy'] * 100:>10.2f}%"
+              f"{r['params']:>12}{r['mflops']:>9.2f}{r['latency_ms']:>14.3f}{r['tflite_kb']:>13.1f}")
+
+    csv_path = os.path.join(SWEEP_DIR, 'sweep_results.csv')
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(results[0]))
+        writer.writeheader()
+        writer.writerows(results)
+    print(f"\nRésultats enregistrés dans {csv_path}")
+
+    candidates = [r for r in results if r['accuracy'] >= args.target_accuracy]
+    if candidates:
+        best = min(candidates, key=lambda r: (r['latency_ms'], r['params']))
+        print(f"Variante la plus légère atteignant {args.target_accuracy * 100:.0f}%: {best['variant']} "
+              f"(MODEL_VARIANT={best['variant']} python train_model.py)")
+    else:
+        print(f"Aucune variante n'atteint {args.target_accuracy * 100:.0f}% de précision.")
@@ -1,210 +1,313 @@
 import os
+import shutil
+import time
 import numpy as np
 import tensorflow as tf
 from keras.src.models import Sequential
-from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense, Dropout, BatchNormalization
+from tensorflow.keras.layers import Conv2D, SeparableConv2D, MaxPooling2D, Flatten, Dense, Dropout, BatchNormalization
 from keras.src.utils import to_categorical
 from tensorflow.keras import regularizers
-import cv2
 from sklearn.model_selection import train_test_split
-from keras._tf_keras.keras.preprocessing.image import ImageDataGenerator
+from augmentation import augment_batch, measure_throughput
+from dataset_cache import load_cached, make_dataset
 
 # Paths
 data_dir = '../dataset'  # Chemin vers les données
 model_path = '../models/traffic_sign_model.h5'  # Chemin pour sauvegarder le modèle
+best_model_path = '../models/traffic_sign_model_best.h5'  # Meilleur modèle (val_loss) pendant l'entraînement
+checkpoint_dir = '../models/checkpoints'  # Points de reprise (poids, optimiseur, époque)
 
 # Hyperparamètres
 IMG_HEIGHT, IMG_WIDTH = 64, 64  # Taille des images
 BATCH_SIZE = 32
-EPOCHS = 400
+EPOCHS = 400  # Nombre maximal d'époques (l'arrêt anticipé intervient généralement avant)
+EARLY_STOPPING_PATIENCE = 30  # Époques sans amélioration de val_loss avant l'arrêt
+LR_PATIENCE = 10  # Époques sans amélioration avant de diviser le taux d'apprentissage
+LR_FACTOR = 0.5
+MIN_LR = 1e-6
+CHECKPOINT_EVERY = 5  # Fréquence des points de reprise (en époques)
+RESUME_TRAINING = True  # Reprendre depuis le dernier point de reprise s'il existe
+# Réglages d'exécution (modifiables par variables d'environnement, voir benchmark_training.py)
+INTRA_OP_THREADS = int(os.environ.get('INTRA_OP_THREADS', 0))  # Threads par opération (0 = choix de TensorFlow)
+INTER_OP_THREADS = int(os.environ.get('INTER_OP_THREADS', 0))  # Opérations exécutées en parallèle (0 = choix de TensorFlow)
+JIT_COMPILE = os.environ.get('JIT_COMPILE', '0') == '1'  # Compilation XLA du pas d'entraînement
+MIXED_PRECISION = os.environ.get('MIXED_PRECISION', '0') == '1'  # Précision mixte bfloat16 (CPU AVX512-BF16/AMX)
+HORIZONTAL_FLIP = False  # Flip horizontal aléatoire (jamais pour gauche/droite)
+DECODE_WORKERS = None  # Processus de décodage des images (None = tous les coeurs, 1 = séquentiel)
 
 # Définir les classes et leurs indices
 label_names = ['class_0', 'class_1', 'class_2', 'class_3']  # Remplir avec vos classes
 label_to_index = {label: idx for idx, label in enumerate(label_names)}
 index_to_label = {idx: label for label, idx in label_to_index.items()}  # Pour convertir l'indice en nom de classe
+NO_FLIP_CLASSES = (label_to_index['class_1'], label_to_index['class_2'])  # Pas de flip horizontal pour 'right' et 'left'
 
 # Fonction pour charger les données (train/validation)
 def load_data(data_dir, subset):
-    images, labels, image_names = [], [], []
-
-    valid_extensions = ('.jpg', '.jpeg', '.png')
-
-    for label in label_names:
-        label_folder = os.path.join(data_dir, subset, label)
-
-        if not os.path.exists(label_folder):
-            print(f"Attention: le dossier {label_folder} n'existe pas.")
-            continue
-
-        for img_file in os.listdir(label_folder):
-            if not img_file.lower().endswith(valid_extensions):
-                print(f"Fichier ignoré (extension non valide) : {img_file}")
-                continue
-
-            img_path = os.path.join(label_folder, img_file)
-            img = cv2.imread(img_path)
-            if img is None:
-                print(f"Erreur: impossible de lire l'image {img_path}. Ignorée.")
-                continue
-
-            try:
-                img = cv2.resize(img, (IMG_HEIGHT, IMG_WIDTH))
-            except Exception as e:
-                print(f"Erreur lors du redimensionnement de l'image {img_path}: {e}")
-                continue
-
-            images.append(img)
-            labels.append(label_to_index[label])  # Index de la classe
-            image_names.append(img_file)  # Nom de l'image
-
-    if len(images) == 0:
-        raise ValueError(f"Aucune image valide n'a été chargée dans le dossier {subset}. Vérifiez vos données.")
-
+    # Lecture depuis le cache uint8 (seules les nouvelles images sont décodées)
+    images, labels, image_names = load_cached(data_dir, subset, (IMG_HEIGHT, IMG_WIDTH), label_names, DECODE_WORKERS)
     images = np.array(images, dtype='float32') / 255.0  # Normaliser
     labels = to_categorical(labels, num_classes=len(label_names))  # Encodage des étiquettes
     return images, labels, image_names
 
 # Fonction pour charger les données de test
 def load_test_data(test_dir):
-    images, image_names = [], []
-
-    valid_extensions = ('.jpg', '.jpeg', '.png')
-
-    for img_file in os.listdir(test_dir):
-        if not img_file.lower().endswith(valid_extensions):
-            print(f"Fichier ignoré (extension non valide) : {img_file}")
-            continue
-
-        img_path = os.path.join(test_dir, img_file)
-        img = cv2.imread(img_path)
-        if img is None:
-            print(f"Erreur: impossible de lire l'image {img_path}. Ignorée.")
-            continue
-
-        try:
-            img = cv2.resize(img, (IMG_HEIGHT, IMG_WIDTH))
-        except Exception as e:
-            print(f"Erreur lors du redimensionnement de l'image {img_path}: {e}")
-            continue
-
-        images.append(img)
-        image_names.append(img_file)  # Nom de l'image
-
-    if len(images) == 0:
-        raise ValueError("Aucune image valide n'a été chargée dans le dossier de test. Vérifiez vos données.")
-
+    data_dir, subset = os.path.split(os.path.normpath(test_dir))
+    images, _, image_names = load_cached(data_dir, subset, (IMG_HEIGHT, IMG_WIDTH), workers=DECODE_WORKERS)
     images = np.array(images, dtype='float32') / 255.0  # Normaliser
     return images, image_names
 
-# Créer un modèle CNN pour la classification des panneaux
-def create_model():
-    model = Sequential([
-        Conv2D(32, (3, 3), activation='relu', input_shape=(IMG_HEIGHT, IMG_WIDTH, 3),
-               kernel_regularizer=regularizers.l2(0.01)),
-        MaxPooling2D(pool_size=(2, 2)),
-        BatchNormalization(),
-
-        Conv2D(64, (3, 3), activation='relu', kernel_regularizer=regularizers.l2(0.01)),
-        MaxPooling2D(pool_size=(2, 2)),
-        BatchNormalization(),
-
-        Conv2D(128, (3, 3), activation='relu', kernel_regularizer=regularizers.l2(0.01)),
-        MaxPooling2D(pool_size=(2, 2)),
-        BatchNormalization(),
-
-        Conv2D(256, (3, 3), activation='relu', kernel_regularizer=regularizers.l2(0.01)),
-        MaxPooling2D(pool_size=(2, 2)),
-        BatchNormalization(),
+# Appliquer les réglages d'exécution (à appeler avant toute opération TensorFlow)
+def configure_runtime(intra_op_threads=INTRA_OP_THREADS, inter_op_threads=INTER_OP_THREADS,
+                      mixed_precision=MIXED_PRECISION):
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+    if mixed_precision:
+        if not cpu_supports_bfloat16():
+            print("Attention: ce CPU n'a pas d'instructions bfloat16, la précision mixte sera probablement plus lente.")
+        tf.keras.mixed_precision.set_global_policy('mixed_bfloat16')
+
+# Détecter les instructions bfloat16 du CPU (Linux uniquement)
+def cpu_supports_bfloat16():
+    try:
+        with open('/proc/cpuinfo') as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return 'avx512_bf16' in flags or 'amx_bf16' in flags
+
+# Variantes d'architecture: filtres par bloc Conv2D, convolutions séparables, taille d'entrée
+MODEL_VARIANTS = {
+    'baseline': dict(filters=(32, 64, 128, 256), separable=False, input_size=IMG_HEIGHT, dense_units=128),
+    'narrow': dict(filters=(16, 32, 64, 128), separable=False, input_size=IMG_HEIGHT, dense_units=64),
+    'separable': dict(filters=(32, 64, 128, 256), separable=True, input_size=IMG_HEIGHT, dense_units=128),
+    'separable_narrow': dict(filters=(16, 32, 64, 128), separable=True, input_size=IMG_HEIGHT, dense_units=64),
+    'small_input': dict(filters=(16, 32, 64), separable=True, input_size=48, dense_units=64),
+    'tiny': dict(filters=(16, 32, 64), separable=True, input_size=32, dense_units=32),
+}
+MODEL_VARIANT = os.environ.get('MODEL_VARIANT', 'baseline')  # Variante entraînée par ce script
 
+# Créer un modèle CNN pour la classification des panneaux
+def create_model(variant=MODEL_VARIANT, jit_compile=JIT_COMPILE, **overrides):
+    """
+    Construire une variante de MODEL_VARIANTS (les paramètres peuvent être surchargés).
+    Le premier bloc est toujours une Conv2D classique: une convolution séparable n'apporte
+    rien sur 3 canaux d'entrée.
+    """
+    params = dict(MODEL_VARIANTS[variant], **overrides)
+    input_size = params['input_size']
+
+    layers = []
+    for i, filters in enumerate(params['filters']):
+        if params['separable'] and i > 0:
+            conv = SeparableConv2D(filters, (3, 3), activation='relu',
+                                   depthwise_regularizer=regularizers.l2(0.01),
+                                   pointwise_regularizer=regularizers.l2(0.01))
+        elif i == 0:
+            conv = Conv2D(filters, (3, 3), activation='relu', input_shape=(input_size, input_size, 3),
+                          kernel_regularizer=regularizers.l2(0.01))
+        else:
+            conv = Conv2D(filters, (3, 3), activation='relu', kernel_regularizer=regularizers.l2(0.01))
+        layers += [conv, MaxPooling2D(pool_size=(2, 2)), BatchNormalization()]
+
+    model = Sequential(layers + [
         Flatten(),
-        Dense(128, activation='relu'),
+        Dense(params['dense_units'], activation='relu'),
         Dropout(0.5),
-        Dense(len(label_names), activation='softmax')
+        Dense(len(label_names), activation='softmax', dtype='float32')  # Sortie en float32 même en précision mixte
     ])
 
-    model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
+    model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'], jit_compile=jit_compile)
     return model
 
+# Nombre d'opérations flottantes d'une inférence (une multiplication-addition = 2 FLOPs)
+def count_flops(model):
+    flops = 0
+    for layer in model.layers:
+        if isinstance(layer, (Conv2D, SeparableConv2D)):
+            # layer.input/output plutôt que input_shape/output_shape, absents des couches Keras 3
+            _, out_h, out_w, out_c = layer.output.shape
+            in_c = layer.input.shape[-1]
+            kernel = layer.kernel_size[0] * layer.kernel_size[1]
+            if isinstance(layer, SeparableConv2D):
+                flops += 2 * out_h * out_w * (kernel * in_c + in_c * out_c)
+            else:
+                flops += 2 * out_h * out_w * kernel * in_c * out_c
+        elif isinstance(layer, Dense):
+            flops += 2 * layer.input.shape[-1] * layer.units
+    return flops
+
+# Mesurer le temps moyen d'un pas d'entraînement à chaque époque
+class StepTimeCallback(tf.keras.callbacks.Callback):
+    def on_epoch_begin(self, epoch, logs=None):
+        self.step_times = []
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self.step_start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.step_times.append(time.perf_counter() - self.step_start)
+
+    def on_epoch_end(self, epoch, logs=None):
+        step_ms = np.mean(self.step_times) * 1000.0
+        print(f" - pas d'entraînement: {step_ms:.1f} ms ({BATCH_SIZE / step_ms * 1000.0:.0f} images/s)")
+
+# Sauvegarder régulièrement poids, état de l'optimiseur et compteur d'époques
+class ResumableCheckpoint(tf.keras.callbacks.Callback):
+    def __init__(self, checkpoint, manager, every=CHECKPOINT_EVERY):
+        super().__init__()
+        self.checkpoint = checkpoint
+        self.manager = manager
+        self.every = every
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.checkpoint.epoch.assign(epoch + 1)
+        if (epoch + 1) % self.every == 0:
+            self.manager.save(checkpoint_number=epoch + 1)
+
+    def on_train_end(self, logs=None):
+        self.manager.save(checkpoint_number=int(self.checkpoint.epoch))
+
+# Meilleur val_loss et compteurs de patience conservés dans le point de reprise, pour qu'une
+# reprise n'écrase pas le meilleur modèle avec une époque moins bonne ni ne remette la patience à zéro
+class TrainingState(tf.keras.callbacks.Callback):
+    def __init__(self, checkpoint, early_stopping, reduce_lr, resumed):
+        super().__init__()
+        self.checkpoint = checkpoint
+        self.early_stopping = early_stopping
+        self.reduce_lr = reduce_lr
+        self.resumed = resumed
+
+    def on_train_begin(self, logs=None):
+        # Appelé après le on_train_begin des callbacks Keras, qui remettent leur état à zéro
+        if self.resumed:
+            best = float(self.checkpoint.best_val_loss)
+            self.early_stopping.best = best
+            self.early_stopping.wait = int(self.checkpoint.early_stopping_wait)
+            self.reduce_lr.best = best
+            self.reduce_lr.wait = int(self.checkpoint.reduce_lr_wait)
+            print(f"Meilleur val_loss restauré: {best:.4f}")
+
+    def on_epoch_end(self, epoch, logs=None):
+        val_loss = (logs or {}).get('val_loss')
+        if val_loss is not None and val_loss < float(self.checkpoint.best_val_loss):
+            self.checkpoint.best_val_loss.assign(val_loss)
+            # model.save plutôt que ModelCheckpoint, qui refuse les chemins .h5 avant Keras 3.8
+            self.model.save(best_model_path)
+            print(f"\nval_loss amélioré à {val_loss:.4f}, modèle sauvegardé sous {best_model_path}")
+        self.checkpoint.early_stopping_wait.assign(self.early_stopping.wait)
+        self.checkpoint.reduce_lr_wait.assign(self.reduce_lr.wait)
+
+    def on_train_end(self, logs=None):
+        # Meilleure époque antérieure à la reprise: EarlyStopping n'a pas ses poids en mémoire
+        if self.early_stopping.stopped_epoch and self.early_stopping.best_weights is None \
+                and os.path.exists(best_model_path):
+            self.model.load_weights(best_model_path)
+            print(f"Poids du meilleur modèle restaurés depuis {best_model_path}")
+
+def train(model, train_ds, val_ds, resume=RESUME_TRAINING):
+    """
+    Entraîner avec arrêt anticipé sur val_loss, réduction du taux d'apprentissage sur plateau,
+    sauvegarde du meilleur modèle et reprise depuis le dernier point de reprise.
+    """
+    checkpoint = tf.train.Checkpoint(model=model, optimizer=model.optimizer, epoch=tf.Variable(0, dtype=tf.int64),
+                                     best_val_loss=tf.Variable(np.inf, dtype=tf.float64),
+                                     early_stopping_wait=tf.Variable(0, dtype=tf.int64),
+                                     reduce_lr_wait=tf.Variable(0, dtype=tf.int64))
+    manager = tf.train.CheckpointManager(checkpoint, checkpoint_dir, max_to_keep=2)
+
+    initial_epoch = 0
+    if resume and manager.latest_checkpoint:
+        checkpoint.restore(manager.latest_checkpoint)
+        initial_epoch = int(checkpoint.epoch)
+        print(f"Reprise de l'entraînement depuis {manager.latest_checkpoint} (époque {initial_epoch})")
+
+    os.makedirs(os.path.dirname(best_model_path), exist_ok=True)
+    early_stopping = tf.keras.callbacks.EarlyStopping(monitor='val_loss', patience=EARLY_STOPPING_PATIENCE,
+                                                      restore_best_weights=True, verbose=1)
+    reduce_lr = tf.keras.callbacks.ReduceLROnPlateau(monitor='val_loss', factor=LR_FACTOR, patience=LR_PATIENCE,
+                                                     min_lr=MIN_LR, verbose=1)
+    callbacks = [
+        early_stopping,
+        reduce_lr,
+        TrainingState(checkpoint, early_stopping, reduce_lr, resumed=initial_epoch > 0),  # Après les deux précédents
+        ResumableCheckpoint(checkpoint, manager),  # Après TrainingState, qui met à jour l'état sauvegardé
+        StepTimeCallback(),
+    ]
+    return model.fit(
+        train_ds,
+        validation_data=val_ds,
+        epochs=EPOCHS,
+        initial_epoch=initial_epoch,
+        callbacks=callbacks,
+        verbose=1
+    )
+
 if __name__ == "__main__":
-    # Charger les données d'entraînement
+    configure_runtime()
+    input_size = MODEL_VARIANTS[MODEL_VARIANT]['input_size']
+    print(f"Variante du modèle: {MODEL_VARIANT} (entrée {input_size}x{input_size})")
+
+    # Charger les données d'entraînement (cache uint8 mappé en mémoire)
     print("\nChargement des données d'entraînement...")
-    X, y, image_names = load_data(data_dir, 'train')
-    X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, random_state=42)
-    print(f"Données chargées: {X_train.shape[0]} train, {X_val.shape[0]} validation")
+    images, labels, image_names = load_cached(data_dir, 'train', (input_size, input_size), label_names, DECODE_WORKERS)
+    train_idx, val_idx = train_test_split(np.arange(len(images)), test_size=0.2, random_state=42)
+    print(f"Données chargées: {len(train_idx)} train, {len(val_idx)} validation")
 
     # Charger les données de test
     print("\nChargement des données de test...")
-    test_dir = os.path.join(data_dir, 'test')
-    X_test, test_image_names = load_test_data(test_dir)
-    print(f"Données de test chargées: {X_test.shape[0]} images")
-
-    # Créer l'augmentation de données avec des transformations conditionnelles
-    def conditional_augmentation(X, y):
-        """
-        Appliquer les transformations d'augmentation en fonction de la classe (sans flip horizontal pour certaines classes).
-        """
-        datagen = ImageDataGenerator(
-            rotation_range=10,  # Rotation aléatoire de -10° à 10°
-            width_shift_range=0.1,  # Décalage horizontal
-            height_shift_range=0.1,  # Décalage vertical
-            zoom_range=0.1,  # Zoom aléatoire
-            shear_range=0.2,  # Cisaillement aléatoire
-        )
-
-        augmented_images = []
-        augmented_labels = []
-
-        for i in range(len(X)):
-            img = X[i]
-            label = y[i]
-            if label_to_index['class_1'] in label or label_to_index['class_2'] in label:
-                # Pas de flip horizontal pour 'right' et 'left'
-                datagen_no_flip = ImageDataGenerator(
-                    rotation_range=10,
-                    width_shift_range=0.1,
-                    height_shift_range=0.1,
-                    zoom_range=0.1,
-                    shear_range=0.2
-                )
-                img = datagen_no_flip.random_transform(img)
-            else:
-                img = datagen.random_transform(img)
-
-            augmented_images.append(img)
-            augmented_labels.append(label)
-
-        return np.array(augmented_images), np.array(augmented_labels)
-
-    X_train, y_train = conditional_augmentation(X_train, y_train)
+    test_images, _, test_image_names = load_cached(data_dir, 'test', (input_size, input_size), workers=DECODE_WORKERS)
+    print(f"Données de test chargées: {len(test_images)} images")
+
+    # Pipelines tf.data: lecture par lots dans le cache, normalisation et augmentation à la volée
+    num_classes = len(label_names)
+    train_ds = make_dataset(images, labels, train_idx, num_classes, BATCH_SIZE, shuffle=True)
+    train_ds = train_ds.map(lambda x, y: augment_batch(x, y, HORIZONTAL_FLIP, NO_FLIP_CLASSES),
+                            num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+    val_ds = make_dataset(images, labels, val_idx, num_classes, BATCH_SIZE).prefetch(tf.data.AUTOTUNE)
+    test_ds = make_dataset(test_images, np.zeros(len(test_images), dtype='int64'), np.arange(len(test_images)),
+                           num_classes, BATCH_SIZE).map(lambda x, y: x)
 
     # Entraînement du modèle
     tf.keras.utils.set_random_seed(42)
     model = create_model()
     print(model.summary())
 
+    print(f"\nDébit du pipeline avec augmentation: {measure_throughput(train_ds):.0f} images/s")
     print("\nEntraînement du modèle avec augmentation des données...")
-    history = model.fit(
-        X_train, y_train,
-        validation_data=(X_val, y_val),
-        epochs=EPOCHS,
-        batch_size=BATCH_SIZE,
-        verbose=1
-    )
+    history = train(model, train_ds, val_ds)
 
     # Sauvegarder le modèle
     print("\nSauvegarde du modèle...")
     os.makedirs(os.path.dirname(model_path), exist_ok=True)
     model.save(model_path)
     print(f"Modèle sauvegardé sous {model_path}")
+    shutil.rmtree(checkpoint_dir, ignore_errors=True)  # Entraînement terminé: le prochain repart de zéro
+
+    # Export des variantes TFLite float16 et int8 pour la voiture
+    from export_model import CALIBRATION_SAMPLES, export_tflite_variants
+    X_calibration = images[np.sort(train_idx[:CALIBRATION_SAMPLES])].astype('float32') / 255.0  # Images non augmentées
+    X_val = images[np.sort(val_idx)].astype('float32') / 255.0
+    y_val = to_categorical(labels[np.sort(val_idx)], num_classes=num_classes)
+    export_tflite_variants(model, model_path, X_calibration, X_val, y_val)
 
     # Évaluation sur l'ensemble de validation
     print("\nÉvaluation sur l'ensemble de validation...")
-    val_loss, val_acc = model.evaluate(X_val, y_val, verbose=1)
+    val_loss, val_acc = model.evaluate(val_ds, verbose=1)
     print(f"Précision de validation: {val_acc * 100:.2f}%")
 
+    # Enregistrement d'une nouvelle version dans le registre des modèles (activée sur le serveur
+    # par POST /admin/models/<version>/activate, voir model_registry.py)
+    from model_registry import register_model
+    register_model(model_path, {
+        'input_size': [input_size, input_size],
+        'class_map': index_to_label,
+        'accuracy': float(val_acc),
+        'model_variant': MODEL_VARIANT,
+    })
+
     # Prédictions sur l'ensemble de test
     print("\nPrédictions sur l'ensemble de test...")
-    test_predictions = model.predict(X_test)
+    test_predictions = model.predict(test_ds)
     test_predicted_classes = np.argmax(test_predictions, axis=1)
 
     # Afficher les prédictions sur les images de test
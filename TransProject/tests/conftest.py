@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The scripts use flat imports (python car_control.py from scripts/, python Clinet.py from Client/)
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scripts")
+for path in (SCRIPTS_DIR, os.path.join(SCRIPTS_DIR, "Client")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,40 @@
+import threading
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from batching import BatchScheduler  # noqa: E402
+
+
+def test_single_request_is_served():
+    scheduler = BatchScheduler(lambda batch: batch.sum(axis=(1, 2)), max_batch_size=4, max_wait_ms=1000.0)
+    try:
+        assert scheduler.predict(np.ones((1, 2, 2)), timeout=0.5) == pytest.approx(4.0)
+    finally:
+        scheduler.stop()
+
+
+def test_submit_after_stop_raises():
+    release = threading.Event()
+    scheduler = BatchScheduler(lambda batch: (release.wait(1.0), batch[:, 0, 0])[1], max_batch_size=4)
+    queued = scheduler.submit(np.full((1, 1, 1), 3.0))
+    stopper = threading.Thread(target=scheduler.stop)
+    stopper.start()
+    release.set()
+    stopper.join(2.0)
+    assert not stopper.is_alive()
+    assert queued.result(timeout=0) == pytest.approx(3.0)  # Queued before the stop: still served
+    with pytest.raises(RuntimeError):
+        scheduler.submit(np.zeros((1, 1, 1)))
+    scheduler.stop()  # Stopping twice is harmless
+
+
+def test_wrong_row_count_fails_every_request():
+    scheduler = BatchScheduler(lambda batch: batch[0], max_batch_size=4)  # Drops the batch dimension
+    try:
+        future = scheduler.submit(np.zeros((1, 3)))
+        with pytest.raises(ValueError):
+            future.result(timeout=1.0)
+    finally:
+        scheduler.stop()
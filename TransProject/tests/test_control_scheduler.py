@@ -0,0 +1,63 @@
+import threading
+import time
+
+from control_scheduler import Manoeuvre, Step
+
+
+def run_until_done(manoeuvre, timeout=2.0):
+    """
+    Update the manoeuvre like the control loop, recording the longest update.
+    :return: Longest update in seconds.
+    """
+    longest = 0.0
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        start = time.monotonic()
+        running = manoeuvre.update(start)
+        longest = max(longest, time.monotonic() - start)
+        if not running:
+            break
+        time.sleep(0.005)
+    return longest
+
+
+def test_background_step_does_not_block_the_loop():
+    release = threading.Event()
+
+    def slow_photo():
+        release.wait(1.0)
+        return "left"
+
+    manoeuvre = Manoeuvre("obstacle", [Step("photo", 1.0, slow_photo, background=True)])
+    start = time.monotonic()
+    manoeuvre.start(start)
+    assert time.monotonic() - start < 0.05
+    assert manoeuvre.update(time.monotonic())
+    threading.Timer(0.1, release.set).start()
+    assert run_until_done(manoeuvre) < 0.05
+    assert manoeuvre.results["photo"] == "left"
+
+
+def test_background_step_ends_when_its_action_returns():
+    manoeuvre = Manoeuvre("obstacle", [Step("photo", 5.0, lambda: "stop", background=True)])
+    start = time.monotonic()
+    manoeuvre.start(start)
+    run_until_done(manoeuvre)
+    assert manoeuvre.done
+    assert time.monotonic() - start < 1.0
+    assert manoeuvre.results["photo"] == "stop"
+
+
+def test_background_step_times_out_or_fails_with_none():
+    never = threading.Event()
+    manoeuvre = Manoeuvre("obstacle", [Step("photo", 0.1, lambda: never.wait(5.0), background=True)])
+    manoeuvre.start(time.monotonic())
+    run_until_done(manoeuvre)
+    assert manoeuvre.done and manoeuvre.results["photo"] is None
+
+    def fail():
+        raise ConnectionError("server down")
+    manoeuvre = Manoeuvre("obstacle", [Step("photo", 1.0, fail, background=True)])
+    manoeuvre.start(time.monotonic())
+    run_until_done(manoeuvre)
+    assert manoeuvre.done and manoeuvre.results["photo"] is None
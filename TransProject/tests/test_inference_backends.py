@@ -0,0 +1,59 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+tf = pytest.importorskip("tensorflow")
+
+from inference_backends import BACKENDS, create_backend  # noqa: E402
+
+ATOL = 1e-4
+
+
+@pytest.fixture(scope="module")
+def tiny_model(tmp_path_factory):
+    """
+    Small convolutional classifier saved as .h5, with the same input layout as the traffic sign model.
+    """
+    tf.keras.utils.set_random_seed(0)
+    model = tf.keras.Sequential([
+        tf.keras.layers.Input(shape=(16, 16, 3)),
+        tf.keras.layers.Conv2D(4, 3, activation="relu"),
+        tf.keras.layers.MaxPooling2D(),
+        tf.keras.layers.Flatten(),
+        tf.keras.layers.Dense(3, activation="softmax"),
+    ])
+    path = str(tmp_path_factory.mktemp("model") / "tiny.h5")
+    model.save(path)
+    return model, path
+
+
+@pytest.fixture
+def images():
+    return np.random.default_rng(42).random((5, 16, 16, 3), dtype=np.float32)
+
+
+@pytest.mark.parametrize("name", BACKENDS)
+def test_backend_matches_keras(tiny_model, images, name):
+    model, path = tiny_model
+    backend = create_backend(name, path, max_batch_size=4)
+    expected = model.predict(images, verbose=0)
+    assert backend.input_shape == (16, 16, 3)
+    # One batch larger than max_batch_size, then single images
+    np.testing.assert_allclose(backend.predict(images), expected, atol=ATOL)
+    for i in range(len(images)):
+        np.testing.assert_allclose(backend.predict(images[i:i + 1]), expected[i:i + 1], atol=ATOL)
+
+
+def test_tflite_allocates_once_per_batch_size(tiny_model, images, monkeypatch):
+    model, path = tiny_model
+    backend = create_backend("tflite", path, max_batch_size=16)
+    assert sorted(backend.interpreters) == [1]
+    expected = model.predict(images, verbose=0)
+    for count in (1, 3, 5, 2):
+        np.testing.assert_allclose(backend.predict(images[:count]), expected[:count], atol=ATOL)
+    assert sorted(backend.interpreters) == [1, 2, 4, 8]  # Only the sizes used, not 16
+    resized = []
+    for interpreter, *_ in backend.interpreters.values():
+        monkeypatch.setattr(interpreter, "allocate_tensors", lambda: resized.append(1))
+    for count in (5, 1, 3, 2):
+        np.testing.assert_allclose(backend.predict(images[:count]), expected[:count], atol=ATOL)
+    assert not resized  # No reallocation once a size was used
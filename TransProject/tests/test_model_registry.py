@@ -0,0 +1,32 @@
+import json
+
+import model_registry
+
+
+def register(tmp_path, count=2):
+    for _ in range(count):
+        model = tmp_path / "model.h5"
+        model.write_bytes(b"weights")
+        model_registry.register_model(str(model), {"input_size": [64, 64]}, str(tmp_path / "registry"))
+    return str(tmp_path / "registry")
+
+
+def test_active_pointer_is_empty_until_set(tmp_path):
+    registry = register(tmp_path)
+    assert model_registry.read_active(registry) == {}
+    assert model_registry.active_stamp(registry) is None
+
+
+def test_set_active_merges_and_changes_the_stamp(tmp_path):
+    registry = register(tmp_path)
+    model_registry.set_active({"version": "v0002"}, registry)
+    stamp = model_registry.active_stamp(registry)
+    model_registry.set_active({"shadow": {"version": "v0001", "sample": 0.1}}, registry)
+    assert model_registry.read_active(registry) == {"version": "v0002", "shadow": {"version": "v0001", "sample": 0.1}}
+    assert model_registry.active_stamp(registry) != stamp
+    model_registry.set_active({"shadow": None}, registry)
+    with open(f"{registry}/{model_registry.ACTIVE_FILENAME}") as f:
+        assert json.load(f) == {"version": "v0002", "shadow": None}
+    # The pointer is not a version and leaves no temporary file behind
+    assert model_registry.list_versions(registry) == ["v0001", "v0002"]
+    assert sorted(p.name for p in (tmp_path / "registry").iterdir()) == ["active.json", "v0001", "v0002"]
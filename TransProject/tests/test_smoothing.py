@@ -0,0 +1,53 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+import smoothing  # noqa: E402
+from smoothing import create_smoothers  # noqa: E402
+
+STOP = [0.9, 0.05, 0.05]
+RIGHT = [0.05, 0.9, 0.05]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(smoothing.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.mark.parametrize("method", ["ema", "vote"])
+def test_burst_is_smoothed(clock, method):
+    smoothers = create_smoothers(method, 0.6)
+    for _ in range(3):
+        predicted_class, _ = smoothers.update("car", STOP)
+        clock[0] += 0.1
+    assert predicted_class == 0
+    # A single disagreeing frame of the same burst does not flip the answer
+    assert smoothers.update("car", RIGHT)[0] in (0, None)
+
+
+@pytest.mark.parametrize("method", ["ema", "vote"])
+def test_gap_restarts_smoothing(clock, method):
+    smoothers = create_smoothers(method, 0.0, vote_k=1)  # The first frame alone decides
+    for _ in range(5):
+        smoothers.update("car", STOP)
+    clock[0] += 20.0  # Next obstacle, one photo
+    assert smoothers.update("car", RIGHT)[0] == 1
+
+
+def test_sessions_are_independent(clock):
+    smoothers = create_smoothers("ema", 0.6)
+    smoothers.update("car-1", STOP)
+    assert smoothers.update("car-2", RIGHT)[0] == 1
+
+
+def test_max_age_per_frame(clock):
+    smoothers = create_smoothers("ema", 0.0, max_age=5.0)
+    smoothers.update("car", STOP)
+    clock[0] += 0.1
+    assert smoothers.update("car", RIGHT, max_age=0.0)[0] == 1  # Judged on its own
+    clock[0] += 2.0
+    smoothers.update("car", STOP)
+    clock[0] += 2.0
+    assert smoothers.update("car", RIGHT)[0] == 0  # Within the session default, still smoothed
@@ -0,0 +1,106 @@
+import time
+
+import pytest
+
+from mDev import mDEV
+from mock_bus import FLAKY_PATTERNS, MockSMBus
+from sonar import FAST_PATH_FAILURES, FAST_PATH_PROBE, SonarReader, echo_to_distance
+
+DISTANCE_CM = 50.0
+ECHO = int(DISTANCE_CM * 1000.0 / 17.0)
+TOLERANCE_CM = 2.0
+READS = 200
+
+
+class TimedBus(MockSMBus):
+    """
+    Mock bus recording its slowest transaction, so the time budget checks allow for the sleeps
+    the machine running the tests overshoots.
+    """
+    slowest = 0.0
+
+    def _transaction(self):
+        start = time.monotonic()
+        try:
+            super()._transaction()
+        finally:
+            self.slowest = max(self.slowest, time.monotonic() - start)
+
+
+def make_reader(transaction_time=0.0, bus_class=MockSMBus, **faults):
+    bus = bus_class(transaction_time, seed=0, **faults)
+    bus.sonic_echo = ECHO
+    return SonarReader(mDEV(bus=bus)), bus
+
+
+class BlockGarbageBus(MockSMBus):
+    """
+    Firmware answering garbage to 2-byte block reads while single-byte reads are right.
+    """
+    def read_i2c_block_data(self, address, register, length):
+        data = super().read_i2c_block_data(address, register, length)
+        return [0xff] * length if length == 2 else data
+
+
+def test_healthy_reads_use_the_fast_path():
+    reader, bus = make_reader()
+    for _ in range(READS):
+        assert reader.read() == pytest.approx(DISTANCE_CM, abs=0.1)
+    assert reader.checked_reads == 0
+    assert bus.transactions == READS * reader.samples  # One block read per sample
+
+
+@pytest.mark.parametrize("pattern", ["dead", "nack", "mixed"])
+def test_reads_stay_within_budget(pattern):
+    reader, bus = make_reader(0.0002, TimedBus, **FLAKY_PATTERNS[pattern])
+    slowest = 0.0
+    for _ in range(50):
+        start = time.monotonic()
+        reader.read()
+        slowest = max(slowest, time.monotonic() - start)
+    # A sample may start just before the deadline: one checked sample (8 transactions) plus
+    # scheduling overhead on top of the budget
+    assert slowest <= reader.budget + 9 * bus.slowest + 0.01
+
+
+def test_dead_sensor_returns_none():
+    reader, _ = make_reader(**FLAKY_PATTERNS["dead"])
+    assert all(reader.read() is None for _ in range(20))
+    assert reader.stats()["failure_rate"] == 1.0
+
+
+def read_original(mdev):
+    try:
+        return echo_to_distance(mdev.readReg(mdev.CMD_SONIC)) or None  # 0 means failure
+    except OSError:
+        return None
+
+
+def count_wrong(distances):
+    return sum(distance is not None and abs(distance - DISTANCE_CM) > TOLERANCE_CM for distance in distances)
+
+
+@pytest.mark.parametrize("pattern", ["garbage", "spikes", "nack", "mixed"])
+def test_outliers_are_rejected(pattern):
+    reader, _ = make_reader(**FLAKY_PATTERNS[pattern])
+    distances = [reader.read() for _ in range(READS)]
+    original, _ = make_reader(**FLAKY_PATTERNS[pattern])
+    original_distances = [read_original(original.mdev) for _ in range(READS)]
+    assert sum(distance is None for distance in distances) <= READS * 0.1
+    # Two random spikes may agree by chance: rare, and never more often than the original read
+    assert count_wrong(distances) <= min(READS * 0.01, count_wrong(original_distances))
+
+
+def test_fast_path_falls_back_to_checked_reads():
+    reader, _ = make_reader(bus_class=BlockGarbageBus)
+    for _ in range(10):
+        assert reader.read() == pytest.approx(DISTANCE_CM, abs=0.1)
+    assert reader.fast_reads == FAST_PATH_FAILURES  # Given up after FAST_PATH_FAILURES invalid reads
+    assert reader.checked_reads == 10 * reader.samples
+
+
+def test_fast_path_is_probed_again():
+    reader, _ = make_reader(bus_class=BlockGarbageBus)
+    while reader.checked_reads < FAST_PATH_FAILURES + FAST_PATH_PROBE + reader.samples:  # One per sample
+        reader.read()
+    assert reader.fast_reads == FAST_PATH_FAILURES + 1  # One probe after FAST_PATH_PROBE checked samples
@@ -0,0 +1,46 @@
+import telemetry
+from telemetry import TelemetryRecorder, read_records
+
+
+def write(path, distances, capacity=8):
+    recorder = TelemetryRecorder(str(path), capacity)
+    for distance in distances:
+        recorder.record(distance)
+    recorder.close()
+
+
+def test_restart_appends_to_the_previous_records(tmp_path):
+    path = tmp_path / "telemetry.bin"
+    write(path, [10.0, 11.0])
+    write(path, [12.0])
+    _, records = read_records(str(path))
+    assert [r[1] for r in records] == [10.0, 11.0, 12.0]
+
+
+def test_restart_keeps_wrapping_the_ring(tmp_path):
+    path = tmp_path / "telemetry.bin"
+    write(path, [float(d) for d in range(6)], capacity=4)
+    write(path, [6.0, 7.0], capacity=4)
+    _, records = read_records(str(path))
+    assert [r[1] for r in records] == [4.0, 5.0, 6.0, 7.0]
+
+
+def test_incompatible_file_is_rotated_not_truncated(tmp_path):
+    path = tmp_path / "telemetry.bin"
+    write(path, [10.0, 11.0])
+    write(path, [12.0], capacity=16)  # Other capacity: cannot be continued
+    rotated = [p for p in tmp_path.iterdir() if p.name != "telemetry.bin"]
+    assert len(rotated) == 1
+    assert [r[1] for r in read_records(str(rotated[0]))[1]] == [10.0, 11.0]
+    assert [r[1] for r in read_records(str(path))[1]] == [12.0]
+
+    # Another boot: the monotonic timestamps of the file no longer match the wall clock
+    assert telemetry.resumable_count(str(path), 16, 1e9) is None
+
+
+def test_rotation_never_replaces_a_rotated_file(tmp_path):
+    path = tmp_path / "telemetry.bin"
+    for capacity in (4, 8, 16):  # Each restart cannot continue the previous file
+        write(path, [float(capacity)], capacity=capacity)
+    kept = sorted(read_records(str(p))[1][0][1] for p in tmp_path.iterdir() if p.name != "telemetry.bin")
+    assert kept == [4.0, 8.0]
@@ -0,0 +1,26 @@
+import pytest
+
+pytest.importorskip("tensorflow")
+pytest.importorskip("sklearn")
+
+from train_model import count_flops, create_model  # noqa: E402
+
+
+def test_count_flops_conv_and_dense():
+    model = create_model('baseline', jit_compile=False, filters=(4,), dense_units=8, input_size=16)
+    conv = 2 * 14 * 14 * (3 * 3) * 3 * 4  # 16x16x3 -> 14x14x4
+    dense = 2 * (7 * 7 * 4) * 8 + 2 * 8 * 4  # Flatten after pooling, then 4 classes
+    assert count_flops(model) == conv + dense
+
+
+def test_count_flops_separable():
+    model = create_model('separable', jit_compile=False, filters=(4, 8), dense_units=8, input_size=16)
+    conv = 2 * 14 * 14 * (3 * 3) * 3 * 4
+    separable = 2 * 5 * 5 * ((3 * 3) * 4 + 4 * 8)  # 7x7x4 -> 5x5x8, depthwise then pointwise
+    dense = 2 * (2 * 2 * 8) * 8 + 2 * 8 * 4
+    assert count_flops(model) == conv + separable + dense
+
+
+@pytest.mark.parametrize("variant", ['baseline', 'narrow', 'separable'])
+def test_count_flops_variants(variant):
+    assert count_flops(create_model(variant, jit_compile=False)) > 0